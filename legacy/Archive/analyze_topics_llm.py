@@ -6,22 +6,25 @@ using Google's Gemini AI model for accurate topic classification.
 """
 
 import os
+import sys
 import json
 import pandas as pd
+from pathlib import Path
 from datetime import datetime, timedelta
 from dotenv import load_dotenv
-import google.generativeai as genai
 
 # Load environment variables
 load_dotenv()
 
-# Configure Gemini
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "api"))
+from gemini_client import get_registry
+
+# Configure Gemini once; LLM_BACKEND=mock runs without a key
 GEMINI_API_KEY = os.getenv('GEMINI_API_KEY')
-if not GEMINI_API_KEY:
+gemini = get_registry(GEMINI_API_KEY)
+if not gemini.is_configured():
     raise ValueError("GEMINI_API_KEY not found in .env file. Please add it.")
 
-genai.configure(api_key=GEMINI_API_KEY)
-
 def parse_date(date_str):
     """Parse various date formats from CSV."""
     if not date_str or pd.isna(date_str):
@@ -129,8 +132,7 @@ Focus on accuracy. A post about "hiring engineers" should be tagged as both "hir
     print("🤖 Sending posts to Gemini for analysis...")
     
     try:
-        model = genai.GenerativeModel('gemini-2.5-flash-lite')
-        response = model.generate_content(prompt)
+        response = gemini.generate(prompt, 'topics')
         
         # Extract JSON from response
         response_text = response.text.strip()
@@ -3,13 +3,17 @@
 Fast batch startup extractor with timeout and skip logic for problematic PDFs.
 """
 import os
+import sys
 import csv
 import json
 from pathlib import Path
 import pdfplumber
-import google.generativeai as genai
 from typing import Dict, List
 
+# Shared Gemini helpers live next to the analysis API in legacy/api
+sys.path.insert(0, str(Path(__file__).resolve().parents[2] / "api"))
+from gemini_client import get_registry
+
 def extract_text_from_pdf_pdfplumber(pdf_path: str) -> str:
     """Extract text from PDF using pdfplumber - all pages."""
     try:
@@ -38,8 +42,8 @@ def extract_startup_info_fast(pdf_path: str, api_key: str, timeout: int = 30) ->
                 "extraction_method": "failed"
             }
         
-        genai.configure(api_key=api_key)
-        model = genai.GenerativeModel('gemini-2.5-flash-lite')
+        # Configured once per process; the model object is reused across files
+        gemini = get_registry(api_key)
         
         extraction_prompt = f"""Extract startup data quickly.
 
@@ -58,7 +62,7 @@ TEXT:
 {content[:3000]}"""
         
         try:
-            response = model.generate_content(extraction_prompt, request_options={"timeout": timeout})
+            response = gemini.generate(extraction_prompt, 'extraction', deadline=timeout)
             response_text = response.text.strip()
             
             start_idx = response_text.find('{')
@@ -77,7 +81,7 @@ TEXT:
                     "extraction_method": "gemini"
                 }
         except Exception as e:
-            if "timeout" in str(e).lower():
+            if isinstance(e, TimeoutError) or "timeout" in str(e).lower():
                 return {
                     "file_name": file_name,
                     "startup_name": "Timeout - Skipped",
@@ -189,6 +193,7 @@ def process_remaining(folder_path: str, api_key: str, output_csv: str):
     write_batch_to_csv(output_csv, [result], csv_init)
     
     print(f"\n✅ Done! Successful: {successful}, Failed: {failed}")
+    print(f"📊 Gemini calls: {get_registry().call_stats()}")
 
 if __name__ == "__main__":
     import sys
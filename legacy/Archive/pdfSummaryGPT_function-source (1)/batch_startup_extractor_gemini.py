@@ -16,6 +16,9 @@ import json
 from pathlib import Path
 from typing import Dict, List
 
+# Shared Gemini helpers live next to the analysis API in legacy/api
+sys.path.insert(0, str(Path(__file__).resolve().parents[2] / "api"))
+
 
 def extract_text_from_pdf_pdfplumber(pdf_path: str) -> str:
     """
@@ -49,7 +52,7 @@ def extract_startup_info_with_gemini(content: str, file_name: str, api_key: str)
         Dict with startup_name, founders, and extraction_method
     """
     try:
-        import google.generativeai as genai
+        from gemini_client import get_registry
         
         if not api_key:
             print("❌ GEMINI_API_KEY not provided")
@@ -60,10 +63,8 @@ def extract_startup_info_with_gemini(content: str, file_name: str, api_key: str)
                 "extraction_method": "failed"
             }
         
-        genai.configure(api_key=api_key)
-        
-        # Use Gemini 2.5 Flash Lite
-        model = genai.GenerativeModel('gemini-2.5-flash-lite')
+        # Configured once per process; the model object is reused across files
+        gemini = get_registry(api_key)
         
         extraction_prompt = f"""You are an expert at extracting startup information from pitch decks.
 
@@ -105,7 +106,7 @@ COMPLETE DOCUMENT TEXT:
 {content}"""
         
         print(f"      🤖 Calling Gemini... ", end="", flush=True)
-        response = model.generate_content(extraction_prompt)
+        response = gemini.generate(extraction_prompt, 'extraction')
         
         print("✓")
         
@@ -324,6 +325,8 @@ def process_all_pdfs_in_folder(folder_path: str, api_key: str, output_csv: str =
     print(f"✅ Successful: {successful}/{len(pdf_files)}")
     print(f"❌ Failed: {failed}/{len(pdf_files)}")
     print(f"📊 CSV File: {output_csv}")
+    from gemini_client import get_registry
+    print(f"🔁 Gemini calls: {get_registry().call_stats()}")
     print("="*60 + "\n")
     
     return output_csv
@@ -0,0 +1,111 @@
+"""
+Output schemas for the four LLM analyses and the map-reduce chunk digest.
+
+The schemas use the OpenAPI subset Gemini accepts as response_schema, so
+the model is constrained to valid JSON of the right shape. The same schemas
+drive the tolerant decoder in llm_json.py, which fills in defaults for
+anything the model still leaves out.
+"""
+
+STRING = {'type': 'string'}
+STRING_LIST = {'type': 'array', 'items': STRING}
+
+
+def _object(properties, required=None):
+    return {
+        'type': 'object',
+        'properties': properties,
+        'required': list(required if required is not None else properties.keys())
+    }
+
+
+NARRATIVE_SCHEMA = _object({
+    'insights': STRING_LIST,
+    'key_finding': STRING,
+    'recommendation': STRING
+})
+
+# topic_stats is computed locally (post_stats.topic_stats), so the model only tags posts
+TOPICS_SCHEMA = _object({
+    'posts': {
+        'type': 'array',
+        'items': _object({
+            'id': {'type': 'integer'},
+            'topics': STRING_LIST
+        })
+    },
+    'summary': STRING
+})
+
+EVALUATION_SCHEMA = _object({
+    'score_100': {'type': 'integer'},
+    'rubric_breakdown': _object({
+        'depth_originality': {'type': 'integer'},
+        'hook_effectiveness': {'type': 'integer'},
+        'evidence_examples': {'type': 'integer'},
+        'actionability': {'type': 'integer'},
+        'conclusion_strength': {'type': 'integer'},
+        'personal_story': {'type': 'integer'},
+        'emotional_resonance': {'type': 'integer'}
+    }),
+    'story': _object({
+        'present': {'type': 'boolean'},
+        'quotes': STRING_LIST,
+        'lesson': STRING
+    }),
+    'strengths': STRING_LIST,
+    'improvements': STRING_LIST,
+    'suggested_edits': STRING_LIST,
+    'one_line_summary': STRING,
+    'overall_analysis': STRING
+})
+
+POSITIONING_SCHEMA = _object({
+    'current_branding': _object({
+        'positioning_summary': STRING,
+        'key_themes': STRING_LIST,
+        'expertise_areas': STRING_LIST,
+        'communication_style': STRING,
+        'target_audience': STRING,
+        'strengths': STRING_LIST,
+        'weaknesses': STRING_LIST
+    }),
+    'future_branding': _object({
+        'recommended_positioning': STRING,
+        'strategic_themes': STRING_LIST,
+        'target_expertise': STRING_LIST,
+        'ideal_communication_style': STRING,
+        'target_audience': STRING,
+        'differentiation_strategy': STRING,
+        'content_recommendations': STRING_LIST,
+        'positioning_gaps': STRING_LIST
+    }),
+    'action_plan': _object({
+        'immediate_actions': STRING_LIST,
+        'content_strategy': STRING,
+        'timeline': STRING
+    })
+})
+
+# Map step of map-reduce mode: a compact digest of one chunk of the posting history
+CHUNK_DIGEST_SCHEMA = _object({
+    'summary': STRING,
+    'themes': STRING_LIST,
+    'what_works': STRING_LIST,
+    'what_falls_flat': STRING_LIST,
+    'style': STRING,
+    'audience_signals': STRING_LIST
+})
+
+ANALYSIS_SCHEMAS = {
+    'narrative': NARRATIVE_SCHEMA,
+    'topics': TOPICS_SCHEMA,
+    'evaluation': EVALUATION_SCHEMA,
+    'positioning': POSITIONING_SCHEMA,
+    'chunk_digest': CHUNK_DIGEST_SCHEMA
+}
+
+
+def combined_schema(sections):
+    """One schema with a property per analysis section, for single-call combined mode."""
+    return _object({section: ANALYSIS_SCHEMAS[section] for section in sections})
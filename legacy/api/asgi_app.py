@@ -0,0 +1,270 @@
+"""
+ASGI serving mode for the analysis API
+
+The Flask app in linkedin_analysis_api.py handles each request on its own
+thread, and that thread is blocked for the whole Gemini call. Here the
+analysis routes run on an event loop instead. Gemini calls, rate limiter
+waits and retry backoffs are awaited (GeminiRegistry.generate_async), so a
+request waiting on the model holds no thread. One process can then keep
+hundreds of slow requests open, at a few kilobytes each rather than a thread
+apiece. Both modes share the analysis code: each analysis is a step
+generator (see run_steps) that the Flask driver and run_steps_async both run.
+
+Served natively:
+    POST /generate-insights, /analyze-topics, /evaluate-posts,
+         /analyze-positioning, /analyze-all
+
+Map-reduce and combined modes run their synchronous implementation in a
+worker thread. Every other route (/health, /metrics, /jobs, the streaming
+endpoints) goes to the Flask app mounted underneath, so clients work the
+same against either server.
+
+Requires starlette and uvicorn (optional, see requirements.txt). The Flask
+mount uses a2wsgi when it is installed, otherwise Starlette's WSGI adapter.
+
+Usage:
+    python asgi_app.py
+    uvicorn asgi_app:app --host 127.0.0.1 --port 5000
+"""
+
+import time
+import asyncio
+
+from starlette.applications import Starlette
+from starlette.responses import Response
+from starlette.routing import Mount, Route
+
+try:
+    from a2wsgi import WSGIMiddleware
+except ImportError:
+    from starlette.middleware.wsgi import WSGIMiddleware
+
+import linkedin_analysis_api as api
+from post_frame import PostFrame
+
+# Timed-out analyses keep running so they still fill the caches; holding them here stops them being collected
+_background_tasks = set()
+
+
+def _task_finished(task):
+    _background_tasks.discard(task)
+    # Nobody may be waiting on a timed-out task any more, so retrieve its error here
+    if not task.cancelled():
+        task.exception()
+
+
+def keep_running(coro):
+    """Start a task that survives its awaiting request timing out."""
+    task = asyncio.ensure_future(coro)
+    _background_tasks.add(task)
+    task.add_done_callback(_task_finished)
+    return task
+
+
+def json_response(payload, status=200):
+    """JSON response serialised the same way as Flask's jsonify."""
+    return Response(api.app.json.dumps(payload), status_code=status, media_type='application/json')
+
+
+async def read_posts(request):
+    """
+    Parse and validate a request body like the Flask routes do.
+
+    Returns:
+        Tuple of (data, error response or None)
+    """
+    try:
+        data = api.app.json.loads(await request.body())
+    except ValueError:
+        data = None
+
+    if not isinstance(data, dict) or 'posts' not in data:
+        return None, json_response({
+            "error": "Invalid request. Expected JSON with 'posts' array."
+        }, 400)
+
+    posts = data['posts']
+    if not isinstance(posts, list) or len(posts) == 0:
+        return None, json_response({
+            "error": "Posts must be a non-empty array."
+        }, 400)
+    return data, None
+
+
+async def analyze_topics(posts_data, engine=None):
+    """Async counterpart of api.analyze_topics, with the same engines and auto fallback reasons."""
+    engine = engine or api.TOPICS_ENGINE
+    if engine == 'local':
+        return await asyncio.to_thread(api.analyze_topics_locally, posts_data)
+    if engine != 'auto':
+        return {**await api.run_steps_async(api.topics_llm_steps(posts_data)), "engine": "llm"}
+
+    reason = await asyncio.to_thread(api.gemini_congestion)
+    if reason:
+        return await asyncio.to_thread(api.analyze_topics_locally, posts_data, reason)
+    task = keep_running(api.run_steps_async(api.topics_llm_steps(posts_data)))
+    try:
+        result = await asyncio.wait_for(asyncio.shield(task), api.TOPICS_AUTO_TIMEOUT_SECONDS)
+    except asyncio.TimeoutError:
+        return await asyncio.to_thread(api.analyze_topics_locally, posts_data, "gemini_slow")
+    if 'error' in result:
+        return await asyncio.to_thread(api.analyze_topics_locally, posts_data, "gemini_error")
+    return {**result, "engine": "llm"}
+
+
+async def run_analysis(name, posts_data, mode='default', options=None, engine=None):
+    """Async counterpart of api.run_analysis; map-reduce runs the synchronous path in a worker thread."""
+    if mode == 'map_reduce' and name in api.MAP_REDUCE_ANALYSES:
+        return await asyncio.to_thread(api.analyze_with_map_reduce, name, posts_data, **(options or {}))
+    if name == 'topics':
+        return await analyze_topics(posts_data, engine)
+    return await api.run_steps_async(api.ANALYSIS_STEPS[name](posts_data))
+
+
+async def run_analyses_concurrently(posts_data, analyses, timeouts=None, mode='default', options=None):
+    """
+    Async counterpart of api.run_analyses_concurrently.
+
+    Analyses run as tasks instead of pool threads, with the same per-analysis
+    deadlines and the same (results, errors, timings_ms) return value.
+    """
+    timeouts = timeouts or {}
+    started = time.monotonic()
+    durations = {}
+
+    async def timed(name):
+        call_start = time.monotonic()
+        try:
+            return await run_analysis(name, posts_data, mode, options)
+        finally:
+            durations[name] = round((time.monotonic() - call_start) * 1000)
+
+    tasks = {name: keep_running(timed(name)) for name in analyses}
+
+    results = {}
+    errors = {}
+    for name, task in tasks.items():
+        deadline = started + float(timeouts.get(name, api.ANALYSIS_TIMEOUT_SECONDS))
+        try:
+            result = await asyncio.wait_for(asyncio.shield(task), max(0.0, deadline - time.monotonic()))
+        except asyncio.TimeoutError:
+            errors[name] = f"Timed out after {timeouts.get(name, api.ANALYSIS_TIMEOUT_SECONDS)}s"
+            continue
+        except Exception as e:
+            errors[name] = f"Analysis failed: {str(e)}"
+            continue
+
+        if 'error' in result:
+            errors[name] = result['error']
+        else:
+            results[name] = result
+
+    timings_ms = {name: durations.get(name) for name in analyses}
+    timings_ms['total'] = round((time.monotonic() - started) * 1000)
+    return results, errors, timings_ms
+
+
+def analysis_endpoint(name, accepts_mode=False):
+    """Handler for one analysis route, mirroring its Flask endpoint's validation and response."""
+    async def endpoint(request):
+        data, error = await read_posts(request)
+        if error is not None:
+            return error
+
+        mode, options = 'default', {}
+        if accepts_mode:
+            mode, options, mode_error = api.parse_analysis_mode(data)
+            if mode_error:
+                return json_response({"error": mode_error}, 400)
+
+        engine = None
+        if name == 'topics':
+            engine, engine_error = api.parse_topics_engine(data)
+            if engine_error:
+                return json_response({"error": engine_error}, 400)
+
+        result = await run_analysis(name, data['posts'], mode, options, engine)
+        if 'error' in result:
+            return json_response(result, 500)
+        return json_response({
+            "success": True,
+            "data": result
+        })
+    return endpoint
+
+
+async def analyze_all_endpoint(request):
+    """Run several analyses concurrently; same payload and response as the Flask /analyze-all."""
+    data, error = await read_posts(request)
+    if error is not None:
+        return error
+
+    analyses, timeouts, selection_error = api.parse_analysis_selection(data)
+    if selection_error:
+        return json_response({"error": selection_error}, 400)
+
+    mode, options, mode_error = api.parse_analysis_mode(data, api.ALL_ANALYSES_MODES)
+    if mode_error:
+        return json_response({"error": mode_error}, 400)
+
+    frame = await asyncio.to_thread(PostFrame, data['posts'])
+    if mode == 'combined':
+        results, errors, timings_ms = await asyncio.to_thread(api.run_combined_analyses, frame, analyses)
+    else:
+        results, errors, timings_ms = await run_analyses_concurrently(frame, analyses, timeouts, mode, options)
+
+    return json_response({
+        "success": len(results) > 0,
+        "partial": len(errors) > 0,
+        "data": results,
+        "errors": errors,
+        "timings_ms": timings_ms
+    }, 200 if results else 500)
+
+
+def observed_route(path, endpoint):
+    """POST route that records the HTTP metrics the Flask request hooks record, and turns errors into 500s."""
+    async def handle(request):
+        api.HTTP_IN_FLIGHT.inc(route=path)
+        started = time.perf_counter()
+        try:
+            response = await endpoint(request)
+        except Exception as e:
+            response = json_response({"error": f"Server error: {str(e)}"}, 500)
+        finally:
+            api.HTTP_IN_FLIGHT.dec(route=path)
+            api.HTTP_LATENCY.observe(time.perf_counter() - started, route=path)
+        api.HTTP_REQUESTS.inc(route=path, method=request.method, status=response.status_code)
+        return response
+    return Route(path, handle, methods=['POST'])
+
+
+app = Starlette(routes=[
+    observed_route('/generate-insights', analysis_endpoint('insights', accepts_mode=True)),
+    observed_route('/analyze-topics', analysis_endpoint('topics')),
+    observed_route('/evaluate-posts', analysis_endpoint('evaluation')),
+    observed_route('/analyze-positioning', analysis_endpoint('positioning', accepts_mode=True)),
+    observed_route('/analyze-all', analyze_all_endpoint),
+    Mount('/', app=WSGIMiddleware(api.app))
+])
+
+
+if __name__ == '__main__':
+    import uvicorn
+
+    print("\n" + "="*60)
+    print("🚀 LinkedIn Analysis API Server (ASGI)")
+    print("="*60)
+    print(f"LLM backend:    {api.gemini.backend.name}")
+    print(f"Result cache:   {api.result_cache.path if api.result_cache is not None else 'disabled'}")
+    print("\nAsync endpoints: /generate-insights, /analyze-topics, /evaluate-posts, /analyze-positioning, /analyze-all")
+    print("Other endpoints are served by the Flask app (see linkedin_analysis_api.py)")
+    print("\n" + "="*60 + "\n")
+
+    if api.gemini.is_configured():
+        try:
+            print(f"🔥 Gemini client warmed up in {api.gemini.warm_up()}ms")
+        except Exception as e:
+            print(f"⚠️  Gemini warm-up failed: {e}")
+
+    uvicorn.run(app, host='127.0.0.1', port=5000)
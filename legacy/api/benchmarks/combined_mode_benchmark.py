@@ -0,0 +1,202 @@
+"""
+Combined mode benchmark
+
+Compares the four-call /analyze-all path with the single combined-schema
+call for every profile in data/linkedin. Input tokens of both paths are
+always reported. With --live it also runs both paths against Gemini and
+reports wall latency, input and output tokens from usage_metadata, and
+output completeness: the share of schema fields that came back non-empty.
+
+Usage:
+    python benchmarks/combined_mode_benchmark.py
+    python benchmarks/combined_mode_benchmark.py --count-tokens gemini
+    python benchmarks/combined_mode_benchmark.py --live 3 --output combined_results.json
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import threading
+import statistics
+
+API_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, API_DIR)
+
+# Keep benchmark runs out of the shared result and label caches
+os.environ.setdefault('ANALYSIS_CACHE_ENABLED', 'false')
+
+import linkedin_analysis_api as api
+from llm_json import default_for
+from post_frame import PostFrame
+from prompt_encoding_benchmark import DEFAULT_DATA_DIR, load_profiles, count_tokens
+
+ANALYSES = list(api.COMBINED_SECTIONS.keys())
+
+SEPARATE_PROMPTS = {
+    'insights': ('narrative', api.build_narrative_prompt),
+    'topics': ('topics', api.build_topics_prompt),
+    'evaluation': ('evaluation', api.build_evaluation_prompt),
+    'positioning': ('positioning', api.build_positioning_prompt)
+}
+
+
+def filled_ratio(value, schema):
+    """Share of leaf fields in value that differ from the schema's empty default."""
+    if schema.get('type') == 'object':
+        counts = [filled_ratio((value or {}).get(key), prop) for key, prop in schema.get('properties', {}).items()]
+        return statistics.mean(counts) if counts else 1.0
+    return 0.0 if value is None or value == default_for(schema) else 1.0
+
+
+class UsageRecorder:
+    """Wraps the registry's generate() to collect usage_metadata from every call."""
+
+    def __init__(self, registry):
+        self.calls = []
+        self._lock = threading.Lock()
+        self._generate = registry.generate
+        registry.generate = self.generate
+
+    def generate(self, prompt, profile='default', *args, **kwargs):
+        response = self._generate(prompt, profile, *args, **kwargs)
+        usage = getattr(response, 'usage_metadata', None)
+        with self._lock:
+            self.calls.append({
+                'profile': profile,
+                'input_tokens': getattr(usage, 'prompt_token_count', None) or 0,
+                'output_tokens': getattr(usage, 'candidates_token_count', None) or 0
+            })
+        return response
+
+    def drain(self):
+        with self._lock:
+            calls, self.calls = self.calls, []
+        return calls
+
+
+def prompt_tokens(frame, token_method):
+    """Input tokens of the four separate prompts and of the combined prompt."""
+    separate = 0
+    for name in ANALYSES:
+        analysis, build = SEPARATE_PROMPTS[name]
+        separate += count_tokens(build(api.condense_posts(analysis, frame)), token_method)
+    combined_posts = api.condense_posts('combined', frame)
+    sections = [api.COMBINED_SECTIONS[name] for name in ANALYSES]
+    combined = count_tokens(api.build_combined_prompt(combined_posts, sections), token_method)
+    return separate, combined
+
+
+def run_path(mode, frame, recorder):
+    start = time.perf_counter()
+    if mode == 'combined':
+        results, errors, _ = api.run_combined_analyses(frame, ANALYSES)
+    else:
+        results, errors, _ = api.run_analyses_concurrently(frame, ANALYSES)
+    latency_ms = round((time.perf_counter() - start) * 1000)
+    calls = recorder.drain()
+    completeness = {
+        name: round(filled_ratio(results.get(name), api.ANALYSIS_SCHEMAS[api.COMBINED_SECTIONS[name]]), 3)
+        for name in ANALYSES
+    }
+    return {
+        'latency_ms': latency_ms,
+        'calls': len(calls),
+        'input_tokens': sum(call['input_tokens'] for call in calls),
+        'output_tokens': sum(call['output_tokens'] for call in calls),
+        'completeness': completeness,
+        'completeness_mean': round(statistics.mean(completeness.values()), 3),
+        'errors': errors
+    }
+
+
+def run_benchmark(profiles, token_method, live_profiles):
+    recorder = UsageRecorder(api.gemini) if live_profiles else None
+    rows = []
+    for position, (name, posts) in enumerate(profiles.items()):
+        frame = PostFrame(posts)
+        separate_tokens, combined_tokens = prompt_tokens(frame, token_method)
+        row = {
+            'profile': name,
+            'posts': len(frame),
+            'prompt_tokens_four_call': separate_tokens,
+            'prompt_tokens_combined': combined_tokens
+        }
+        if position < live_profiles:
+            print(f"   ⏱️  {name}: four-call path...")
+            row['four_call'] = run_path('four_call', frame, recorder)
+            print(f"   ⏱️  {name}: combined path...")
+            row['combined'] = run_path('combined', frame, recorder)
+        rows.append(row)
+    return rows
+
+
+def summarize(rows):
+    summary = {
+        'profiles': len(rows),
+        'prompt_tokens_four_call': sum(row['prompt_tokens_four_call'] for row in rows),
+        'prompt_tokens_combined': sum(row['prompt_tokens_combined'] for row in rows)
+    }
+    summary['prompt_token_savings'] = round(
+        1 - summary['prompt_tokens_combined'] / summary['prompt_tokens_four_call'], 3
+    ) if summary['prompt_tokens_four_call'] else None
+
+    live = [row for row in rows if 'combined' in row]
+    for path in ('four_call', 'combined'):
+        if not live:
+            continue
+        summary[path] = {
+            'live_profiles': len(live),
+            'latency_ms_p50': statistics.median(row[path]['latency_ms'] for row in live),
+            'latency_ms_max': max(row[path]['latency_ms'] for row in live),
+            'input_tokens_total': sum(row[path]['input_tokens'] for row in live),
+            'output_tokens_total': sum(row[path]['output_tokens'] for row in live),
+            'completeness_mean': round(statistics.mean(row[path]['completeness_mean'] for row in live), 3),
+            'failed_sections': sum(len(row[path]['errors']) for row in live)
+        }
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare the four-call path with the single combined call.")
+    parser.add_argument('--data-dir', default=DEFAULT_DATA_DIR, help="Folder with linkedin_posts_*.csv files")
+    parser.add_argument('--count-tokens', choices=['local', 'gemini'], default='local',
+                        help="Use the local estimate or Gemini's count_tokens (needs GEMINI_API_KEY)")
+    parser.add_argument('--live', type=int, default=0, metavar='N',
+                        help="Also run both paths against Gemini for the first N profiles")
+    parser.add_argument('--output', help="Write per-profile rows and the summary to this JSON file")
+    args = parser.parse_args()
+
+    if (args.live or args.count_tokens == 'gemini') and not api.gemini.api_key:
+        print("❌ GEMINI_API_KEY is required for --live and --count-tokens gemini")
+        sys.exit(1)
+
+    profiles = load_profiles(args.data_dir)
+    if not profiles:
+        print(f"❌ No linkedin_posts_*.csv files found in {args.data_dir}")
+        sys.exit(1)
+
+    print(f"\n📊 Benchmarking combined mode over {len(profiles)} profiles...")
+    rows = run_benchmark(profiles, args.count_tokens, args.live)
+    summary = summarize(rows)
+
+    print("\n" + "=" * 72)
+    print(f"Prompt tokens  four-call: {summary['prompt_tokens_four_call']:>9}   "
+          f"combined: {summary['prompt_tokens_combined']:>9}   saved: {summary['prompt_token_savings']:.1%}")
+    for path in ('four_call', 'combined'):
+        if path in summary:
+            stats = summary[path]
+            print(f"{path:<10} p50 {stats['latency_ms_p50']:>7} ms   max {stats['latency_ms_max']:>7} ms   "
+                  f"in {stats['input_tokens_total']:>8}   out {stats['output_tokens_total']:>7}   "
+                  f"complete {stats['completeness_mean']:.3f}   failed {stats['failed_sections']}")
+    print("=" * 72 + "\n")
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump({'token_method': args.count_tokens, 'summary': summary, 'results': rows}, f, indent=2)
+        print(f"💾 Results written to {args.output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,244 @@
+"""
+API load test
+
+Serves the Flask app on a local port, backed by the mock LLM backend, and
+replays payloads built from every profile in data/linkedin against each
+endpoint at each concurrency level. Each run reports:
+    - throughput and p50/p95/p99 latency
+    - CPU time per request spent condensing posts and handling JSON (request
+      parsing, response serialization and LLM response decoding)
+    - with --memory, a sequential tracemalloc pass giving peak memory per request
+
+Results are written as JSON so runs can be diffed to track regressions.
+
+The result cache, the rate limiter, single flight and the local topic
+classifier are off by default, so every request reaches the mock instead of
+being coalesced with an identical payload or answered locally. Mock latency
+and failures come from the MOCK_LLM_* settings (see llm_backends.py).
+
+Usage:
+    python benchmarks/load_test.py
+    python benchmarks/load_test.py --concurrency 1,8,32 --requests 64 --output load_results.json
+    MOCK_LLM_LATENCY=fixed:50 MOCK_LLM_ERROR_RATE=0.05 python benchmarks/load_test.py --memory
+"""
+
+import os
+import sys
+import json
+import time
+import logging
+import argparse
+import platform
+import threading
+import tracemalloc
+import urllib.error
+import urllib.request
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+API_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, API_DIR)
+
+os.environ.setdefault('LLM_BACKEND', 'mock')
+os.environ.setdefault('ANALYSIS_CACHE_ENABLED', 'false')
+os.environ.setdefault('GEMINI_RATE_LIMIT_ENABLED', 'false')
+os.environ.setdefault('SINGLE_FLIGHT_ENABLED', 'false')
+os.environ.setdefault('TOPIC_CLASSIFIER_ENABLED', 'false')
+
+import numpy as np
+from werkzeug.serving import make_server
+
+import linkedin_analysis_api as api
+from prompt_encoding_benchmark import DEFAULT_DATA_DIR, load_profiles
+
+ENDPOINTS = ['/generate-insights', '/analyze-topics', '/evaluate-posts', '/analyze-positioning', '/analyze-all']
+
+REQUEST_TIMEOUT_SECONDS = 300
+
+
+class StageTimer:
+    """Per-thread CPU time of instrumented app functions, summed per stage."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._cpu = Counter()
+
+    def wrap(self, stage, fn):
+        def timed(*args, **kwargs):
+            start = time.thread_time()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                elapsed = time.thread_time() - start
+                with self._lock:
+                    self._cpu[stage] += elapsed
+        return timed
+
+    def drain(self):
+        with self._lock:
+            cpu, self._cpu = self._cpu, Counter()
+        return cpu
+
+
+def instrument(timer):
+    """Route condensation and JSON handling through the timer."""
+    api.condense_posts = timer.wrap('condense', api.condense_posts)
+    api.decode_analysis_response = timer.wrap('json', api.decode_analysis_response)
+    api.app.json.loads = timer.wrap('json', api.app.json.loads)
+    api.app.json.dumps = timer.wrap('json', api.app.json.dumps)
+
+
+class Server:
+    """The Flask app on a werkzeug server in a background thread."""
+
+    def __init__(self, app):
+        logging.getLogger('werkzeug').setLevel(logging.ERROR)
+        self.server = make_server('127.0.0.1', 0, app, threaded=True)
+        self.url = f"http://127.0.0.1:{self.server.server_port}"
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.server.shutdown()
+        self.thread.join()
+
+
+def build_payloads(profiles):
+    return [json.dumps({'posts': posts}).encode('utf-8') for posts in profiles.values()]
+
+
+def send(url, body):
+    """POST one payload; returns (latency_ms, ok)."""
+    request = urllib.request.Request(url, data=body, headers={'Content-Type': 'application/json'})
+    start = time.perf_counter()
+    try:
+        with urllib.request.urlopen(request, timeout=REQUEST_TIMEOUT_SECONDS) as response:
+            response.read()
+            ok = response.status == 200
+    except urllib.error.HTTPError as e:
+        e.read()
+        ok = False
+    except OSError:
+        ok = False
+    return (time.perf_counter() - start) * 1000, ok
+
+
+def run_level(base_url, endpoint, payloads, concurrency, requests, timer):
+    """Send `requests` payloads, round robin over profiles, with `concurrency` in flight."""
+    bodies = [payloads[number % len(payloads)] for number in range(requests)]
+    timer.drain()
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(lambda body: send(base_url + endpoint, body), bodies))
+    wall = time.perf_counter() - start
+    cpu = timer.drain()
+
+    latencies = np.array([latency for latency, _ in results])
+    return {
+        'endpoint': endpoint,
+        'concurrency': concurrency,
+        'requests': requests,
+        'errors': sum(1 for _, ok in results if not ok),
+        'wall_seconds': round(wall, 3),
+        'throughput_rps': round(requests / wall, 2),
+        'latency_ms_p50': round(float(np.percentile(latencies, 50)), 1),
+        'latency_ms_p95': round(float(np.percentile(latencies, 95)), 1),
+        'latency_ms_p99': round(float(np.percentile(latencies, 99)), 1),
+        'cpu_ms_per_request': {stage: round(seconds * 1000 / requests, 3) for stage, seconds in sorted(cpu.items())}
+    }
+
+
+def measure_memory(base_url, endpoint, payloads):
+    """
+    Peak traced allocation per request, one request at a time.
+
+    Server and client share the process, so the figure includes reading the
+    response on the client side.
+    """
+    peaks = []
+    tracemalloc.start()
+    try:
+        for body in payloads:
+            tracemalloc.reset_peak()
+            baseline, _ = tracemalloc.get_traced_memory()
+            send(base_url + endpoint, body)
+            _, peak = tracemalloc.get_traced_memory()
+            peaks.append(peak - baseline)
+    finally:
+        tracemalloc.stop()
+    return {
+        'endpoint': endpoint,
+        'requests': len(peaks),
+        'peak_kib_mean': round(float(np.mean(peaks)) / 1024, 1),
+        'peak_kib_max': round(float(np.max(peaks)) / 1024, 1)
+    }
+
+
+def run_load_test(payloads, endpoints, levels, requests, memory):
+    timer = StageTimer()
+    instrument(timer)
+    runs, memory_runs = [], []
+    with Server(api.app) as server:
+        for endpoint in endpoints:
+            for concurrency in levels:
+                print(f"   ⏱️  {endpoint} x{concurrency}...")
+                runs.append(run_level(server.url, endpoint, payloads, concurrency, requests, timer))
+            if memory:
+                print(f"   🧠 {endpoint} memory...")
+                memory_runs.append(measure_memory(server.url, endpoint, payloads))
+    return runs, memory_runs
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load-test the API against the mock LLM backend.")
+    parser.add_argument('--data-dir', default=DEFAULT_DATA_DIR, help="Folder with linkedin_posts_*.csv files")
+    parser.add_argument('--endpoints', default=','.join(ENDPOINTS), help="Comma-separated endpoints to test")
+    parser.add_argument('--concurrency', default='1,4,16', help="Comma-separated concurrency levels")
+    parser.add_argument('--requests', type=int, default=24, help="Requests per endpoint and concurrency level")
+    parser.add_argument('--memory', action='store_true', help="Also measure peak memory per request with tracemalloc")
+    parser.add_argument('--output', help="Write the results to this JSON file")
+    args = parser.parse_args()
+
+    profiles = load_profiles(args.data_dir)
+    if not profiles:
+        print(f"❌ No linkedin_posts_*.csv files found in {args.data_dir}")
+        sys.exit(1)
+
+    endpoints = [endpoint.strip() for endpoint in args.endpoints.split(',') if endpoint.strip()]
+    levels = [int(level) for level in args.concurrency.split(',')]
+    payloads = build_payloads(profiles)
+
+    print(f"\n📊 Load testing {len(endpoints)} endpoints over {len(payloads)} profiles "
+          f"(backend: {api.gemini.backend.name})...")
+    runs, memory_runs = run_load_test(payloads, endpoints, levels, args.requests, args.memory)
+
+    print("\n" + "=" * 96)
+    for run in runs:
+        cpu = run['cpu_ms_per_request']
+        print(f"{run['endpoint']:<22} x{run['concurrency']:<3} {run['throughput_rps']:>7} rps   "
+              f"p50 {run['latency_ms_p50']:>7}   p95 {run['latency_ms_p95']:>7}   p99 {run['latency_ms_p99']:>7} ms   "
+              f"condense {cpu.get('condense', 0):>6}   json {cpu.get('json', 0):>6} cpu-ms   errors {run['errors']}")
+    for run in memory_runs:
+        print(f"{run['endpoint']:<22} peak memory per request: mean {run['peak_kib_mean']} KiB, max {run['peak_kib_max']} KiB")
+    print("=" * 96 + "\n")
+
+    if args.output:
+        report = {
+            'started_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'python': platform.python_version(),
+            'profiles': len(payloads),
+            'backend': api.gemini.backend_stats(),
+            'gemini_calls': api.gemini.call_stats(),
+            'runs': runs,
+            'memory': memory_runs
+        }
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+        print(f"💾 Results written to {args.output}")
+
+
+if __name__ == '__main__':
+    main()
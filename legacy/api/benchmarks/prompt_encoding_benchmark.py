@@ -0,0 +1,164 @@
+"""
+Prompt encoding benchmark
+
+Builds every analysis prompt for every profile in data/linkedin with each
+prompt encoding and reports input-token counts. With --live it also sends the
+prompts to Gemini and reports latency, output tokens and whether the
+response decoded as JSON, as a first check on output quality.
+
+Usage:
+    python benchmarks/prompt_encoding_benchmark.py
+    python benchmarks/prompt_encoding_benchmark.py --count-tokens gemini
+    python benchmarks/prompt_encoding_benchmark.py --live 3 --output encoding_results.json
+"""
+
+import os
+import sys
+import csv
+import json
+import glob
+import time
+import argparse
+import statistics
+
+API_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, API_DIR)
+
+# Keep benchmark runs out of the shared result cache
+os.environ.setdefault('ANALYSIS_CACHE_ENABLED', 'false')
+
+import linkedin_analysis_api as api
+from post_frame import PostFrame
+from post_selection import estimate_tokens
+from prompt_encoding import ENCODERS
+
+DEFAULT_DATA_DIR = os.path.join(API_DIR, '..', '..', 'data', 'linkedin')
+
+PROMPT_BUILDERS = {
+    'narrative': api.build_narrative_prompt,
+    'topics': api.build_topics_prompt,
+    'evaluation': api.build_evaluation_prompt,
+    'positioning': api.build_positioning_prompt
+}
+
+
+def load_profiles(data_dir):
+    """Load every linkedin_posts_*.csv as a list of post dicts keyed by profile name."""
+    profiles = {}
+    for path in sorted(glob.glob(os.path.join(data_dir, 'linkedin_posts_*.csv'))):
+        name = os.path.basename(path)[len('linkedin_posts_'):-len('.csv')].strip()
+        with open(path, 'r', encoding='utf-8') as f:
+            profiles[name] = list(csv.DictReader(f))
+    return profiles
+
+
+def count_tokens(prompt, method):
+    if method == 'gemini':
+        return api.gemini.get_model().count_tokens(prompt).total_tokens
+    return estimate_tokens(prompt)
+
+
+def run_benchmark(profiles, analyses, encodings, token_method, live_profiles):
+    results = []
+    for name, posts in profiles.items():
+        frame = PostFrame(posts)
+        for analysis in analyses:
+            for encoding in encodings:
+                condensed = api.condense_posts(analysis, frame, encoding)
+                prompt = PROMPT_BUILDERS[analysis](condensed, encoding)
+                row = {
+                    'profile': name,
+                    'analysis': analysis,
+                    'encoding': encoding,
+                    'posts_sent': len(condensed),
+                    'prompt_chars': len(prompt),
+                    'input_tokens': count_tokens(prompt, token_method)
+                }
+
+                if live_profiles and list(profiles.keys()).index(name) < live_profiles:
+                    start = time.perf_counter()
+                    try:
+                        response = api.generate_content(prompt, analysis)
+                        row['latency_ms'] = round((time.perf_counter() - start) * 1000)
+                        usage = getattr(response, 'usage_metadata', None)
+                        row['output_tokens'] = getattr(usage, 'candidates_token_count', None)
+                        _, complete = api.decode_analysis_response(analysis, response.text)
+                        row['decoded'] = True
+                        row['complete'] = complete
+                    except Exception as e:
+                        row.setdefault('latency_ms', round((time.perf_counter() - start) * 1000))
+                        row['decoded'] = False
+                        row['error'] = str(e)[:200]
+
+                results.append(row)
+    return results
+
+
+def summarize(results, encodings):
+    """Aggregate per-encoding totals and savings relative to indented JSON."""
+    summary = {}
+    for encoding in encodings:
+        rows = [row for row in results if row['encoding'] == encoding]
+        live = [row for row in rows if 'latency_ms' in row]
+        summary[encoding] = {
+            'prompts': len(rows),
+            'input_tokens_total': sum(row['input_tokens'] for row in rows),
+            'input_tokens_mean': round(statistics.mean(row['input_tokens'] for row in rows), 1) if rows else 0,
+            'posts_sent_mean': round(statistics.mean(row['posts_sent'] for row in rows), 1) if rows else 0,
+            'tokens_per_post': round(sum(row['input_tokens'] for row in rows) / max(1, sum(row['posts_sent'] for row in rows)), 1),
+            'live_calls': len(live),
+            'latency_ms_p50': statistics.median(row['latency_ms'] for row in live) if live else None,
+            'decode_success_rate': round(sum(row['decoded'] for row in live) / len(live), 3) if live else None,
+            'complete_rate': round(sum(row.get('complete', False) for row in live) / len(live), 3) if live else None
+        }
+    baseline = summary.get('json', {}).get('input_tokens_total')
+    for encoding, stats in summary.items():
+        stats['savings_vs_json'] = round(1 - stats['input_tokens_total'] / baseline, 3) if baseline else None
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare prompt encodings by input tokens and latency.")
+    parser.add_argument('--data-dir', default=DEFAULT_DATA_DIR, help="Folder with linkedin_posts_*.csv files")
+    parser.add_argument('--analyses', nargs='+', default=list(PROMPT_BUILDERS.keys()), choices=list(PROMPT_BUILDERS.keys()))
+    parser.add_argument('--encodings', nargs='+', default=list(ENCODERS.keys()), choices=list(ENCODERS.keys()))
+    parser.add_argument('--count-tokens', choices=['local', 'gemini'], default='local',
+                        help="Use the local estimate or Gemini's count_tokens (needs GEMINI_API_KEY)")
+    parser.add_argument('--live', type=int, default=0, metavar='N',
+                        help="Also send prompts for the first N profiles to Gemini and time them")
+    parser.add_argument('--output', help="Write per-prompt rows and the summary to this JSON file")
+    args = parser.parse_args()
+
+    if (args.live or args.count_tokens == 'gemini') and not api.gemini.api_key:
+        print("❌ GEMINI_API_KEY is required for --live and --count-tokens gemini")
+        sys.exit(1)
+
+    profiles = load_profiles(args.data_dir)
+    if not profiles:
+        print(f"❌ No linkedin_posts_*.csv files found in {args.data_dir}")
+        sys.exit(1)
+
+    print(f"\n📊 Benchmarking {len(args.encodings)} encodings over {len(profiles)} profiles...")
+    results = run_benchmark(profiles, args.analyses, args.encodings, args.count_tokens, args.live)
+    summary = summarize(results, args.encodings)
+
+    # Budgets pack more posts into cheaper encodings, so compare tokens per post as well as totals
+    print("\n" + "=" * 86)
+    print(f"{'encoding':<10} {'prompts':>8} {'tokens':>10} {'mean':>8} {'posts':>7} {'tok/post':>9} {'saved':>7} {'p50 ms':>8} {'decoded':>8}")
+    print("=" * 86)
+    for encoding, stats in summary.items():
+        saved = f"{stats['savings_vs_json']:.1%}" if stats['savings_vs_json'] is not None else '-'
+        latency = stats['latency_ms_p50'] if stats['latency_ms_p50'] is not None else '-'
+        decoded = stats['decode_success_rate'] if stats['decode_success_rate'] is not None else '-'
+        print(f"{encoding:<10} {stats['prompts']:>8} {stats['input_tokens_total']:>10} {stats['input_tokens_mean']:>8} "
+              f"{stats['posts_sent_mean']:>7} {stats['tokens_per_post']:>9} {saved:>7} {latency:>8} {decoded:>8}")
+    print("=" * 86 + "\n")
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump({'token_method': args.count_tokens, 'summary': summary, 'results': results}, f, indent=2)
+        print(f"💾 Results written to {args.output}")
+
+
+if __name__ == '__main__':
+    main()
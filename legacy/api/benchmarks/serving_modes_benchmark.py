@@ -0,0 +1,257 @@
+"""
+Serving mode benchmark: threaded Flask vs ASGI
+
+Starts the API in a child process in each serving mode, backed by a slow mock
+LLM, and drives one endpoint at rising concurrency. With slow model calls the
+threaded Flask server needs a thread per open request, and the ASGI server
+(asgi_app.py) awaits them on one event loop. Each run reports:
+    - throughput and p50/p95/p99 latency
+    - peak resident memory and thread count of the server process, sampled
+      from /proc while the level runs (Linux only; null elsewhere)
+
+The result cache, the rate limiter and single flight are off so every request
+waits on the mock. The mock latency defaults to lognormal:2000:0.3, roughly
+what a Gemini call takes; override it with --latency.
+
+Usage:
+    python benchmarks/serving_modes_benchmark.py
+    python benchmarks/serving_modes_benchmark.py --concurrency 1,64,256 --requests 512 --output serving_modes.json
+    python benchmarks/serving_modes_benchmark.py --modes asgi --endpoint /analyze-all --latency fixed:500
+"""
+
+import os
+import sys
+import json
+import time
+import socket
+import logging
+import argparse
+import platform
+import threading
+import subprocess
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+API_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, API_DIR)
+
+import numpy as np
+
+from prompt_encoding_benchmark import DEFAULT_DATA_DIR, load_profiles
+
+MODES = ['flask', 'asgi']
+
+REQUEST_TIMEOUT_SECONDS = 300
+STARTUP_TIMEOUT_SECONDS = 60
+SAMPLE_INTERVAL_SECONDS = 0.05
+
+
+def serve(mode, port):
+    """Run the API in the given mode until killed (the child process side)."""
+    if mode == 'flask':
+        from werkzeug.serving import make_server
+        import linkedin_analysis_api as api
+
+        logging.getLogger('werkzeug').setLevel(logging.ERROR)
+        make_server('127.0.0.1', port, api.app, threaded=True).serve_forever()
+    else:
+        import uvicorn
+        from asgi_app import app
+
+        uvicorn.run(app, host='127.0.0.1', port=port, log_level='error', timeout_keep_alive=REQUEST_TIMEOUT_SECONDS)
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+class ServerProcess:
+    """The API in one serving mode in a child process."""
+
+    def __init__(self, mode, latency):
+        self.mode = mode
+        self.port = free_port()
+        self.url = f"http://127.0.0.1:{self.port}"
+        self.env = {
+            **os.environ,
+            'LLM_BACKEND': 'mock',
+            'MOCK_LLM_LATENCY': latency,
+            'ANALYSIS_CACHE_ENABLED': 'false',
+            'GEMINI_RATE_LIMIT_ENABLED': 'false',
+            'SINGLE_FLIGHT_ENABLED': 'false'
+        }
+
+    def __enter__(self):
+        self.process = subprocess.Popen(
+            [sys.executable, os.path.abspath(__file__), '--serve', self.mode, '--port', str(self.port)],
+            cwd=API_DIR, env=self.env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+        )
+        deadline = time.monotonic() + STARTUP_TIMEOUT_SECONDS
+        while time.monotonic() < deadline:
+            if self.process.poll() is not None:
+                raise RuntimeError(f"{self.mode} server exited with code {self.process.returncode}")
+            try:
+                with urllib.request.urlopen(self.url + '/health', timeout=1) as response:
+                    response.read()
+                return self
+            except OSError:
+                time.sleep(0.2)
+        self.process.kill()
+        raise RuntimeError(f"{self.mode} server did not start within {STARTUP_TIMEOUT_SECONDS}s")
+
+    def __exit__(self, *exc):
+        self.process.terminate()
+        try:
+            self.process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+            self.process.wait()
+
+
+def process_status(pid):
+    """(resident KiB, threads) of a process from /proc, or None where /proc is unavailable."""
+    try:
+        with open(f'/proc/{pid}/status', encoding='utf-8') as f:
+            fields = dict(line.split(':', 1) for line in f if ':' in line)
+    except OSError:
+        return None
+    return int(fields['VmRSS'].split()[0]), int(fields['Threads'])
+
+
+class ResourceSampler:
+    """Peak memory and thread count of a process, sampled in a background thread."""
+
+    def __init__(self, pid):
+        self.pid = pid
+        self.peak_rss_kib = None
+        self.peak_threads = None
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while True:
+            status = process_status(self.pid)
+            if status is not None:
+                rss, threads = status
+                self.peak_rss_kib = max(self.peak_rss_kib or 0, rss)
+                self.peak_threads = max(self.peak_threads or 0, threads)
+            if self._stop.wait(SAMPLE_INTERVAL_SECONDS):
+                return
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+
+def send(url, body):
+    """POST one payload; returns (latency_ms, ok)."""
+    request = urllib.request.Request(url, data=body, headers={'Content-Type': 'application/json'})
+    start = time.perf_counter()
+    try:
+        with urllib.request.urlopen(request, timeout=REQUEST_TIMEOUT_SECONDS) as response:
+            response.read()
+            ok = response.status == 200
+    except urllib.error.HTTPError as e:
+        e.read()
+        ok = False
+    except OSError:
+        ok = False
+    return (time.perf_counter() - start) * 1000, ok
+
+
+def run_level(server, endpoint, payloads, concurrency, requests):
+    """Send `requests` payloads, round robin over profiles, with `concurrency` in flight."""
+    bodies = [payloads[number % len(payloads)] for number in range(requests)]
+    idle = process_status(server.process.pid)
+    with ResourceSampler(server.process.pid) as sampler:
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            results = list(pool.map(lambda body: send(server.url + endpoint, body), bodies))
+        wall = time.perf_counter() - start
+
+    latencies = np.array([latency for latency, _ in results])
+    return {
+        'mode': server.mode,
+        'endpoint': endpoint,
+        'concurrency': concurrency,
+        'requests': requests,
+        'errors': sum(1 for _, ok in results if not ok),
+        'wall_seconds': round(wall, 3),
+        'throughput_rps': round(requests / wall, 2),
+        'latency_ms_p50': round(float(np.percentile(latencies, 50)), 1),
+        'latency_ms_p95': round(float(np.percentile(latencies, 95)), 1),
+        'latency_ms_p99': round(float(np.percentile(latencies, 99)), 1),
+        'idle_rss_mib': round(idle[0] / 1024, 1) if idle else None,
+        'peak_rss_mib': round(sampler.peak_rss_kib / 1024, 1) if sampler.peak_rss_kib else None,
+        'peak_threads': sampler.peak_threads
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare the threaded Flask and ASGI servers under slow LLM calls.")
+    parser.add_argument('--data-dir', default=DEFAULT_DATA_DIR, help="Folder with linkedin_posts_*.csv files")
+    parser.add_argument('--modes', default=','.join(MODES), help="Comma-separated serving modes (flask, asgi)")
+    parser.add_argument('--endpoint', default='/evaluate-posts', help="Endpoint to drive")
+    parser.add_argument('--concurrency', default='1,16,64,256', help="Comma-separated concurrency levels")
+    parser.add_argument('--requests', type=int, default=256, help="Requests per mode and concurrency level")
+    parser.add_argument('--latency', default='lognormal:2000:0.3', help="Mock LLM latency (see MOCK_LLM_LATENCY)")
+    parser.add_argument('--output', help="Write the results to this JSON file")
+    parser.add_argument('--serve', choices=MODES, help=argparse.SUPPRESS)
+    parser.add_argument('--port', type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        serve(args.serve, args.port)
+        return
+
+    profiles = load_profiles(args.data_dir)
+    if not profiles:
+        print(f"❌ No linkedin_posts_*.csv files found in {args.data_dir}")
+        sys.exit(1)
+
+    modes = [mode.strip() for mode in args.modes.split(',') if mode.strip()]
+    unknown = [mode for mode in modes if mode not in MODES]
+    if unknown:
+        print(f"❌ Unknown modes: {', '.join(unknown)}. Expected any of: {', '.join(MODES)}")
+        sys.exit(1)
+    levels = [int(level) for level in args.concurrency.split(',')]
+    payloads = [json.dumps({'posts': posts}).encode('utf-8') for posts in profiles.values()]
+
+    print(f"\n📊 Driving {args.endpoint} over {len(payloads)} profiles (mock latency {args.latency})...")
+    runs = []
+    for mode in modes:
+        with ServerProcess(mode, args.latency) as server:
+            for concurrency in levels:
+                print(f"   ⏱️  {mode} x{concurrency}...")
+                runs.append(run_level(server, args.endpoint, payloads, concurrency, args.requests))
+
+    print("\n" + "=" * 104)
+    for run in runs:
+        print(f"{run['mode']:<6} x{run['concurrency']:<4} {run['throughput_rps']:>7} rps   "
+              f"p50 {run['latency_ms_p50']:>8}   p95 {run['latency_ms_p95']:>8}   p99 {run['latency_ms_p99']:>8} ms   "
+              f"rss {run['peak_rss_mib']} MiB   threads {run['peak_threads']}   errors {run['errors']}")
+    print("=" * 104 + "\n")
+
+    if args.output:
+        report = {
+            'started_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'python': platform.python_version(),
+            'profiles': len(payloads),
+            'endpoint': args.endpoint,
+            'mock_latency': args.latency,
+            'runs': runs
+        }
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+        print(f"💾 Results written to {args.output}")
+
+
+if __name__ == '__main__':
+    main()
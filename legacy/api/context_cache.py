@@ -0,0 +1,195 @@
+"""
+Context caching of a profile's condensed post corpus.
+
+The corpus is uploaded once as cached context, keyed by a hash of its
+content and model. Later analysis prompts reference it instead of resending
+the posts. Entries are tracked with their expiry. An entry close to expiry
+is recreated rather than used, and callers fall back to inline posts
+whenever no usable entry exists.
+
+Backends:
+    gemini  - google.generativeai.caching.CachedContent (server-side, billed at the cached rate)
+    local   - In-process stand-in that stitches the corpus in front of the prompt,
+              so the flow can be exercised offline or against a mock model
+"""
+
+import re
+import time
+import hashlib
+import datetime
+import threading
+from collections import Counter
+
+# Entries with less time left than this are recreated, so a prompt never races the expiry
+EXPIRY_MARGIN_SECONDS = 30
+
+# Status codes Gemini returns when cached content has expired or was deleted
+CACHE_MISS_STATUS_CODES = (403, 404)
+
+# A 400 is a miss only when it is about the cached content; any other 400
+# (bad schema, oversized prompt) would just fail again with the posts inline
+CACHE_MISS_400_MESSAGE = re.compile(r'cache.*(not found|expired|does not exist|deleted)', re.IGNORECASE)
+
+
+def corpus_key(model_name, corpus_text):
+    digest = hashlib.sha256()
+    digest.update(f"{model_name}|".encode('utf-8'))
+    digest.update(corpus_text.encode('utf-8'))
+    return digest.hexdigest()
+
+
+class ContextEntry:
+    """A cached corpus: backend handle, expiry and the text it holds."""
+
+    def __init__(self, key, name, expires_at, text, backend):
+        self.key = key
+        self.name = name
+        self.expires_at = expires_at
+        self.text = text
+        self.backend = backend
+
+    def seconds_left(self, now=None):
+        return self.expires_at - (now or time.time())
+
+    def prepare(self, registry, profile, prompt):
+        """Return the (model, prompt) pair that uses this cached context."""
+        return self.backend.prepare(self, registry, profile, prompt)
+
+
+class GeminiContextBackend:
+    """Server-side context caching through genai.caching.CachedContent."""
+
+    def create(self, model_name, text, ttl_seconds):
+        from google.generativeai import caching
+        cached = caching.CachedContent.create(
+            model=model_name if model_name.startswith('models/') else f"models/{model_name}",
+            display_name=f"linkedin-corpus-{hashlib.sha256(text.encode('utf-8')).hexdigest()[:12]}",
+            contents=[text],
+            ttl=datetime.timedelta(seconds=ttl_seconds)
+        )
+        return cached.name, cached.expire_time.timestamp()
+
+    def prepare(self, entry, registry, profile, prompt):
+        return registry.get_cached_model(entry.name, profile), prompt
+
+
+class LocalContextBackend:
+    """Offline stand-in: keeps the corpus in memory and prepends it to each prompt."""
+
+    def __init__(self):
+        self._counter = 0
+        self._lock = threading.Lock()
+
+    def create(self, model_name, text, ttl_seconds):
+        with self._lock:
+            self._counter += 1
+            name = f"local-cache/{self._counter}"
+        return name, time.time() + ttl_seconds
+
+    def prepare(self, entry, registry, profile, prompt):
+        return registry.get_model(profile), f"{entry.text}\n\n{prompt}"
+
+
+BACKENDS = {
+    'gemini': GeminiContextBackend,
+    'local': LocalContextBackend
+}
+
+
+class ContextCache:
+    """Creates, reuses and expires cached corpora keyed by content hash."""
+
+    def __init__(self, backend='gemini', ttl_seconds=600, min_tokens=1024, chars_per_token=4):
+        if backend not in BACKENDS:
+            raise ValueError(f"Unknown context cache backend '{backend}'. Expected any of: {', '.join(BACKENDS)}.")
+        self.backend_name = backend
+        self.backend = BACKENDS[backend]()
+        self.ttl_seconds = ttl_seconds
+        self.min_tokens = min_tokens
+        self.chars_per_token = chars_per_token
+        self._entries = {}
+        self._lock = threading.Lock()
+        self._creating = {}
+        self._counts = Counter()
+
+    def get_or_create(self, model_name, corpus_text):
+        """
+        Return a usable entry for the corpus, creating one if needed.
+
+        Returns None when the corpus is below the backend's minimum size or the
+        entry cannot be created, so the caller sends the posts inline instead.
+        """
+        if len(corpus_text) // self.chars_per_token < self.min_tokens:
+            self._count('too_small')
+            return None
+
+        key = corpus_key(model_name, corpus_text)
+        now = time.time()
+        with self._lock:
+            for stale_key in [k for k, e in self._entries.items() if k != key and e.seconds_left(now) <= 0]:
+                del self._entries[stale_key]
+            entry = self._entries.get(key)
+            if entry is not None and entry.seconds_left(now) > EXPIRY_MARGIN_SECONDS:
+                self._counts['hits'] += 1
+                return entry
+            if entry is not None:
+                self._counts['expired'] += 1
+                del self._entries[key]
+            # One creation per corpus at a time; concurrent analyses wait for it
+            creating = self._creating.get(key)
+            leader = creating is None
+            if leader:
+                creating = self._creating[key] = threading.Event()
+
+        if not leader:
+            creating.wait()
+            with self._lock:
+                entry = self._entries.get(key)
+                self._counts['hits' if entry is not None else 'fallbacks'] += 1
+            return entry
+
+        try:
+            name, expires_at = self.backend.create(model_name, corpus_text, self.ttl_seconds)
+            entry = ContextEntry(key, name, expires_at, corpus_text, self.backend)
+            with self._lock:
+                self._entries[key] = entry
+                self._counts['created'] += 1
+            return entry
+        except Exception as e:
+            print(f"⚠️  Context cache creation failed, sending posts inline: {e}")
+            self._count('fallbacks')
+            return None
+        finally:
+            with self._lock:
+                del self._creating[key]
+            creating.set()
+
+    def invalidate(self, entry):
+        """Forget an entry the backend no longer recognises."""
+        with self._lock:
+            if self._entries.get(entry.key) is entry:
+                del self._entries[entry.key]
+            self._counts['invalidated'] += 1
+
+    def is_cache_miss(self, exc):
+        """True if a call failed because the referenced cached content is gone."""
+        code = getattr(exc, 'code', None)
+        if code == 400:
+            return CACHE_MISS_400_MESSAGE.search(str(exc)) is not None
+        return isinstance(code, int) and code in CACHE_MISS_STATUS_CODES
+
+    def _count(self, event):
+        with self._lock:
+            self._counts[event] += 1
+
+    def stats(self):
+        now = time.time()
+        with self._lock:
+            return {
+                'backend': self.backend_name,
+                'entries': [
+                    {'name': entry.name, 'ttl_remaining_seconds': round(entry.seconds_left(now))}
+                    for entry in self._entries.values()
+                ],
+                **dict(self._counts)
+            }
@@ -0,0 +1,296 @@
+"""
+Resilient Gemini calls: per-call deadlines, retries and hedged requests.
+
+Every call gets an overall deadline. Each attempt's SDK timeout is capped by
+the time left before that deadline. Transient failures (429, 5xx, timeouts,
+dropped connections) are retried with exponential backoff and full jitter.
+With hedging enabled, a second identical request is sent when the first has
+run longer than the recent p95 latency for its profile, and whichever
+answers first wins. Counters for every path are kept so tail behaviour can be
+checked in /health and in batch summaries. call_async() runs the same policy
+for coroutine attempts in the ASGI mode, hedging with tasks instead of a pool.
+
+Settings (environment):
+    GEMINI_MAX_RETRIES            Retries after the first attempt (default 3)
+    GEMINI_BACKOFF_BASE_SECONDS   First backoff ceiling, doubled per retry (default 0.5)
+    GEMINI_BACKOFF_MAX_SECONDS    Largest backoff ceiling (default 8)
+    GEMINI_HEDGE                  Enable hedged requests (default false)
+    GEMINI_HEDGE_MIN_SAMPLES      Latencies needed before hedging a profile (default 20)
+    GEMINI_HEDGE_MIN_DELAY_SECONDS  Never hedge sooner than this (default 1)
+"""
+
+import os
+import time
+import random
+import asyncio
+import threading
+from collections import deque, Counter
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+RETRYABLE_STATUS_CODES = (429, 500, 502, 503, 504)
+
+# Successful latencies kept per profile for the p95 estimate
+LATENCY_WINDOW = 200
+
+
+class GeminiDeadlineExceeded(TimeoutError):
+    """Raised when a call cannot finish within its overall deadline."""
+
+
+def status_code(exc):
+    """HTTP status of a google.api_core error, or None for anything else."""
+    code = getattr(exc, 'code', None)
+    return code if isinstance(code, int) else None
+
+
+def is_retryable(exc):
+    """True for rate limits, server errors, timeouts and dropped connections."""
+    if status_code(exc) in RETRYABLE_STATUS_CODES:
+        return True
+    return isinstance(exc, (TimeoutError, ConnectionError))
+
+
+def _retry_reason(exc):
+    code = status_code(exc)
+    if code == 429:
+        return 'retries_429'
+    if code is not None and code >= 500:
+        return 'retries_5xx'
+    return 'retries_network'
+
+
+class CallPolicy:
+    """Retry and hedging settings; defaults come from the environment."""
+
+    def __init__(self, max_retries=None, backoff_base=None, backoff_max=None,
+                 hedge=None, hedge_min_samples=None, hedge_min_delay=None):
+        self.max_retries = max_retries if max_retries is not None else int(os.getenv('GEMINI_MAX_RETRIES', '3'))
+        self.backoff_base = backoff_base if backoff_base is not None else float(os.getenv('GEMINI_BACKOFF_BASE_SECONDS', '0.5'))
+        self.backoff_max = backoff_max if backoff_max is not None else float(os.getenv('GEMINI_BACKOFF_MAX_SECONDS', '8'))
+        self.hedge = hedge if hedge is not None else os.getenv('GEMINI_HEDGE', 'false').lower() in ('1', 'true', 'yes')
+        self.hedge_min_samples = hedge_min_samples if hedge_min_samples is not None else int(os.getenv('GEMINI_HEDGE_MIN_SAMPLES', '20'))
+        self.hedge_min_delay = hedge_min_delay if hedge_min_delay is not None else float(os.getenv('GEMINI_HEDGE_MIN_DELAY_SECONDS', '1'))
+
+    def backoff(self, retry_number):
+        """Full-jitter backoff: uniform between 0 and the capped exponential ceiling."""
+        ceiling = min(self.backoff_max, self.backoff_base * (2 ** retry_number))
+        return random.uniform(0, ceiling)
+
+
+class CallStats:
+    """Thread-safe counters for each call path plus recent latencies per profile."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counts = Counter()
+        self._latencies = {}
+
+    def incr(self, event, amount=1):
+        with self._lock:
+            self._counts[event] += amount
+
+    def observe(self, profile, seconds):
+        with self._lock:
+            self._latencies.setdefault(profile, deque(maxlen=LATENCY_WINDOW)).append(seconds)
+
+    def quantile(self, profile, q, min_samples=1):
+        """Latency quantile in seconds for a profile, or None with too few samples."""
+        with self._lock:
+            samples = sorted(self._latencies.get(profile, ()))
+        if len(samples) < max(1, min_samples):
+            return None
+        return samples[min(len(samples) - 1, int(q * len(samples)))]
+
+    def snapshot(self):
+        with self._lock:
+            counts = dict(self._counts)
+            profiles = list(self._latencies.keys())
+        p95 = {}
+        for profile in profiles:
+            value = self.quantile(profile, 0.95)
+            if value is not None:
+                p95[profile] = round(value * 1000)
+        return {**counts, 'p95_ms': p95}
+
+
+class ResilientCaller:
+    """Runs attempt functions under a deadline with retries and optional hedging."""
+
+    def __init__(self, policy=None, max_hedge_workers=32):
+        self.policy = policy or CallPolicy()
+        self.stats = CallStats()
+        self._max_hedge_workers = max_hedge_workers
+        self._hedge_pool = None
+        self._pool_lock = threading.Lock()
+
+    def hedge_delay(self, profile):
+        """Seconds to wait before hedging: the profile's p95, once enough samples exist."""
+        p95 = self.stats.quantile(profile, 0.95, self.policy.hedge_min_samples)
+        if p95 is None:
+            return None
+        return max(p95, self.policy.hedge_min_delay)
+
+    def call(self, attempt, profile='default', deadline=60.0, attempt_timeout=None, hedge=None):
+        """
+        Run attempt(timeout) until it succeeds, fails permanently or the deadline passes.
+
+        Args:
+            attempt: Callable taking the per-attempt timeout in seconds
+            profile: Latency bucket used for hedging decisions and stats
+            deadline: Overall budget in seconds, including backoff sleeps
+            attempt_timeout: Upper bound for a single attempt (defaults to the deadline)
+            hedge: Override the policy's hedging switch for this call
+
+        Raises:
+            GeminiDeadlineExceeded: If the deadline passes before a success
+            Exception: The last error, when it is not retryable or retries run out
+        """
+        hedge = self.policy.hedge if hedge is None else hedge
+        attempt_timeout = attempt_timeout or deadline
+        start = time.monotonic()
+        ends_at = start + deadline
+        self.stats.incr('calls')
+
+        for retry_number in range(self.policy.max_retries + 1):
+            remaining = ends_at - time.monotonic()
+            if remaining <= 0:
+                self.stats.incr('deadline_exceeded')
+                raise GeminiDeadlineExceeded(f"Gemini call timeout: {deadline:.1f}s deadline exceeded")
+            timeout = min(attempt_timeout, remaining)
+            try:
+                response = self._attempt(attempt, profile, timeout, hedge)
+            except Exception as e:
+                if not is_retryable(e) or retry_number == self.policy.max_retries:
+                    self.stats.incr('failed')
+                    raise
+                delay = self.policy.backoff(retry_number)
+                if time.monotonic() + delay >= ends_at:
+                    self.stats.incr('deadline_exceeded')
+                    raise GeminiDeadlineExceeded(f"Gemini call timeout: {deadline:.1f}s deadline exceeded") from e
+                self.stats.incr('retries')
+                self.stats.incr(_retry_reason(e))
+                print(f"⚠️  Gemini {profile} call failed ({e.__class__.__name__}), retrying in {delay:.1f}s")
+                time.sleep(delay)
+                continue
+            self.stats.incr('succeeded')
+            if retry_number:
+                self.stats.incr('succeeded_after_retry')
+            return response
+
+    async def call_async(self, attempt, profile='default', deadline=60.0, attempt_timeout=None, hedge=None):
+        """
+        Coroutine version of call(); attempt is an async function taking the per-attempt timeout.
+
+        Backoff waits with asyncio.sleep, so a retrying call holds no thread.
+        """
+        hedge = self.policy.hedge if hedge is None else hedge
+        attempt_timeout = attempt_timeout or deadline
+        start = time.monotonic()
+        ends_at = start + deadline
+        self.stats.incr('calls')
+
+        for retry_number in range(self.policy.max_retries + 1):
+            remaining = ends_at - time.monotonic()
+            if remaining <= 0:
+                self.stats.incr('deadline_exceeded')
+                raise GeminiDeadlineExceeded(f"Gemini call timeout: {deadline:.1f}s deadline exceeded")
+            timeout = min(attempt_timeout, remaining)
+            try:
+                response = await self._attempt_async(attempt, profile, timeout, hedge)
+            except Exception as e:
+                if not is_retryable(e) or retry_number == self.policy.max_retries:
+                    self.stats.incr('failed')
+                    raise
+                delay = self.policy.backoff(retry_number)
+                if time.monotonic() + delay >= ends_at:
+                    self.stats.incr('deadline_exceeded')
+                    raise GeminiDeadlineExceeded(f"Gemini call timeout: {deadline:.1f}s deadline exceeded") from e
+                self.stats.incr('retries')
+                self.stats.incr(_retry_reason(e))
+                print(f"⚠️  Gemini {profile} call failed ({e.__class__.__name__}), retrying in {delay:.1f}s")
+                await asyncio.sleep(delay)
+                continue
+            self.stats.incr('succeeded')
+            if retry_number:
+                self.stats.incr('succeeded_after_retry')
+            return response
+
+    def _attempt(self, attempt, profile, timeout, hedge):
+        delay = self.hedge_delay(profile) if hedge else None
+        started = time.monotonic()
+        if delay is None or delay >= timeout:
+            response = attempt(timeout)
+            self.stats.observe(profile, time.monotonic() - started)
+            return response
+
+        pool = self._get_hedge_pool()
+        primary = pool.submit(attempt, timeout)
+        done, _ = wait([primary], timeout=delay)
+        if done:
+            response = primary.result()
+            self.stats.observe(profile, time.monotonic() - started)
+            return response
+
+        self.stats.incr('hedges_fired')
+        hedged = pool.submit(attempt, timeout - delay)
+        pending = {primary, hedged}
+        last_error = None
+        while pending:
+            remaining = timeout - (time.monotonic() - started)
+            done, pending = wait(pending, timeout=max(0, remaining), return_when=FIRST_COMPLETED)
+            if not done:
+                raise GeminiDeadlineExceeded(f"Gemini call timeout: no hedged response within {timeout:.1f}s")
+            for future in done:
+                if future.exception() is None:
+                    if future is hedged:
+                        self.stats.incr('hedges_won')
+                    self.stats.observe(profile, time.monotonic() - started)
+                    return future.result()
+                last_error = future.exception()
+        raise last_error
+
+    async def _attempt_async(self, attempt, profile, timeout, hedge):
+        delay = self.hedge_delay(profile) if hedge else None
+        started = time.monotonic()
+        if delay is None or delay >= timeout:
+            response = await attempt(timeout)
+            self.stats.observe(profile, time.monotonic() - started)
+            return response
+
+        primary = asyncio.ensure_future(attempt(timeout))
+        done, _ = await asyncio.wait([primary], timeout=delay)
+        if done:
+            response = primary.result()
+            self.stats.observe(profile, time.monotonic() - started)
+            return response
+
+        self.stats.incr('hedges_fired')
+        hedged = asyncio.ensure_future(attempt(timeout - delay))
+        pending = {primary, hedged}
+        last_error = None
+        try:
+            while pending:
+                remaining = timeout - (time.monotonic() - started)
+                done, pending = await asyncio.wait(pending, timeout=max(0, remaining), return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    raise GeminiDeadlineExceeded(f"Gemini call timeout: no hedged response within {timeout:.1f}s")
+                for task in done:
+                    if task.exception() is None:
+                        if task is hedged:
+                            self.stats.incr('hedges_won')
+                        self.stats.observe(profile, time.monotonic() - started)
+                        return task.result()
+                    last_error = task.exception()
+            raise last_error
+        finally:
+            # Unlike pool threads, the losing request can be cancelled, which frees its rate limiter lease
+            for task in pending:
+                task.cancel()
+
+    def _get_hedge_pool(self):
+        with self._pool_lock:
+            if self._hedge_pool is None:
+                self._hedge_pool = ThreadPoolExecutor(
+                    max_workers=self._max_hedge_workers, thread_name_prefix='gemini-hedge'
+                )
+            return self._hedge_pool
@@ -0,0 +1,317 @@
+"""
+Shared Gemini client and model registry.
+
+Backend configuration and model construction happen once per process
+instead of once per call (or once per file in the batch extractors). Model
+objects are cached per settings profile so every call reuses the SDK's
+underlying client connection, and per-profile settings (model name,
+timeout, deadline, generation config) live in one place. Calls go through
+gemini_calls.ResilientCaller for deadlines, retries and hedging. Every
+attempt also needs a lease from the shared rate_limiter.RateLimiter first.
+With several API keys (key_pool.py) each attempt first leases the key with
+the most budget left, and model objects are cached per key and profile.
+Model objects come from a pluggable llm_backends backend (LLM_BACKEND), so
+the same paths run against an offline mock. generate_async() is the
+awaitable twin used by the ASGI mode (asgi_app.py).
+"""
+
+import os
+import copy
+import time
+import asyncio
+import threading
+
+from llm_backends import backend_from_env
+from gemini_calls import ResilientCaller
+from key_pool import key_pool_from_env
+from rate_limiter import limiter_from_env, estimate_call_tokens, usage_tokens
+
+DEFAULT_MODEL = 'gemini-2.5-flash-lite'
+
+
+def default_profiles():
+    """
+    Settings per call profile; unknown profiles fall back to 'default'.
+
+    'timeout' bounds one attempt and 'deadline' bounds the whole call including
+    retries. Read at registry creation so GEMINI_MODEL, GEMINI_TIMEOUT_SECONDS
+    and GEMINI_DEADLINE_SECONDS from .env apply.
+    """
+    model = os.getenv('GEMINI_MODEL', DEFAULT_MODEL)
+    timeout = float(os.getenv('GEMINI_TIMEOUT_SECONDS', '60'))
+    deadline = float(os.getenv('GEMINI_DEADLINE_SECONDS', str(timeout * 2)))
+    return {
+        'default': {'model': model, 'timeout': timeout, 'deadline': deadline, 'generation_config': {}},
+        'narrative': {'model': model, 'timeout': timeout, 'deadline': deadline, 'generation_config': {}},
+        'topics': {'model': model, 'timeout': timeout, 'deadline': deadline, 'generation_config': {}},
+        'evaluation': {'model': model, 'timeout': timeout * 1.5, 'deadline': deadline * 1.5, 'generation_config': {}},
+        'positioning': {'model': model, 'timeout': timeout, 'deadline': deadline, 'generation_config': {}},
+        'extraction': {'model': model, 'timeout': timeout, 'deadline': deadline, 'generation_config': {}},
+        'combined': {'model': model, 'timeout': timeout * 2, 'deadline': deadline * 2, 'generation_config': {}}
+    }
+
+
+class GeminiRegistry:
+    """Configures the LLM backend once and hands out cached model objects."""
+
+    def __init__(self, api_key=None, profiles=None, policy=None, limiter=None, backend=None, keys=None):
+        self.keys = keys if keys is not None else key_pool_from_env()
+        if api_key:
+            self.keys.add(api_key)
+        self.api_key = api_key or self.keys.primary
+        self.backend = backend if backend is not None else backend_from_env()
+        self.profiles = copy.deepcopy(profiles) if profiles else default_profiles()
+        self.caller = ResilientCaller(policy)
+        self.limiter = limiter if limiter is not None else limiter_from_env()
+        if self.limiter is not None:
+            for key in self.keys:
+                if key.rpm or key.tpm:
+                    self.limiter.set_limits(key.api_key, key.rpm, key.tpm)
+        self._models = {}
+        self._lock = threading.Lock()
+        self._configured_key = None
+
+    def configure(self, api_key=None):
+        """
+        Configure the backend for the primary key; repeated calls with the same key are no-ops.
+
+        A new key joins the key pool and becomes the primary key, which
+        context caches are created under.
+        """
+        with self._lock:
+            if api_key:
+                self.keys.add(api_key)
+                self.api_key = api_key
+            if not self.api_key or self._configured_key == self.api_key:
+                return
+            self.backend.configure(self.api_key)
+            self._configured_key = self.api_key
+            self._models.clear()
+
+    def is_configured(self):
+        """True if calls can be made: a key is set, or the backend needs none."""
+        return bool(self.api_key) or not self.backend.requires_api_key
+
+    def settings(self, profile='default'):
+        return self.profiles.get(profile, self.profiles['default'])
+
+    def model_name(self, profile='default'):
+        return self.settings(profile)['model']
+
+    def get_model(self, profile='default', api_key=None):
+        """Return the cached GenerativeModel for a profile and key (default the primary), building it on first use."""
+        self.configure()
+        api_key = api_key or self.api_key
+        with self._lock:
+            model = self._models.get((api_key, profile))
+            if model is None:
+                model = self._models[(api_key, profile)] = self.backend.model(profile, self.settings(profile), api_key)
+            return model
+
+    def get_cached_model(self, cached_content_name, profile='default'):
+        """Return a model bound to server-side cached content (see context_cache.py), under the primary key."""
+        self.configure()
+        with self._lock:
+            key = ('cached', cached_content_name, profile)
+            model = self._models.get(key)
+            if model is None:
+                model = self._models[key] = self.backend.cached_model(
+                    cached_content_name, profile, self.settings(profile), self.api_key
+                )
+            return model
+
+    def generate(self, prompt, profile='default', stream=False, deadline=None, hedge=None, cached_content=None, **kwargs):
+        """
+        Call generate_content with the profile's model, timeout and deadline.
+
+        Transient errors are retried within the deadline. Streaming calls only
+        retry opening the stream and are never hedged, since a chunk already
+        yielded cannot be taken back. Each attempt first waits for a rate
+        limiter lease; time spent queued counts against the attempt timeout.
+        Each attempt leases a key from the key pool first, so a retry after a
+        429 can move to another key. With cached_content (a
+        context_cache.ContextEntry) the prompt references the cached corpus
+        instead of carrying the posts, and every attempt uses the primary key
+        the cache was created under.
+        """
+        model = None
+        if cached_content is not None:
+            model, prompt = cached_content.prepare(self, profile, prompt)
+        settings = self.settings(profile)
+        request_options = kwargs.pop('request_options', None) or {}
+        attempt_timeout = request_options.get('timeout', settings['timeout'])
+        generation_config = kwargs.get('generation_config') or settings['generation_config'] or {}
+        estimated_tokens = estimate_call_tokens(prompt, generation_config.get('max_output_tokens'))
+
+        pinned_key = self.api_key if model is not None else None
+
+        def attempt(timeout):
+            started = time.monotonic()
+            key = self.keys.lease(estimated_tokens, self.limiter, pinned_key)
+            try:
+                lease = self.limiter.acquire(key.api_key, estimated_tokens, timeout=timeout) if self.limiter else None
+            except Exception:
+                self.keys.abandon(key)
+                raise
+            options = dict(request_options, timeout=max(1.0, timeout - (time.monotonic() - started)))
+            try:
+                key_model = model or self.get_model(profile, key.api_key)
+                response = key_model.generate_content(prompt, stream=stream, request_options=options, **kwargs)
+            except Exception as e:
+                self._release(lease)
+                self.keys.release(key, e)
+                raise
+            if stream:
+                return self._stream_with_lease(response, lease, key)
+            self._release(lease, usage_tokens(getattr(response, 'usage_metadata', None)))
+            self.keys.release(key)
+            return response
+
+        return self.caller.call(
+            attempt,
+            profile,
+            deadline=deadline or settings.get('deadline', attempt_timeout),
+            attempt_timeout=attempt_timeout,
+            hedge=False if stream else hedge
+        )
+
+    async def generate_async(self, prompt, profile='default', deadline=None, hedge=None, cached_content=None, **kwargs):
+        """
+        Await generate_content_async with the same timeouts, retries, hedging and rate limiting as generate().
+
+        No thread is held while the call, a rate limiter wait or a retry backoff
+        is pending. Streaming is not supported here; asgi_app.py serves the
+        streaming routes through the Flask app.
+        """
+        model = None
+        if cached_content is not None:
+            model, prompt = cached_content.prepare(self, profile, prompt)
+        settings = self.settings(profile)
+        request_options = kwargs.pop('request_options', None) or {}
+        attempt_timeout = request_options.get('timeout', settings['timeout'])
+        generation_config = kwargs.get('generation_config') or settings['generation_config'] or {}
+        estimated_tokens = estimate_call_tokens(prompt, generation_config.get('max_output_tokens'))
+
+        pinned_key = self.api_key if model is not None else None
+
+        async def attempt(timeout):
+            started = time.monotonic()
+            key = await self.keys.lease_async(estimated_tokens, self.limiter, pinned_key)
+            try:
+                lease = await self.limiter.acquire_async(key.api_key, estimated_tokens, timeout=timeout) if self.limiter else None
+            except BaseException:
+                self.keys.abandon(key)
+                raise
+            options = dict(request_options, timeout=max(1.0, timeout - (time.monotonic() - started)))
+            try:
+                key_model = model or self.get_model(profile, key.api_key)
+                response = await key_model.generate_content_async(prompt, request_options=options, **kwargs)
+            except BaseException as e:
+                # Includes cancellation of a losing hedge, which must give its lease back too
+                self.keys.release(key, e)
+                await asyncio.shield(self._release_async(lease))
+                raise
+            await self._release_async(lease, usage_tokens(getattr(response, 'usage_metadata', None)))
+            self.keys.release(key)
+            return response
+
+        return await self.caller.call_async(
+            attempt,
+            profile,
+            deadline=deadline or settings.get('deadline', attempt_timeout),
+            attempt_timeout=attempt_timeout,
+            hedge=hedge
+        )
+
+    def _release(self, lease, actual_tokens=None):
+        if lease is not None:
+            self.limiter.release(lease, actual_tokens)
+
+    async def _release_async(self, lease, actual_tokens=None):
+        if lease is not None:
+            await self.limiter.release_async(lease, actual_tokens)
+
+    def _stream_with_lease(self, chunks, lease, key):
+        """Yield stream chunks, holding the lease and the key until the stream ends."""
+        usage = None
+        error = None
+        try:
+            for chunk in chunks:
+                usage = getattr(chunk, 'usage_metadata', None) or usage
+                yield chunk
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            self._release(lease, usage_tokens(usage))
+            self.keys.release(key, error)
+
+    def limiter_stats(self):
+        """
+        Queue depth, in-flight calls and remaining RPM/TPM budget.
+
+        With several keys the counts and budgets are summed over the pool and
+        each key's own figures are listed under 'keys'.
+        """
+        if not self.limiter:
+            return None
+        if len(self.keys) < 2:
+            return self.limiter.stats(self.api_key)
+        by_key = {key.id: self.limiter.stats(key.api_key) for key in self.keys}
+        totals = {
+            field: sum(stats[field] for stats in by_key.values())
+            for field in ('in_flight', 'queue_depth', 'requests_available', 'tokens_available')
+        }
+        # The waiting and admission counters belong to this process's limiter, not to a key
+        local = next(iter(by_key.values()))
+        return {
+            **totals,
+            **{field: local[field] for field in ('waiting_here', 'admitted', 'queued', 'wait_seconds_total')},
+            'keys': {
+                key: {field: stats[field] for field in ('limits', 'in_flight', 'queue_depth', 'requests_available', 'tokens_available')}
+                for key, stats in by_key.items()
+            }
+        }
+
+    def key_stats(self):
+        """Keys in the pool, benched keys and per-key leases and outcomes."""
+        return self.keys.stats()
+
+    def backend_stats(self):
+        """Backend name, plus injected latency and failure counts for the mock."""
+        return self.backend.stats()
+
+    def call_stats(self):
+        """Counts of calls, retries, hedges and deadline misses, plus p95 latency per profile."""
+        return self.caller.stats.snapshot()
+
+    def warm_up(self, profiles=None):
+        """
+        Build model objects and open the client connections ahead of the first request, for every key.
+
+        Uses count_tokens, which does not spend generation quota.
+
+        Returns:
+            Warm-up time in milliseconds
+        """
+        start = time.perf_counter()
+        for api_key in [key.api_key for key in self.keys] or [self.api_key]:
+            for profile in profiles or self.profiles.keys():
+                self.get_model(profile, api_key)
+            self.get_model('default', api_key).count_tokens("warm-up")
+        return round((time.perf_counter() - start) * 1000)
+
+
+_registry = None
+_registry_lock = threading.Lock()
+
+
+def get_registry(api_key=None):
+    """Return the process-wide registry, configuring it with the key on first use."""
+    global _registry
+    with _registry_lock:
+        if _registry is None:
+            _registry = GeminiRegistry()
+    if api_key:
+        _registry.configure(api_key)
+    return _registry
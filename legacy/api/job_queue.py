@@ -0,0 +1,260 @@
+"""
+In-process job queue for long-running LLM analyses.
+
+Jobs are submitted with a kind and a JSON payload and run on a local worker
+pool; callers poll for status and result by job id. When a SQLite path is
+given, jobs (including their payloads) are persisted so queued and
+interrupted jobs are picked up again after a restart. Pending jobs are
+resumed on the queue's first use rather than at construction, so a process
+that only imports the app (such as the Werkzeug reloader's parent) never
+runs them. Finished jobs keep their result but not their payload, in memory
+or in SQLite.
+"""
+
+import json
+import time
+import uuid
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+JOB_QUEUED = 'queued'
+JOB_RUNNING = 'running'
+JOB_SUCCEEDED = 'succeeded'
+JOB_FAILED = 'failed'
+
+
+class JobQueue:
+    """Runs registered handlers on a worker pool and tracks job state."""
+
+    def __init__(self, handlers, max_workers=4, db_path=None, retention_seconds=24 * 3600):
+        """
+        Args:
+            handlers: Dict mapping job kind to a callable taking the payload
+            max_workers: Number of jobs that run at the same time
+            db_path: Optional SQLite file that makes jobs survive restarts
+            retention_seconds: How long finished jobs stay queryable
+        """
+        self.handlers = handlers
+        self.db_path = db_path
+        self.retention_seconds = retention_seconds
+        self._jobs = {}
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='analysis-job')
+        self._started = False
+
+        if self.db_path:
+            self._init_db()
+
+    def _start(self):
+        """Resume persisted jobs once, on first use in the serving process."""
+        with self._lock:
+            if self._started:
+                return
+            self._started = True
+        if self.db_path:
+            self._resume_pending_jobs()
+
+    # ------------------------------------------------------------------
+    # Persistence
+    # ------------------------------------------------------------------
+
+    def _connect(self):
+        return sqlite3.connect(self.db_path, timeout=30)
+
+    def _init_db(self):
+        with self._connect() as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS analysis_jobs (
+                    job_id TEXT PRIMARY KEY,
+                    kind TEXT NOT NULL,
+                    payload TEXT NOT NULL,
+                    status TEXT NOT NULL,
+                    result TEXT,
+                    error TEXT,
+                    created_at REAL NOT NULL,
+                    started_at REAL,
+                    finished_at REAL
+                )
+            """)
+
+    def _save(self, job):
+        if not self.db_path:
+            return
+        with self._connect() as conn:
+            conn.execute(
+                """
+                INSERT OR REPLACE INTO analysis_jobs
+                    (job_id, kind, payload, status, result, error, created_at, started_at, finished_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                """,
+                (
+                    job['job_id'], job['kind'], json.dumps(job['payload']), job['status'],
+                    json.dumps(job['result']) if job['result'] is not None else None,
+                    job['error'], job['created_at'], job['started_at'], job['finished_at']
+                )
+            )
+
+    def _update_status(self, job):
+        """
+        Persist status fields only, so the posts payload is written once per job.
+
+        A finished job's payload is cleared, since it is no longer needed once the result is stored.
+        """
+        if not self.db_path:
+            return
+        with self._connect() as conn:
+            conn.execute(
+                """
+                UPDATE analysis_jobs
+                SET status = ?, result = ?, error = ?, started_at = ?, finished_at = ?,
+                    payload = CASE WHEN ? IS NULL THEN payload ELSE 'null' END
+                WHERE job_id = ?
+                """,
+                (
+                    job['status'],
+                    json.dumps(job['result']) if job['result'] is not None else None,
+                    job['error'], job['started_at'], job['finished_at'], job['finished_at'], job['job_id']
+                )
+            )
+
+    def _load(self, job_id):
+        if not self.db_path:
+            return None
+        with self._connect() as conn:
+            row = conn.execute(
+                """
+                SELECT job_id, kind, payload, status, result, error, created_at, started_at, finished_at
+                FROM analysis_jobs WHERE job_id = ?
+                """,
+                (job_id,)
+            ).fetchone()
+        if row is None:
+            return None
+        return {
+            'job_id': row[0],
+            'kind': row[1],
+            'payload': json.loads(row[2]),
+            'status': row[3],
+            'result': json.loads(row[4]) if row[4] is not None else None,
+            'error': row[5],
+            'created_at': row[6],
+            'started_at': row[7],
+            'finished_at': row[8]
+        }
+
+    def _resume_pending_jobs(self):
+        """Re-enqueue jobs that were queued or running when the process stopped."""
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT job_id FROM analysis_jobs WHERE status IN (?, ?) ORDER BY created_at",
+                (JOB_QUEUED, JOB_RUNNING)
+            ).fetchall()
+        for (job_id,) in rows:
+            job = self._load(job_id)
+            job['status'] = JOB_QUEUED
+            job['started_at'] = None
+            with self._lock:
+                self._jobs[job_id] = job
+            self._update_status(job)
+            self._executor.submit(self._run, job_id)
+        if rows:
+            print(f"🔄 Resumed {len(rows)} pending analysis jobs")
+
+    def _prune(self):
+        """Drop finished jobs past their retention window."""
+        cutoff = time.time() - self.retention_seconds
+        with self._lock:
+            expired = [
+                job_id for job_id, job in self._jobs.items()
+                if job['finished_at'] is not None and job['finished_at'] < cutoff
+            ]
+            for job_id in expired:
+                del self._jobs[job_id]
+        if self.db_path:
+            with self._connect() as conn:
+                conn.execute(
+                    "DELETE FROM analysis_jobs WHERE finished_at IS NOT NULL AND finished_at < ?",
+                    (cutoff,)
+                )
+
+    # ------------------------------------------------------------------
+    # Public API
+    # ------------------------------------------------------------------
+
+    def submit(self, kind, payload):
+        """
+        Queue a job and return its id immediately.
+
+        Raises:
+            ValueError: If no handler is registered for the kind
+        """
+        if kind not in self.handlers:
+            raise ValueError(f"Unknown job kind '{kind}'. Expected any of: {', '.join(self.handlers.keys())}.")
+
+        self._start()
+        self._prune()
+        job = {
+            'job_id': uuid.uuid4().hex,
+            'kind': kind,
+            'payload': payload,
+            'status': JOB_QUEUED,
+            'result': None,
+            'error': None,
+            'created_at': time.time(),
+            'started_at': None,
+            'finished_at': None
+        }
+        with self._lock:
+            self._jobs[job['job_id']] = job
+        self._save(job)
+        self._executor.submit(self._run, job['job_id'])
+        return job['job_id']
+
+    def get(self, job_id):
+        """Return a public view of a job, or None if it is unknown."""
+        self._start()
+        with self._lock:
+            job = self._jobs.get(job_id)
+            job = dict(job) if job is not None else None
+        if job is None:
+            job = self._load(job_id)
+        if job is None:
+            return None
+        job.pop('payload', None)
+        return job
+
+    def queue_depth(self):
+        """Return counts of queued and running jobs."""
+        self._start()
+        with self._lock:
+            statuses = [job['status'] for job in self._jobs.values()]
+        return {
+            JOB_QUEUED: statuses.count(JOB_QUEUED),
+            JOB_RUNNING: statuses.count(JOB_RUNNING)
+        }
+
+    def _run(self, job_id):
+        with self._lock:
+            job = self._jobs[job_id]
+            job['status'] = JOB_RUNNING
+            job['started_at'] = time.time()
+        self._update_status(job)
+
+        status, result, error = JOB_SUCCEEDED, None, None
+        try:
+            result = self.handlers[job['kind']](job['payload'])
+            if isinstance(result, dict) and 'error' in result:
+                status, error = JOB_FAILED, result['error']
+        except Exception as e:
+            print(f"❌ Job {job_id} ({job['kind']}) failed: {e}")
+            status, error = JOB_FAILED, str(e)
+
+        with self._lock:
+            job['status'] = status
+            job['result'] = result
+            job['error'] = error
+            job['finished_at'] = time.time()
+            # The posts are only needed to run the job; the database copy covers a restart before this point
+            job.pop('payload', None)
+        self._update_status(job)
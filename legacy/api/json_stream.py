@@ -0,0 +1,154 @@
+"""
+Incremental JSON parser for streamed LLM responses.
+
+Text chunks are fed in as they arrive and every scalar value (string,
+number, boolean, null) is reported as soon as it is complete, together with
+its path inside the document, e.g. ("insights", 2) or
+("current_branding", "positioning_summary"). Anything before the first
+opening brace or bracket (such as a markdown code fence) and anything after
+the root value closes is ignored.
+"""
+
+import json
+
+_WHITESPACE = ' \t\r\n'
+_ESCAPES = {'"': '"', '\\': '\\', '/': '/', 'b': '\b', 'f': '\f', 'n': '\n', 'r': '\r', 't': '\t'}
+
+
+class IncrementalJSONParser:
+    """Push parser that emits (path, value) events for completed scalars."""
+
+    def __init__(self):
+        self.stack = []
+        self.started = False
+        self.done = False
+        self._in_string = False
+        self._string_is_key = False
+        self._escape = False
+        self._unicode = None
+        self._buffer = []
+        self._literal = []
+
+    def feed(self, chunk):
+        """
+        Consume the next piece of text.
+
+        Returns:
+            List of (path, value) tuples completed by this chunk
+        """
+        events = []
+        for char in chunk:
+            if self.done:
+                break
+            self._feed_char(char, events)
+        return events
+
+    def _path(self):
+        return tuple(frame['key'] if frame['kind'] == 'object' else frame['index'] for frame in self.stack)
+
+    def _emit(self, value, events):
+        if self.stack:
+            events.append((self._path(), value))
+
+    def _flush_literal(self, events):
+        if not self._literal:
+            return
+        text = ''.join(self._literal)
+        self._literal = []
+        try:
+            value = json.loads(text)
+        except ValueError:
+            value = text
+        self._emit(value, events)
+
+    def _feed_char(self, char, events):
+        if not self.started:
+            if char in '{[':
+                self.started = True
+                self._open(char)
+            return
+
+        if self._in_string:
+            self._feed_string_char(char, events)
+            return
+
+        if self._literal and (char in _WHITESPACE or char in ',}]'):
+            self._flush_literal(events)
+
+        if char in _WHITESPACE:
+            return
+        if char == '"':
+            top = self.stack[-1]
+            self._in_string = True
+            self._string_is_key = top['kind'] == 'object' and top['expect_key']
+            self._buffer = []
+        elif char in '{[':
+            self._open(char)
+        elif char in '}]':
+            self.stack.pop()
+            if not self.stack:
+                self.done = True
+        elif char == ':':
+            self.stack[-1]['expect_key'] = False
+        elif char == ',':
+            top = self.stack[-1]
+            if top['kind'] == 'object':
+                top['expect_key'] = True
+            else:
+                top['index'] += 1
+        else:
+            self._literal.append(char)
+
+    def _open(self, char):
+        self.stack.append({
+            'kind': 'object' if char == '{' else 'array',
+            'key': None,
+            'index': 0,
+            'expect_key': char == '{'
+        })
+
+    def _feed_string_char(self, char, events):
+        if self._unicode is not None:
+            self._unicode.append(char)
+            if len(self._unicode) == 4:
+                try:
+                    self._buffer.append(chr(int(''.join(self._unicode), 16)))
+                except ValueError:
+                    pass
+                self._unicode = None
+            return
+
+        if self._escape:
+            self._escape = False
+            if char == 'u':
+                self._unicode = []
+            else:
+                self._buffer.append(_ESCAPES.get(char, char))
+            return
+
+        if char == '\\':
+            self._escape = True
+        elif char == '"':
+            self._in_string = False
+            value = ''.join(self._buffer)
+            if any('\ud800' <= c <= '\udfff' for c in value):
+                # Recombine \uXXXX surrogate pairs (e.g. emoji) into single characters
+                value = value.encode('utf-16', 'surrogatepass').decode('utf-16', 'replace')
+            if self._string_is_key:
+                self.stack[-1]['key'] = value
+            else:
+                self._emit(value, events)
+        else:
+            self._buffer.append(char)
+
+
+def iter_leaves(value, path=()):
+    """Yield (path, value) for every scalar in an already-parsed document."""
+    if isinstance(value, dict):
+        for key, item in value.items():
+            yield from iter_leaves(item, path + (key,))
+    elif isinstance(value, list):
+        for index, item in enumerate(value):
+            yield from iter_leaves(item, path + (index,))
+    else:
+        yield path, value
@@ -0,0 +1,250 @@
+"""
+Pool of Gemini API keys with quota-aware rotation.
+
+One key's quota caps total throughput, so calls can be spread over several
+keys. Before each attempt GeminiRegistry leases a key from the pool. The pool
+picks the key with the most RPM/TPM budget left in the shared rate limiter
+(rate_limiter.py) and skips benched keys. A key that answers 429 several
+times in a row is benched for a while, and for twice as long each time it is
+benched again before a call on it succeeds. It comes back on its own. Every
+key gets its own SDK clients (llm_backends.GeminiBackend), so concurrent
+calls on different keys never go through the process-wide genai.configure()
+key. Bench state is kept per process; the budgets are shared through the
+limiter's SQLite file.
+
+Keys (first one set wins):
+    GEMINI_API_KEYS_FILE  JSON list of keys, or of {"key": ..., "rpm": ..., "tpm": ...}
+                          objects for keys on a different quota tier
+    GEMINI_API_KEYS       Comma-separated keys
+    GEMINI_API_KEY        A single key
+
+Settings (environment):
+    GEMINI_KEY_BENCH_AFTER_429    Consecutive 429s that bench a key (default 2)
+    GEMINI_KEY_BENCH_SECONDS      First bench, doubled on each repeat (default 60)
+    GEMINI_KEY_BENCH_MAX_SECONDS  Longest bench (default 900)
+"""
+
+import os
+import json
+import time
+import asyncio
+import threading
+from collections import Counter
+
+from gemini_calls import status_code
+from rate_limiter import key_id
+
+
+def load_keys_file(path):
+    """
+    Read key entries from a JSON keys file.
+
+    Returns:
+        List of (api_key, rpm or None, tpm or None)
+
+    Raises:
+        ValueError: If the file is not a list of keys or key objects
+    """
+    with open(path, 'r', encoding='utf-8') as f:
+        entries = json.load(f)
+    if not isinstance(entries, list):
+        raise ValueError(f"{path} must hold a JSON list of keys")
+
+    keys = []
+    for entry in entries:
+        if isinstance(entry, str):
+            keys.append((entry, None, None))
+        elif isinstance(entry, dict) and isinstance(entry.get('key'), str):
+            keys.append((entry['key'], entry.get('rpm'), entry.get('tpm')))
+        else:
+            raise ValueError(f"Invalid entry in {path}. Expected a key string or {{\"key\": ..., \"rpm\": ..., \"tpm\": ...}}.")
+    return keys
+
+
+def key_pool_from_env():
+    """
+    Build the pool from GEMINI_API_KEYS_FILE, GEMINI_API_KEYS or GEMINI_API_KEY.
+
+    Raises:
+        ValueError: If the keys file is malformed
+    """
+    path = os.getenv('GEMINI_API_KEYS_FILE')
+    if path:
+        keys = load_keys_file(path)
+    else:
+        listed = os.getenv('GEMINI_API_KEYS') or os.getenv('GEMINI_API_KEY') or ''
+        keys = [(key.strip(), None, None) for key in listed.split(',') if key.strip()]
+    return KeyPool(
+        keys,
+        bench_after=int(os.getenv('GEMINI_KEY_BENCH_AFTER_429', '2')),
+        bench_seconds=float(os.getenv('GEMINI_KEY_BENCH_SECONDS', '60')),
+        bench_max_seconds=float(os.getenv('GEMINI_KEY_BENCH_MAX_SECONDS', '900'))
+    )
+
+
+class PoolKey:
+    """One key in the pool: its quota overrides and this process's view of its health."""
+
+    def __init__(self, api_key, rpm=None, tpm=None):
+        self.api_key = api_key
+        self.id = key_id(api_key)
+        self.rpm = rpm
+        self.tpm = tpm
+        self.in_flight = 0
+        self.consecutive_429 = 0
+        self.benches = 0
+        self.benched_until = 0.0
+        self.counts = Counter()
+
+
+class KeyPool:
+    """Leases API keys by remaining budget and health; see the module docstring."""
+
+    def __init__(self, keys=(), bench_after=2, bench_seconds=60.0, bench_max_seconds=900.0):
+        self.bench_after = bench_after
+        self.bench_seconds = bench_seconds
+        self.bench_max_seconds = bench_max_seconds
+        self._keys = []
+        # Stands in for "no key" so keyless backends (the mock) go through the same paths
+        self._keyless = PoolKey(None)
+        self._turn = 0
+        self._lock = threading.Lock()
+        for entry in keys:
+            if isinstance(entry, tuple):
+                self.add(*entry)
+            else:
+                self.add(entry)
+
+    def __len__(self):
+        return len(self._keys)
+
+    def __iter__(self):
+        return iter(list(self._keys))
+
+    @property
+    def primary(self):
+        """The first key, used for context caching and the process-wide SDK configuration."""
+        return self._keys[0].api_key if self._keys else None
+
+    def add(self, api_key, rpm=None, tpm=None):
+        """Add a key unless it is already in the pool; returns its PoolKey."""
+        with self._lock:
+            for key in self._keys:
+                if key.api_key == api_key:
+                    return key
+            key = PoolKey(api_key, rpm, tpm)
+            self._keys.append(key)
+            return key
+
+    def lease(self, tokens=0, limiter=None, api_key=None):
+        """
+        Pick the key for one attempt and count it as in use until release().
+
+        Keys that are not benched come first, then keys with a free in-flight
+        slot, then the key with the most budget left after this call. Budget
+        is the smaller of the requests and tokens left as a share of the key's
+        per-minute limits, counting this process's calls on the key as spent.
+        When every key is benched, the one that is back soonest is used.
+
+        Args:
+            tokens: Estimated tokens of the call
+            limiter: rate_limiter.RateLimiter holding the budgets (None ranks by calls in flight)
+            api_key: Use this key instead of choosing one; cached content only exists under one key
+        """
+        return self._pick(self._budgets(limiter, api_key), tokens, limiter, api_key)
+
+    async def lease_async(self, tokens=0, limiter=None, api_key=None):
+        """Coroutine version of lease(); the budgets are read in a worker thread."""
+        budgets = await asyncio.to_thread(self._budgets, limiter, api_key)
+        return self._pick(budgets, tokens, limiter, api_key)
+
+    def _budgets(self, limiter, api_key):
+        if limiter is None or api_key is not None or len(self._keys) < 2:
+            return {}
+        return limiter.budgets([key.api_key for key in self])
+
+    def _pick(self, budgets, tokens, limiter, api_key):
+        now = time.monotonic()
+        with self._lock:
+            candidates = self._keys or [self._keyless]
+            if api_key is not None:
+                key = next((key for key in candidates if key.api_key == api_key), None) or self._keyless
+            else:
+                self._turn += 1
+                key = min(
+                    candidates,
+                    key=lambda key: self._rank(key, candidates, budgets.get(key.api_key), tokens, limiter, now)
+                )
+            key.in_flight += 1
+            key.counts['leases'] += 1
+            return key
+
+    def _rank(self, key, candidates, budget, tokens, limiter, now):
+        """Sort key for a candidate; smaller is better."""
+        benched = key.benched_until > now
+        # Rotate the starting point so ties spread over the keys
+        turn = (candidates.index(key) - self._turn) % len(candidates)
+        if budget is None:
+            return (benched, key.benched_until if benched else 0, False, 0.0, key.in_flight, turn)
+        requests, available, in_flight = budget
+        limits = limiter.limits(key.api_key)
+        busy = max(in_flight, key.in_flight) >= limits['max_in_flight']
+        share = min((requests - key.in_flight) / limits['rpm'], (available - tokens) / limits['tpm'])
+        return (benched, key.benched_until if benched else 0, busy, -share, key.in_flight, turn)
+
+    def release(self, key, error=None):
+        """
+        Record how an attempt on a leased key ended.
+
+        A 429 counts towards benching the key and a success clears its 429
+        streak and bench history. Other errors are counted but leave the key
+        in rotation, since 5xx and timeouts rarely come from one key's quota.
+        """
+        # Cancelled attempts (a hedge that lost) say nothing about the key
+        if error is not None and not isinstance(error, Exception):
+            self.abandon(key)
+            return
+        with self._lock:
+            key.in_flight -= 1
+            if error is None:
+                key.counts['succeeded'] += 1
+                key.consecutive_429 = 0
+                key.benches = 0
+            elif status_code(error) == 429:
+                key.counts['rate_limited'] += 1
+                key.consecutive_429 += 1
+                if key.consecutive_429 >= self.bench_after:
+                    self._bench(key)
+            else:
+                key.counts['failed'] += 1
+
+    def abandon(self, key):
+        """Give a key back without an outcome, when the attempt never reached Gemini."""
+        with self._lock:
+            key.in_flight -= 1
+
+    def _bench(self, key):
+        seconds = min(self.bench_max_seconds, self.bench_seconds * 2 ** key.benches)
+        key.benched_until = time.monotonic() + seconds
+        key.benches += 1
+        key.consecutive_429 = 0
+        key.counts['benched'] += 1
+        print(f"⏸️  Gemini key {key.id} benched for {seconds:.0f}s after repeated 429s")
+
+    def stats(self):
+        """Key count, benched keys and per-key calls in flight and outcomes, by non-secret key id."""
+        now = time.monotonic()
+        with self._lock:
+            keys = {
+                key.id: {
+                    'in_flight': key.in_flight,
+                    'benched_seconds_left': round(max(0.0, key.benched_until - now), 1),
+                    **dict(key.counts)
+                }
+                for key in self._keys or [self._keyless]
+            }
+        return {
+            'keys': len(self._keys),
+            'benched': sum(1 for stats in keys.values() if stats['benched_seconds_left'] > 0),
+            'by_key': keys
+        }
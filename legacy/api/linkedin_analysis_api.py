@@ -6,10 +6,31 @@ topic analysis, post evaluation, and positioning analysis for LinkedIn content.
 
 import os
 import json
-from flask import Flask, request, jsonify
+import time
+import asyncio
+import functools
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from flask import Flask, Response, request, jsonify, g, stream_with_context
+from flask.json.provider import DefaultJSONProvider
 from flask_cors import CORS
 from dotenv import load_dotenv
-import google.generativeai as genai
+from gemini_client import get_registry
+from single_flight import SingleFlight, payload_key
+from result_cache import ResultCache, PostLabelCache, make_cache_key, make_post_key, DEFAULT_CACHE_PATH
+from job_queue import JobQueue
+from json_stream import IncrementalJSONParser, iter_leaves
+from llm_json import decode_llm_json, default_for
+from analysis_schemas import ANALYSIS_SCHEMAS, combined_schema
+from post_selection import select_posts
+from post_stats import topic_stats as compute_topic_stats, engagement_breakdown
+from map_reduce import chunk_indices, chunk_stats, run_map
+from topic_clustering import TOPIC_VOCABULARY, tag_posts
+from topic_classifier import TopicClassifier, DEFAULT_MODEL_PATH as DEFAULT_TOPIC_CLASSIFIER_PATH
+from context_cache import ContextCache
+from metrics import MetricsRegistry, CONTENT_TYPE as METRICS_CONTENT_TYPE
+from prompt_encoding import encode_posts, ENCODERS, DEFAULT_ENCODING, CACHED_CONTEXT, FIELD_OVERHEAD_TOKENS
+from post_frame import PostFrame, NARRATIVE_FIELDS, TOPIC_FIELDS, EVALUATION_FIELDS, POSITIONING_FIELDS
 
 # Load environment variables
 load_dotenv()
@@ -18,53 +39,479 @@ load_dotenv()
 app = Flask(__name__)
 CORS(app)  # Enable CORS for frontend requests
 
+# Prometheus metrics served at /metrics; stage timings separate our own work from time waiting on Gemini
+metrics = MetricsRegistry()
+HTTP_REQUESTS = metrics.counter(
+    'linkedin_api_http_requests_total', 'HTTP requests by route, method and status', ('route', 'method', 'status')
+)
+HTTP_LATENCY = metrics.histogram(
+    'linkedin_api_http_request_duration_seconds', 'HTTP request latency by route', ('route',)
+)
+HTTP_IN_FLIGHT = metrics.gauge(
+    'linkedin_api_http_requests_in_flight', 'HTTP requests currently being handled', ('route',)
+)
+STAGE_SECONDS = metrics.histogram(
+    'linkedin_api_stage_duration_seconds',
+    'Time per handling stage: parse, condense, prompt_build, gemini_wait, json_decode', ('stage', 'analysis')
+)
+GEMINI_TOKENS = metrics.counter(
+    'linkedin_api_gemini_tokens_total', 'Gemini tokens reported in usage metadata', ('profile', 'kind')
+)
+GEMINI_IN_FLIGHT = metrics.gauge(
+    'linkedin_api_gemini_calls_in_flight', 'Gemini calls currently running, retries included', ('profile',)
+)
+CACHE_LOOKUPS = metrics.counter(
+    'linkedin_api_cache_lookups_total', 'Result and post label cache lookups', ('cache', 'result')
+)
+TOPIC_CLASSIFIER_POSTS = metrics.counter(
+    'linkedin_api_topic_classifier_posts_total', 'Posts scored by the local topic classifier', ('result',)
+)
+
+class TimedJSONProvider(DefaultJSONProvider):
+    """Flask JSON provider that records request payload parsing as the 'parse' stage."""
+    
+    def loads(self, s, **kwargs):
+        with STAGE_SECONDS.time(stage='parse', analysis='request'):
+            return super().loads(s, **kwargs)
+
+app.json = TimedJSONProvider(app)
+
 # Configure Gemini
 GEMINI_API_KEY = os.getenv('GEMINI_API_KEY')
-if not GEMINI_API_KEY:
+
+# Shared registry: configures the SDK once and reuses model objects across calls.
+# Calls rotate over every key in GEMINI_API_KEYS / GEMINI_API_KEYS_FILE (see key_pool.py)
+gemini = get_registry(GEMINI_API_KEY)
+if not gemini.is_configured():
     print("⚠️  WARNING: GEMINI_API_KEY not found in .env file")
-else:
-    genai.configure(api_key=GEMINI_API_KEY)
 
-def generate_narrative_insights(posts_data):
+# Identical prompts already in flight share one Gemini call instead of each paying for it
+SINGLE_FLIGHT_ENABLED = os.getenv('SINGLE_FLIGHT_ENABLED', 'true').lower() not in ('0', 'false', 'no')
+single_flight = SingleFlight()
+
+# Serializer for the post rows embedded in prompts (json, json-min or tsv)
+PROMPT_ENCODING = os.getenv('PROMPT_ENCODING', DEFAULT_ENCODING)
+if PROMPT_ENCODING not in ENCODERS:
+    print(f"⚠️  WARNING: Unknown PROMPT_ENCODING '{PROMPT_ENCODING}'. Expected any of: {', '.join(ENCODERS)}. Using {DEFAULT_ENCODING}.")
+    PROMPT_ENCODING = DEFAULT_ENCODING
+
+# Ask Gemini for schema-constrained JSON output (see analysis_schemas.py)
+STRUCTURED_OUTPUT = os.getenv('GEMINI_STRUCTURED_OUTPUT', 'true').lower() not in ('0', 'false', 'no')
+
+# Bump a version whenever its prompt template changes so stale cache entries are not served
+PROMPT_VERSIONS = {
+    'narrative': 'v2',
+    'topics': 'v4',
+    'evaluation': 'v2',
+    'positioning': 'v2',
+    'chunk_digest': 'v1',
+    'combined': 'v1'
+}
+
+# Configure result cache
+CACHE_ENABLED = os.getenv('ANALYSIS_CACHE_ENABLED', 'true').lower() not in ('0', 'false', 'no')
+result_cache = ResultCache(
+    path=os.getenv('ANALYSIS_CACHE_PATH', DEFAULT_CACHE_PATH),
+    ttl_seconds=int(os.getenv('ANALYSIS_CACHE_TTL_SECONDS', str(7 * 24 * 3600))),
+    max_entries=int(os.getenv('ANALYSIS_CACHE_MAX_ENTRIES', '2000'))
+) if CACHE_ENABLED else None
+
+# Per-post topic labels keyed by a hash of the post content; bump the version when tagging rules change
+TOPIC_LABEL_VERSION = 'v1'
+post_label_cache = PostLabelCache(
+    path=os.getenv('ANALYSIS_CACHE_PATH', DEFAULT_CACHE_PATH),
+    ttl_seconds=int(os.getenv('POST_LABEL_CACHE_TTL_SECONDS', str(30 * 24 * 3600)))
+) if CACHE_ENABLED else None
+
+# Local topic classifier distilled from cached labels (train_topic_classifier.py); posts it is
+# confident about are labelled in-process and only the rest go to Gemini
+TOPIC_CLASSIFIER_ENABLED = os.getenv('TOPIC_CLASSIFIER_ENABLED', 'true').lower() not in ('0', 'false', 'no')
+TOPIC_CLASSIFIER_PATH = os.getenv('TOPIC_CLASSIFIER_PATH', DEFAULT_TOPIC_CLASSIFIER_PATH)
+
+def load_topic_classifier():
+    """The trained classifier, or None when it is disabled, not trained yet or unreadable."""
+    if not TOPIC_CLASSIFIER_ENABLED or not os.path.exists(TOPIC_CLASSIFIER_PATH):
+        return None
+    confidence = os.getenv('TOPIC_CLASSIFIER_CONFIDENCE')
+    try:
+        return TopicClassifier.load(TOPIC_CLASSIFIER_PATH, float(confidence) if confidence else None)
+    except Exception as e:
+        print(f"⚠️  Could not load topic classifier from {TOPIC_CLASSIFIER_PATH}: {e}")
+        return None
+
+topic_classifier = load_topic_classifier()
+
+# Context caching: upload a profile's shared corpus once and reference it from later prompts.
+# CONTEXT_CACHE_BACKEND=local is an in-process stand-in for offline runs.
+CONTEXT_CACHE_ENABLED = os.getenv('CONTEXT_CACHE_ENABLED', 'false').lower() in ('1', 'true', 'yes')
+context_cache = ContextCache(
+    backend=os.getenv('CONTEXT_CACHE_BACKEND', 'gemini'),
+    ttl_seconds=int(os.getenv('CONTEXT_CACHE_TTL_SECONDS', '600')),
+    min_tokens=int(os.getenv('CONTEXT_CACHE_MIN_TOKENS', '1024'))
+) if CONTEXT_CACHE_ENABLED else None
+
+# Analyses whose prompts can reference the cached corpus (topics only sends posts without cached labels)
+CONTEXT_CACHE_ANALYSES = ('narrative', 'evaluation', 'positioning')
+
+# Topic engine: "llm" (Gemini), "local" (offline clustering, see topic_clustering.py) or "auto"
+# (Gemini, falling back to local when the rate limiter is queueing, the call errors or it runs too long)
+TOPIC_ENGINES = ('llm', 'local', 'auto')
+TOPICS_ENGINE = os.getenv('TOPICS_ENGINE', 'llm')
+TOPICS_AUTO_TIMEOUT_SECONDS = float(os.getenv('TOPICS_AUTO_TIMEOUT_SECONDS', '20'))
+# Separate from analysis_executor so an auto topics run inside /analyze-all cannot wait on its own pool
+topics_llm_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix='topics-llm')
+
+# Configure fan-out for /analyze-all
+ANALYZE_ALL_MAX_WORKERS = int(os.getenv('ANALYZE_ALL_MAX_WORKERS', '8'))
+ANALYSIS_TIMEOUT_SECONDS = float(os.getenv('ANALYSIS_TIMEOUT_SECONDS', '60'))
+analysis_executor = ThreadPoolExecutor(max_workers=ANALYZE_ALL_MAX_WORKERS, thread_name_prefix='analysis')
+
+def token_budget(analysis, default):
+    """Read an analysis' prompt token budget from e.g. NARRATIVE_TOKEN_BUDGET."""
+    return int(os.getenv(f'{analysis.upper()}_TOKEN_BUDGET', str(default)))
+
+# Fields, approximate token budget for the post rows and longest excerpt per prompt
+CONDENSE_SETTINGS = {
+    'narrative': {'fields': NARRATIVE_FIELDS, 'token_budget': token_budget('narrative', 5000), 'max_content_chars': 400},
+    # Example posts that accompany the local statistics table (see NARRATIVE_LOCAL_STATS)
+    'narrative_examples': {'fields': NARRATIVE_FIELDS, 'token_budget': token_budget('narrative_examples', 1500), 'max_content_chars': 300},
+    'topics': {'fields': TOPIC_FIELDS, 'token_budget': token_budget('topics', 7000), 'max_content_chars': 500},
+    'evaluation': {'fields': EVALUATION_FIELDS, 'token_budget': token_budget('evaluation', 7000), 'max_content_chars': 1000},
+    'positioning': {'fields': POSITIONING_FIELDS, 'token_budget': token_budget('positioning', 7000), 'max_content_chars': 700},
+    # One corpus for all four sections: every field any analysis needs, with evaluation's content length
+    'combined': {'fields': POSITIONING_FIELDS, 'token_budget': token_budget('combined', 9000), 'max_content_chars': 1000}
+}
+
+# Narrative prompts carry engagement statistics over every post plus a few examples instead of as many posts as fit
+NARRATIVE_LOCAL_STATS = os.getenv('NARRATIVE_LOCAL_STATS', 'true').lower() not in ('0', 'false', 'no')
+
+# Segments smaller than this are too noisy for the model to draw conclusions from
+MIN_SEGMENT_POSTS = 3
+
+# Map-reduce mode: full history in chunks summarised concurrently, then one reduce prompt
+MAP_REDUCE_CHUNK_SIZE = int(os.getenv('MAP_REDUCE_CHUNK_SIZE', '50'))
+MAP_REDUCE_MAX_WORKERS = int(os.getenv('MAP_REDUCE_MAX_WORKERS', '8'))
+MAP_REDUCE_CONTENT_CHARS = int(os.getenv('MAP_REDUCE_CONTENT_CHARS', '400'))
+
+def condense_posts(analysis, posts_data, encoding=PROMPT_ENCODING):
     """
-    Generate human-friendly narrative insights from posts data.
+    Condense posts for one analysis prompt, highest engagement first.
+    
+    Posts are packed into the analysis' token budget, covering top and bottom
+    engagement, every post type and the most recent posts.
     
     Args:
-        posts_data: List of post objects with content, engagement metrics, images, etc.
+        analysis: Key of CONDENSE_SETTINGS
+        posts_data: List of post objects or a PostFrame
+        encoding: Prompt encoding the rows will be serialized with
+    """
+    settings = CONDENSE_SETTINGS[analysis]
+    with STAGE_SECONDS.time(stage='condense', analysis=analysis):
+        frame = PostFrame.coerce(posts_data)
+        indices, content_chars = select_posts(
+            frame, settings['token_budget'], settings['fields'], settings['max_content_chars'],
+            field_overhead_tokens=FIELD_OVERHEAD_TOKENS[encoding]
+        )
+        return frame.condense(settings['fields'], indices=indices, content_chars=content_chars)
+
+def decode_analysis_response(analysis, response_text, schema=None, report=None):
+    """
+    Decode an analysis response and conform it to the analysis schema.
+    
+    Malformed JSON is repaired and missing fields are defaulted instead of failing
+    the request, which would otherwise mean a full re-generation.
+    
+    Args:
+        analysis: Analysis name, used for the schema lookup and log lines
+        response_text: Raw Gemini response text
+        schema: Schema to use instead of ANALYSIS_SCHEMAS[analysis]
+        report: Optional dict that receives the decode report (repaired, missing and coerced paths)
     
     Returns:
-        Dictionary with narrative insights
+        Tuple of (result, complete) where complete is False if any field had to be defaulted
+    """
+    with STAGE_SECONDS.time(stage='json_decode', analysis=analysis):
+        result, decoded = decode_llm_json(response_text, schema or ANALYSIS_SCHEMAS[analysis])
+    if report is not None:
+        report.update(decoded)
+    if decoded['repaired']:
+        print(f"⚠️  Repaired malformed JSON in {analysis} response")
+    if decoded['missing']:
+        print(f"⚠️  Defaulted missing {analysis} fields: {', '.join(decoded['missing'][:10])}")
+    if decoded['coerced']:
+        print(f"⚠️  Coerced {analysis} fields: {', '.join(decoded['coerced'][:10])}")
+    return result, not decoded['missing']
+
+def structured_output_config(analysis, schema=None):
+    """Generation config asking Gemini for schema-constrained JSON, or None when disabled."""
+    schema = schema or ANALYSIS_SCHEMAS.get(analysis)
+    if not STRUCTURED_OUTPUT or schema is None:
+        return None
+    return {
+        'response_mime_type': 'application/json',
+        'response_schema': schema
+    }
+
+def generate_content(prompt, profile='default', schema=None, context=None):
     """
+    Send a prompt to Gemini; the registry's rate limiter caps RPM, TPM and calls in flight.
     
-    if not GEMINI_API_KEY:
-        return {
-            "error": "GEMINI_API_KEY not configured. Please add it to your .env file."
-        }
+    Concurrent calls with the same profile, model and prompt are coalesced into one request.
+    The response schema defaults to the profile's entry in ANALYSIS_SCHEMAS. With a
+    context_cache entry the prompt is sent against that cached corpus.
+    """
+    def call():
+        with GEMINI_IN_FLIGHT.track(profile=profile):
+            response = gemini.generate(
+                prompt, profile, cached_content=context, generation_config=structured_output_config(profile, schema)
+            )
+        record_token_usage(profile, getattr(response, 'usage_metadata', None))
+        return response
     
-    # Prepare condensed data for LLM (to stay within token limits)
-    condensed_posts = []
-    for idx, post in enumerate(posts_data[:50]):  # Limit to 50 most recent posts
-        condensed_posts.append({
-            'id': idx,
-            'content': post.get('postContent', '')[:300],  # First 300 chars
-            'likes': post.get('likeCount', 0),
-            'comments': post.get('commentCount', 0),
-            'reposts': post.get('repostCount', 0),
-            'engagement': post.get('likeCount', 0) + post.get('commentCount', 0) + post.get('repostCount', 0),
-            'has_image': bool(post.get('imgUrl')),
-            'type': post.get('type', 'Text'),
-            'date': post.get('postTimestamp', post.get('postDate', ''))
-        })
+    with STAGE_SECONDS.time(stage='gemini_wait', analysis=profile):
+        if not SINGLE_FLIGHT_ENABLED:
+            return call()
+        context_name = context.name if context is not None else ''
+        response, shared = single_flight.do(payload_key(profile, gemini.model_name(profile), context_name, prompt), call)
+    if shared:
+        print(f"🔗 Reused an identical in-flight {profile} call")
+    return response
+
+async def generate_content_async(prompt, profile='default', schema=None, context=None):
+    """generate_content for the ASGI mode (asgi_app.py): the Gemini call is awaited instead of holding a thread."""
+    async def call():
+        with GEMINI_IN_FLIGHT.track(profile=profile):
+            response = await gemini.generate_async(
+                prompt, profile, cached_content=context, generation_config=structured_output_config(profile, schema)
+            )
+        record_token_usage(profile, getattr(response, 'usage_metadata', None))
+        return response
     
-    # Sort by engagement to help LLM identify patterns
-    condensed_posts.sort(key=lambda x: x['engagement'], reverse=True)
+    with STAGE_SECONDS.time(stage='gemini_wait', analysis=profile):
+        if not SINGLE_FLIGHT_ENABLED:
+            return await call()
+        context_name = context.name if context is not None else ''
+        response, shared = await single_flight.do_async(payload_key(profile, gemini.model_name(profile), context_name, prompt), call)
+    if shared:
+        print(f"🔗 Reused an identical in-flight {profile} call")
+    return response
+
+def gemini_request(prompt, profile='default', schema=None, context=None):
+    """What analysis step generators yield: the generate_content arguments of one Gemini call."""
+    return {'prompt': prompt, 'profile': profile, 'schema': schema, 'context': context}
+
+def advance_steps(steps, response=None, error=None):
+    """
+    Resume an analysis step generator with a Gemini response, or throw the call's error into it.
     
-    prompt = f"""
-You are analyzing {len(condensed_posts)} LinkedIn posts to generate narrative insights that read like observations from a friend or colleague.
+    Returns:
+        Tuple of (done, next gemini_request or the analysis result when done)
+    """
+    try:
+        return False, (steps.throw(error) if error is not None else steps.send(response))
+    except StopIteration as finished:
+        return True, finished.value
 
-Here are the posts with their engagement data:
+def run_steps(steps):
+    """
+    Run an analysis step generator, making its Gemini calls with generate_content.
+    
+    Each analysis is written once as a generator that yields gemini_request()
+    dicts and receives the responses. This driver serves the Flask routes;
+    run_steps_async serves the ASGI ones.
+    """
+    response, error = None, None
+    while True:
+        done, value = advance_steps(steps, response, error)
+        if done:
+            return value
+        try:
+            response, error = generate_content(**value), None
+        except Exception as e:
+            response, error = None, e
 
-{json.dumps(condensed_posts, indent=2)}
+async def run_steps_async(steps):
+    """
+    Run an analysis step generator with awaited Gemini calls.
+    
+    The local work between calls (condensing, cache lookups, decoding) runs
+    in the default executor, so the event loop stays free and no thread is
+    held while waiting on Gemini.
+    """
+    response, error = None, None
+    while True:
+        done, value = await asyncio.to_thread(advance_steps, steps, response, error)
+        if done:
+            return value
+        try:
+            response, error = await generate_content_async(**value), None
+        except Exception as e:
+            response, error = None, e
+
+def generate_content_stream(prompt, profile='default'):
+    """Yield Gemini response text chunk by chunk; gemini_wait covers the whole stream."""
+    usage = None
+    with STAGE_SECONDS.time(stage='gemini_wait', analysis=profile), GEMINI_IN_FLIGHT.track(profile=profile):
+        for chunk in gemini.generate(prompt, profile, stream=True, generation_config=structured_output_config(profile)):
+            usage = getattr(chunk, 'usage_metadata', None) or usage
+            if chunk.parts:
+                yield chunk.text
+    record_token_usage(profile, usage)
+
+def record_token_usage(profile, usage):
+    """Add a response's usage metadata to the token counters."""
+    if usage is None:
+        return
+    GEMINI_TOKENS.inc(getattr(usage, 'prompt_token_count', 0) or 0, profile=profile, kind='input')
+    GEMINI_TOKENS.inc(getattr(usage, 'candidates_token_count', 0) or 0, profile=profile, kind='output')
+    GEMINI_TOKENS.inc(getattr(usage, 'cached_content_token_count', 0) or 0, profile=profile, kind='cached')
+
+def local_stats(analysis, posts_data):
+    """Engagement breakdown over every post for analyses whose prompt carries one, otherwise None."""
+    if analysis != 'narrative' or not NARRATIVE_LOCAL_STATS:
+        return None
+    return engagement_breakdown(PostFrame.coerce(posts_data))
+
+def prompt_payload(condensed_posts, stats=None):
+    """What a prompt is built from, for result cache keys."""
+    return condensed_posts if stats is None else {'posts': condensed_posts, 'stats': stats}
+
+def analysis_prompt_rows(analysis, posts_data, stats=None):
+    """
+    Rows and encoding an analysis prompt is built from.
+    
+    Prompts carrying local statistics only need a few example posts. With
+    context caching on, the other supported analyses share one corpus (the
+    combined condensation) so a single cached upload serves all of them.
+    """
+    if stats is not None:
+        return condense_posts(f"{analysis}_examples", posts_data), PROMPT_ENCODING
+    if context_cache is not None and analysis in CONTEXT_CACHE_ANALYSES:
+        return condense_posts('combined', posts_data), CACHED_CONTEXT
+    return condense_posts(analysis, posts_data), PROMPT_ENCODING
+
+def corpus_context_text(condensed_posts):
+    """Text uploaded as cached context for a shared corpus."""
+    return f"Here are the LinkedIn posts to analyze, with their engagement data:\n\n{encode_posts(condensed_posts, PROMPT_ENCODING)}"
+
+def generate_analysis(analysis, build_prompt, condensed_posts, encoding=PROMPT_ENCODING):
+    """
+    Step generator for an analysis call, referencing the cached corpus when the rows came from analysis_prompt_rows.
+    
+    Falls back to sending the same rows inline when no cached context can be
+    created, or when Gemini reports that the cached content has expired.
+    Use with yield from; returns the Gemini response.
+    """
+    if encoding == CACHED_CONTEXT:
+        context = context_cache.get_or_create(gemini.model_name(analysis), corpus_context_text(condensed_posts))
+        if context is not None:
+            try:
+                return (yield gemini_request(build_prompt(condensed_posts, CACHED_CONTEXT), analysis, context=context))
+            except Exception as e:
+                if not context_cache.is_cache_miss(e):
+                    raise
+                context_cache.invalidate(context)
+                print(f"⚠️  Cached context for {analysis} is gone, sending posts inline: {e}")
+        encoding = PROMPT_ENCODING
+    return (yield gemini_request(build_prompt(condensed_posts, encoding), analysis))
+
+def get_cached_result(analysis, condensed_posts, encoding=PROMPT_ENCODING):
+    """
+    Look up a previous result for the same condensed payload.
+    
+    Returns:
+        Tuple of (cache_key, cached result or None)
+    """
+    prompt_version = f"{PROMPT_VERSIONS[analysis]}+{encoding}"
+    cache_key = make_cache_key(analysis, prompt_version, gemini.model_name(analysis), condensed_posts)
+    if result_cache is None:
+        return cache_key, None
+    
+    try:
+        cached = result_cache.get(cache_key)
+    except Exception as e:
+        print(f"⚠️  Cache lookup failed: {e}")
+        return cache_key, None
+    
+    CACHE_LOOKUPS.inc(cache='result', result='hit' if cached is not None else 'miss')
+    if cached is not None:
+        print(f"⚡ Serving {analysis} analysis from cache")
+        cached['cached'] = True
+    return cache_key, cached
+
+def store_cached_result(cache_key, analysis, result, cacheable=True):
+    """
+    Persist a successful result and mark it as freshly generated.
+    
+    Results with defaulted fields are returned but not cached, so the next request retries.
+    """
+    if result_cache is not None and cacheable:
+        try:
+            result_cache.set(cache_key, analysis, result)
+        except Exception as e:
+            print(f"⚠️  Cache write failed: {e}")
+    result['cached'] = False
+    return result
+
+def prompt_posts_section(condensed_posts, encoding=PROMPT_ENCODING, digests=None):
+    """Posts block of an analysis prompt, or the chunk digests when reducing a map-reduce run."""
+    if digests is None:
+        return f"Here are the posts with their engagement data:\n\n{encode_posts(condensed_posts, encoding)}"
+    return (
+        "The full posting history was split into chronological chunks, oldest first. Here is a digest of "
+        "each chunk with exact engagement statistics computed from every post in it:\n\n"
+        + json.dumps(digests, separators=(',', ':'), ensure_ascii=False)
+    )
+
+def prompt_post_count(condensed_posts, digests=None):
+    return sum(digest['stats']['posts'] for digest in digests) if digests is not None else len(condensed_posts)
+
+def format_engagement_stats(stats):
+    """Compact table of an engagement_breakdown for a prompt."""
+    overall = stats['overall']
+    lines = [
+        f"Engagement statistics computed exactly over all {overall['posts']} posts "
+        "(engagement = likes + comments + reposts; uplift = segment mean vs overall mean):",
+        f"overall | posts {overall['posts']} | median {overall['median_engagement']} | mean {overall['avg_engagement']} "
+        f"| comments per like {overall['comments_per_like']}",
+        "segment | posts | median | mean | uplift | comments per like"
+    ]
+    for section, label in (('by_type', 'type'), ('by_image', 'image'), ('by_length', 'length'),
+                           ('by_weekday', 'weekday'), ('by_hour', 'posted'), ('by_origin', 'origin')):
+        for name, row in (stats.get(section) or {}).items():
+            uplift = f"{row['uplift']:+.0%}" if row['uplift'] is not None else 'n/a'
+            lines.append(
+                f"{label}={name} | {row['count']} | {row['median_engagement']} | {row['avg_engagement']} "
+                f"| {uplift} | {row['comments_per_like']}"
+            )
+    return '\n'.join(lines)
+
+def narrative_posts_section(condensed_posts, encoding, stats):
+    """Statistics table plus example posts, replacing the full posts block."""
+    return f"""{format_engagement_stats(stats)}
+
+Example posts (highest and lowest engagement, each post type, most recent):
+
+{encode_posts(condensed_posts, encoding)}
+
+Base claims about formats, images, length, posting time, comment/like balance and reshares on the statistics, not on the examples. Ignore segments with fewer than {MIN_SEGMENT_POSTS} posts. Use the examples for themes, tone and concrete illustrations."""
+
+@STAGE_SECONDS.time(stage='prompt_build', analysis='narrative')
+def build_narrative_prompt(condensed_posts, encoding=PROMPT_ENCODING, digests=None, stats=None):
+    """
+    Build the narrative insights prompt for condensed posts, or for chunk digests in map-reduce mode.
+    
+    With stats (an engagement_breakdown) the posts are examples accompanying the statistics table.
+    """
+    post_count = stats['overall']['posts'] if stats is not None else prompt_post_count(condensed_posts, digests)
+    posts_section = (
+        narrative_posts_section(condensed_posts, encoding, stats) if stats is not None
+        else prompt_posts_section(condensed_posts, encoding, digests)
+    )
+    return f"""
+You are analyzing {post_count} LinkedIn posts to generate narrative insights that read like observations from a friend or colleague.
+
+{posts_section}
 
 Please analyze these posts and provide 5-7 short, human-friendly observations that would help the author understand:
 
@@ -93,27 +540,44 @@ Respond ONLY with valid JSON in this exact format:
 
 Be specific and data-driven, but keep the tone warm and conversational.
 """
+
+def generate_narrative_insights(posts_data):
+    """
+    Generate human-friendly narrative insights from posts data.
+    
+    Args:
+        posts_data: List of post objects with content, engagement metrics, images, etc.,
+            or a PostFrame already built from them
+    
+    Returns:
+        Dictionary with narrative insights
+    """
+    return run_steps(narrative_steps(posts_data))
+
+def narrative_steps(posts_data):
+    """Step generator behind generate_narrative_insights (see run_steps)."""
+    frame = PostFrame.coerce(posts_data)
+    stats = local_stats('narrative', frame)
+    condensed_posts, encoding = analysis_prompt_rows('narrative', frame, stats)
+    
+    cache_key, cached = get_cached_result('narrative', prompt_payload(condensed_posts, stats), encoding)
+    if cached is not None:
+        return cached
+    
+    if not gemini.is_configured():
+        return {
+            "error": "GEMINI_API_KEY not configured. Please add it to your .env file."
+        }
     
     try:
         print("🤖 Generating narrative insights with Gemini...")
-        model = genai.GenerativeModel('gemini-2.5-flash-lite')
-        response = model.generate_content(prompt)
-        
-        # Extract JSON from response
-        response_text = response.text.strip()
+        build_prompt = functools.partial(build_narrative_prompt, stats=stats)
+        response = yield from generate_analysis('narrative', build_prompt, condensed_posts, encoding)
         
-        # Remove markdown code blocks if present
-        if response_text.startswith('```json'):
-            response_text = response_text[7:]
-        if response_text.startswith('```'):
-            response_text = response_text[3:]
-        if response_text.endswith('```'):
-            response_text = response_text[:-3]
-        
-        result = json.loads(response_text.strip())
+        result, complete = decode_analysis_response('narrative', response.text)
         
         print("✅ Narrative insights generated successfully!")
-        return result
+        return store_cached_result(cache_key, 'narrative', result, complete)
         
     except Exception as e:
         print(f"❌ Error generating insights: {e}")
@@ -130,44 +594,212 @@ def health_check():
     return jsonify({
         "status": "ok",
         "service": "linkedin-analysis-api",
-        "gemini_configured": bool(GEMINI_API_KEY)
+        "gemini_configured": gemini.is_configured(),
+        "llm_backend": gemini.backend_stats(),
+        "result_cache": result_cache.stats() if result_cache is not None else None,
+        "post_label_cache": post_label_cache.stats() if post_label_cache is not None else None,
+        "topic_classifier": topic_classifier.stats() if topic_classifier is not None else None,
+        "jobs": job_queue.queue_depth(),
+        "gemini_calls": gemini.call_stats(),
+        "rate_limit": gemini.limiter_stats(),
+        "key_pool": gemini.key_stats(),
+        "single_flight": single_flight.stats(),
+        "context_cache": context_cache.stats() if context_cache is not None else None
     })
 
-def analyze_topics_with_llm(posts_data):
+@app.before_request
+def start_request_metrics():
+    g.metrics_route = request.url_rule.rule if request.url_rule else 'unmatched'
+    g.metrics_started = time.perf_counter()
+    HTTP_IN_FLIGHT.inc(route=g.metrics_route)
+
+@app.after_request
+def record_response_status(response):
+    g.metrics_status = response.status_code
+    return response
+
+def record_request_metrics(started, status):
+    route = g.metrics_route
+    HTTP_IN_FLIGHT.dec(route=route)
+    HTTP_REQUESTS.inc(route=route, method=request.method, status=status)
+    HTTP_LATENCY.observe(time.perf_counter() - started, route=route)
+
+@app.teardown_request
+def finish_request_metrics(exc):
+    # Streaming routes take metrics_started and record once their body is sent (see streaming_response)
+    started = g.pop('metrics_started', None)
+    if started is None:
+        return
+    record_request_metrics(started, g.get('metrics_status', 500))
+
+@metrics.collector
+def collect_component_metrics():
+    """Scrape-time values owned by the caller, limiter, caches and job queue."""
+    families = [(
+        'linkedin_api_gemini_call_events_total', 'counter',
+        'Gemini call outcomes, retries by cause, hedges and deadline misses',
+        [({'event': event}, count) for event, count in sorted(gemini.call_stats().items()) if event != 'p95_ms']
+    )]
+    
+    ratios = []
+    for cache in ('result', 'post_label'):
+        hits, misses = CACHE_LOOKUPS.value(cache=cache, result='hit'), CACHE_LOOKUPS.value(cache=cache, result='miss')
+        if hits + misses:
+            ratios.append(({'cache': cache}, round(hits / (hits + misses), 4)))
+    families.append(('linkedin_api_cache_hit_ratio', 'gauge', 'Cache hits over lookups since start', ratios))
+    
+    limiter = gemini.limiter_stats()
+    if limiter is not None:
+        families.append(('linkedin_api_rate_limit_in_flight', 'gauge', 'Gemini leases held across processes', [({}, limiter['in_flight'])]))
+        families.append(('linkedin_api_rate_limit_queue_depth', 'gauge', 'Calls waiting for a rate limit lease', [({}, limiter['queue_depth'])]))
+    
+    key_pool = gemini.key_stats()['by_key']
+    families.append(('linkedin_api_gemini_key_events_total', 'counter', 'Gemini key leases and outcomes by key id', [
+        ({'key': key, 'event': event}, count)
+        for key, stats in sorted(key_pool.items()) for event, count in sorted(stats.items())
+        if event not in ('in_flight', 'benched_seconds_left')
+    ]))
+    families.append(('linkedin_api_gemini_key_benched', 'gauge', 'Whether a key is benched after repeated 429s', [
+        ({'key': key}, int(stats['benched_seconds_left'] > 0)) for key, stats in sorted(key_pool.items())
+    ]))
+    
+    shared = single_flight.stats()
+    families.append(('linkedin_api_single_flight_saved_calls_total', 'counter', 'Gemini calls avoided by coalescing', [({}, shared.get('saved_calls', 0))]))
+    if context_cache is not None:
+        context = context_cache.stats()
+        families.append(('linkedin_api_context_cache_events_total', 'counter', 'Context cache hits, creations and fallbacks', [
+            ({'event': event}, count) for event, count in sorted(context.items()) if isinstance(count, int)
+        ]))
+    families.append(('linkedin_api_jobs', 'gauge', 'Background jobs by status', [
+        ({'status': status}, count) for status, count in job_queue.queue_depth().items()
+    ]))
+    return families
+
+@app.route('/metrics', methods=['GET'])
+def metrics_endpoint():
+    """Prometheus text-format metrics."""
+    return Response(metrics.render(), content_type=METRICS_CONTENT_TYPE)
+
+def topic_label_version():
+    return f"{TOPIC_LABEL_VERSION}+{gemini.model_name('topics')}"
+
+def topic_label_keys(frame, condensed_posts):
+    """Map each condensed post id to the label-cache key of its full content."""
+    label_version = topic_label_version()
+    return {row['id']: make_post_key(label_version, frame.content[row['id']]) for row in condensed_posts}
+
+def lookup_topic_labels(post_keys):
+    """Return {post id: topics} for posts whose labels are already cached."""
+    if post_label_cache is None:
+        return {}
+    try:
+        found = post_label_cache.get_many(list(post_keys.values()))
+    except Exception as e:
+        print(f"⚠️  Topic label lookup failed: {e}")
+        return {}
+    CACHE_LOOKUPS.inc(len(found), cache='post_label', result='hit')
+    CACHE_LOOKUPS.inc(len(post_keys) - len(found), cache='post_label', result='miss')
+    return {post_id: found[key] for post_id, key in post_keys.items() if key in found}
+
+def store_topic_labels(frame, post_keys, labels):
     """
-    Analyze topics across all posts using LLM.
-    Based on analyze_topics_llm.py but adapted for API use.
+    Cache newly assigned labels; posts the model skipped are left out so they are retried.
+    
+    The post text is stored too, as training data for the local topic classifier.
     """
-    if not GEMINI_API_KEY:
-        return {
-            "error": "GEMINI_API_KEY not configured. Please add it to your .env file."
-        }
+    if post_label_cache is None:
+        return
+    try:
+        post_label_cache.set_many(
+            {post_keys[post_id]: topics for post_id, topics in labels.items() if topics},
+            contents={post_keys[post_id]: frame.content[post_id] for post_id in labels},
+            label_version=topic_label_version()
+        )
+    except Exception as e:
+        print(f"⚠️  Topic label write failed: {e}")
+
+def accept_topic_labels(frame, post_keys, topic_posts, report, complete, prefix='posts'):
+    """
+    Take the labels of the requested posts from a decoded topics answer and cache them.
     
-    # Prepare condensed data for LLM
-    condensed_posts = []
-    for idx, post in enumerate(posts_data[:50]):  # Limit to 50 most recent posts
-        condensed_posts.append({
-            'id': idx,
-            'content': post.get('postContent', '')[:500],  # First 500 chars
-            'engagement': post.get('likeCount', 0) + post.get('commentCount', 0) + post.get('repostCount', 0),
-            'likes': post.get('likeCount', 0),
-            'comments': post.get('commentCount', 0)
-        })
+    Items whose id had to be defaulted or coerced would be read as post 0, so
+    they are dropped. Salvaged answers may have defaulted topic lists, which
+    must not be cached for weeks, so only complete answers are stored.
     
-    # Sort by engagement to help LLM identify patterns
-    condensed_posts.sort(key=lambda x: x['engagement'], reverse=True)
+    Args:
+        frame: PostFrame the posts came from
+        post_keys: Label-cache keys of the posts that were sent, by post id
+        topic_posts: Decoded "posts" list of the topics answer
+        report: Decode report from decode_analysis_response
+        complete: Whether the whole answer decoded without defaults
+        prefix: Path of the posts list in the decode report
     
-    prompt = f"""
-You are analyzing {len(condensed_posts)} LinkedIn posts to identify topics and performance patterns.
+    Returns:
+        {post id: topics} for the posts in post_keys
+    """
+    guessed = set(report['missing'] + report['coerced'])
+    labels = {
+        post['id']: post['topics'] for index, post in enumerate(topic_posts)
+        if post['id'] in post_keys and f"{prefix}.{index}.id" not in guessed
+    }
+    if complete:
+        store_topic_labels(frame, post_keys, labels)
+    return labels
+
+def classify_topics(frame, condensed_posts):
+    """
+    Label posts the local classifier is confident about.
+    
+    Returns:
+        {post id: topics} for the confident posts; the rest are left to Gemini
+    """
+    if topic_classifier is None or not condensed_posts:
+        return {}
+    predictions = topic_classifier.predict([frame.content[row['id']] for row in condensed_posts])
+    labels = {row['id']: topics for row, (topics, confident) in zip(condensed_posts, predictions) if confident}
+    TOPIC_CLASSIFIER_POSTS.inc(len(labels), result='confident')
+    TOPIC_CLASSIFIER_POSTS.inc(len(condensed_posts) - len(labels), result='uncertain')
+    return labels
 
+def summarize_topic_stats(topic_stats):
+    """Short summary written from the local topic_stats, used when every post already has labels."""
+    if not topic_stats:
+        return "No topics could be identified in these posts."
+    by_count = sorted(topic_stats, key=lambda topic: -topic_stats[topic]['count'])
+    main = by_count[:3]
+    names = main[0] if len(main) == 1 else f"{', '.join(main[:-1])} and {main[-1]}"
+    repeated = [topic for topic in topic_stats if topic_stats[topic]['count'] >= 2] or list(topic_stats)
+    best = max(repeated, key=lambda topic: topic_stats[topic]['avg_engagement'])
+    return (
+        f"You primarily write about {names}. "
+        f"Posts about {best} perform best, averaging {topic_stats[best]['avg_engagement']:g} engagements per post."
+    )
+
+@STAGE_SECONDS.time(stage='prompt_build', analysis='topics')
+def build_topics_prompt(condensed_posts, encoding=PROMPT_ENCODING, tagged_topic_counts=None):
+    """
+    Build the topic tagging prompt for condensed posts.
+    
+    tagged_topic_counts summarises posts tagged by an earlier call, so the summary still covers them.
+    """
+    earlier = ""
+    if tagged_topic_counts:
+        counts = ', '.join(f"{topic} ({count})" for topic, count in tagged_topic_counts.most_common())
+        earlier = (
+            f"\nOther posts from this profile were tagged earlier with these topics (post counts): {counts}.\n"
+            "Tag only the posts below, but base the SUMMARY on all posts including the earlier ones.\n"
+        )
+    return f"""
+You are analyzing {len(condensed_posts)} LinkedIn posts to identify topics and performance patterns.
+{earlier}
 Here are the posts with their engagement metrics:
 
-{json.dumps(condensed_posts, indent=2)}
+{encode_posts(condensed_posts, encoding)}
 
 Please analyze these posts and provide:
 
 1. **TOPIC_DISTRIBUTION**: For each post, assign 1-3 relevant topics from this list (or add new ones if needed):
-   - hiring, ai, product, startup, tech, growth, leadership, fintech, engineering, team, culture, milestone, announcement, personal, strategy, sales, marketing, funding
+   - {', '.join(TOPIC_VOCABULARY)}
 
 2. **SUMMARY**: Write 2-3 sentences describing what topics this person writes about and which topics tend to perform better based on engagement metrics.
 
@@ -180,36 +812,76 @@ Respond ONLY with valid JSON in this exact format:
     }},
     ...
   ],
-  "summary": "You primarily write about...",
-  "topic_stats": {{
-    "startup": {{"count": 5, "avg_engagement": 120, "median_engagement": 110}},
-    "tech": {{"count": 8, "avg_engagement": 90, "median_engagement": 85}}
-  }}
+  "summary": "You primarily write about..."
 }}
 
 Focus on accuracy. A post about "hiring engineers" should be tagged as both "hiring" AND "tech/engineering".
 """
+
+def analyze_topics_with_llm(posts_data):
+    """
+    Analyze topics across all posts using LLM.
+    Based on analyze_topics_llm.py but adapted for API use.
+    
+    Posts whose content already has cached labels are not sent again, nor are
+    posts the local topic classifier is confident about; only the remaining
+    posts are tagged and the labels are merged. Gemini returns per-post topics
+    and the summary, and topic_stats are computed locally with post_stats.
+    """
+    return run_steps(topics_llm_steps(posts_data))
+
+def topics_llm_steps(posts_data):
+    """Step generator behind analyze_topics_with_llm (see run_steps)."""
+    frame = PostFrame.coerce(posts_data)
+    condensed_posts = condense_posts('topics', frame)
+    
+    cache_key, cached = get_cached_result('topics', condensed_posts)
+    if cached is not None:
+        return cached
+    
+    post_keys = topic_label_keys(frame, condensed_posts)
+    cached_labels = lookup_topic_labels(post_keys)
+    classified_labels = classify_topics(frame, [row for row in condensed_posts if row['id'] not in cached_labels])
+    known_labels = {**cached_labels, **classified_labels}
+    pending_posts = [row for row in condensed_posts if row['id'] not in known_labels]
+    
+    if not pending_posts:
+        print(f"⚡ All {len(condensed_posts)} posts have cached or locally classified topic labels")
+        topic_stats = compute_topic_stats(frame, known_labels)
+        result = {
+            "posts": [{"id": row['id'], "topics": known_labels[row['id']]} for row in condensed_posts],
+            "summary": summarize_topic_stats(topic_stats),
+            "topic_stats": topic_stats
+        }
+        return store_cached_result(cache_key, 'topics', result)
+    
+    if not gemini.is_configured():
+        return {
+            "error": "GEMINI_API_KEY not configured. Please add it to your .env file."
+        }
+    
+    tagged_topic_counts = Counter(topic for topics in known_labels.values() for topic in set(topics))
+    prompt = build_topics_prompt(pending_posts, tagged_topic_counts=tagged_topic_counts)
     
     try:
-        print("🤖 Analyzing topics with Gemini...")
-        model = genai.GenerativeModel('gemini-2.5-flash-lite')
-        response = model.generate_content(prompt)
+        if known_labels:
+            print(f"🤖 Analyzing topics with Gemini ({len(pending_posts)} new posts, {len(cached_labels)} from label cache, "
+                  f"{len(classified_labels)} classified locally)...")
+        else:
+            print("🤖 Analyzing topics with Gemini...")
+        response = yield gemini_request(prompt, 'topics')
         
-        # Extract JSON from response
-        response_text = response.text.strip()
+        report = {}
+        result, complete = decode_analysis_response('topics', response.text, report=report)
+        pending_keys = {row['id']: post_keys[row['id']] for row in pending_posts}
+        new_labels = accept_topic_labels(frame, pending_keys, result['posts'], report, complete)
         
-        # Remove markdown code blocks if present
-        if response_text.startswith('```json'):
-            response_text = response_text[7:]
-        if response_text.startswith('```'):
-            response_text = response_text[3:]
-        if response_text.endswith('```'):
-            response_text = response_text[:-3]
-        
-        result = json.loads(response_text.strip())
+        labels = {**known_labels, **new_labels}
+        result['posts'] = [{"id": row['id'], "topics": labels.get(row['id'], [])} for row in condensed_posts]
+        result['topic_stats'] = compute_topic_stats(frame, labels)
         
         print("✅ Topic analysis complete!")
-        return result
+        return store_cached_result(cache_key, 'topics', result, complete and len(new_labels) == len(pending_keys))
         
     except Exception as e:
         print(f"❌ Error analyzing topics: {e}")
@@ -220,34 +892,68 @@ Focus on accuracy. A post about "hiring engineers" should be tagged as both "hir
             "topic_stats": {}
         }
 
-def evaluate_posts_with_llm(posts_data):
-    """
-    Evaluate posts based on thought-leadership criteria using LLM.
-    Based on the provided evaluation prompt but adapted for overall analysis.
+def analyze_topics_locally(posts_data, fallback_reason=None):
     """
-    if not GEMINI_API_KEY:
-        return {
-            "error": "GEMINI_API_KEY not configured. Please add it to your .env file."
-        }
+    Tag topics offline with hashed n-gram TF-IDF and k-means (see topic_clustering.py).
     
-    # Prepare condensed data for LLM
-    condensed_posts = []
-    for idx, post in enumerate(posts_data[:30]):  # Limit to 30 most recent posts
-        condensed_posts.append({
-            'id': idx,
-            'content': post.get('postContent', '')[:800],  # First 800 chars for better analysis
-            'engagement': post.get('likeCount', 0) + post.get('commentCount', 0) + post.get('repostCount', 0),
-            'likes': post.get('likeCount', 0),
-            'comments': post.get('commentCount', 0),
-            'reposts': post.get('repostCount', 0),
-            'has_image': bool(post.get('imgUrl')),
-            'type': post.get('type', 'Text')
-        })
+    Covers every post, not just a condensed selection, and returns the same
+    posts / summary / topic_stats shape as the Gemini engine.
+    """
+    frame = PostFrame.coerce(posts_data)
+    labels = dict(enumerate(tag_posts(frame.content)))
+    topic_stats = compute_topic_stats(frame, labels)
+    result = {
+        "posts": [{"id": post_id, "topics": topics} for post_id, topics in labels.items()],
+        "summary": summarize_topic_stats(topic_stats),
+        "topic_stats": topic_stats,
+        "engine": "local"
+    }
+    if fallback_reason:
+        print(f"⚡ Topics served by the local engine ({fallback_reason})")
+        result["fallback_reason"] = fallback_reason
+    return result
+
+def gemini_congestion():
+    """Why optional Gemini work should be skipped right now, or None."""
+    if not gemini.is_configured():
+        return "gemini_not_configured"
+    try:
+        limiter = gemini.limiter_stats()
+    except Exception:
+        return None
+    if limiter and limiter['queue_depth'] > 0:
+        return "rate_limited"
+    return None
+
+def analyze_topics(posts_data, engine=None):
+    """
+    Analyze topics with the requested engine (TOPIC_ENGINES, default TOPICS_ENGINE).
     
-    # Sort by engagement to help LLM identify patterns
-    condensed_posts.sort(key=lambda x: x['engagement'], reverse=True)
+    In auto mode a Gemini call that outlives TOPICS_AUTO_TIMEOUT_SECONDS keeps
+    running in the background, so its labels still reach the label cache.
+    """
+    engine = engine or TOPICS_ENGINE
+    if engine == 'local':
+        return analyze_topics_locally(posts_data)
+    if engine != 'auto':
+        return {**analyze_topics_with_llm(posts_data), "engine": "llm"}
     
-    prompt = f"""
+    reason = gemini_congestion()
+    if reason:
+        return analyze_topics_locally(posts_data, reason)
+    future = topics_llm_executor.submit(analyze_topics_with_llm, posts_data)
+    try:
+        result = future.result(timeout=TOPICS_AUTO_TIMEOUT_SECONDS)
+    except FutureTimeoutError:
+        return analyze_topics_locally(posts_data, "gemini_slow")
+    if 'error' in result:
+        return analyze_topics_locally(posts_data, "gemini_error")
+    return {**result, "engine": "llm"}
+
+@STAGE_SECONDS.time(stage='prompt_build', analysis='evaluation')
+def build_evaluation_prompt(condensed_posts, encoding=PROMPT_ENCODING):
+    """Build the portfolio evaluation prompt for condensed posts."""
+    return f"""
 SYSTEM ROLE
 Act as a senior editor and writing evaluator for tech/startup/business content on LinkedIn, grading founder/operator/investor posts for truthfulness, coherence, and usefulness. Be rigorous, precise, and concise. Never invent facts. Output only the specified JSON.
 
@@ -321,29 +1027,37 @@ GRADING NOTES
 
 You are analyzing {len(condensed_posts)} LinkedIn posts from a thought leader. Here are the posts with their engagement data:
 
-{json.dumps(condensed_posts, indent=2)}
+{encode_posts(condensed_posts, encoding)}
 """
+
+def evaluate_posts_with_llm(posts_data):
+    """
+    Evaluate posts based on thought-leadership criteria using LLM.
+    Based on the provided evaluation prompt but adapted for overall analysis.
+    """
+    return run_steps(evaluation_steps(posts_data))
+
+def evaluation_steps(posts_data):
+    """Step generator behind evaluate_posts_with_llm (see run_steps)."""
+    condensed_posts, encoding = analysis_prompt_rows('evaluation', posts_data)
+    
+    cache_key, cached = get_cached_result('evaluation', condensed_posts, encoding)
+    if cached is not None:
+        return cached
+    
+    if not gemini.is_configured():
+        return {
+            "error": "GEMINI_API_KEY not configured. Please add it to your .env file."
+        }
     
     try:
         print("🤖 Evaluating posts with Gemini...")
-        model = genai.GenerativeModel('gemini-2.5-flash-lite')
-        response = model.generate_content(prompt)
-        
-        # Extract JSON from response
-        response_text = response.text.strip()
+        response = yield from generate_analysis('evaluation', build_evaluation_prompt, condensed_posts, encoding)
         
-        # Remove markdown code blocks if present
-        if response_text.startswith('```json'):
-            response_text = response_text[7:]
-        if response_text.startswith('```'):
-            response_text = response_text[3:]
-        if response_text.endswith('```'):
-            response_text = response_text[:-3]
-        
-        result = json.loads(response_text.strip())
+        result, complete = decode_analysis_response('evaluation', response.text)
         
         print("✅ Post evaluation complete!")
-        return result
+        return store_cached_result(cache_key, 'evaluation', result, complete)
         
     except Exception as e:
         print(f"❌ Error evaluating posts: {e}")
@@ -358,40 +1072,13 @@ You are analyzing {len(condensed_posts)} LinkedIn posts from a thought leader. H
             "overall_analysis": ""
         }
 
-def analyze_positioning_with_llm(posts_data):
-    """
-    Analyze current branding/positioning and suggest future positioning using LLM.
-    This helps users understand how they're currently perceived and how to improve their positioning.
-    """
-    if not GEMINI_API_KEY:
-        return {
-            "error": "GEMINI_API_KEY not configured. Please add it to your .env file."
-        }
-    
-    # Prepare condensed data for LLM
-    condensed_posts = []
-    for idx, post in enumerate(posts_data[:50]):  # Limit to 50 most recent posts
-        condensed_posts.append({
-            'id': idx,
-            'content': post.get('postContent', '')[:600],  # First 600 chars for positioning analysis
-            'engagement': post.get('likeCount', 0) + post.get('commentCount', 0) + post.get('repostCount', 0),
-            'likes': post.get('likeCount', 0),
-            'comments': post.get('commentCount', 0),
-            'reposts': post.get('repostCount', 0),
-            'has_image': bool(post.get('imgUrl')),
-            'type': post.get('type', 'Text'),
-            'date': post.get('postTimestamp', post.get('postDate', ''))
-        })
-    
-    # Sort by engagement to help LLM identify patterns
-    condensed_posts.sort(key=lambda x: x['engagement'], reverse=True)
-    
-    prompt = f"""
-You are a personal branding expert analyzing {len(condensed_posts)} LinkedIn posts to understand current positioning and suggest future positioning improvements.
-
-Here are the posts with their engagement data:
+@STAGE_SECONDS.time(stage='prompt_build', analysis='positioning')
+def build_positioning_prompt(condensed_posts, encoding=PROMPT_ENCODING, digests=None):
+    """Build the branding/positioning prompt for condensed posts, or for chunk digests in map-reduce mode."""
+    return f"""
+You are a personal branding expert analyzing {prompt_post_count(condensed_posts, digests)} LinkedIn posts to understand current positioning and suggest future positioning improvements.
 
-{json.dumps(condensed_posts, indent=2)}
+{prompt_posts_section(condensed_posts, encoding, digests)}
 
 Analyze this content to understand:
 
@@ -437,27 +1124,35 @@ Respond ONLY with valid JSON in this exact format:
 
 Be specific, actionable, and strategic. Focus on positioning that would genuinely help their professional growth and thought leadership.
 """
+
+def analyze_positioning_with_llm(posts_data):
+    """
+    Analyze current branding/positioning and suggest future positioning using LLM.
+    This helps users understand how they're currently perceived and how to improve their positioning.
+    """
+    return run_steps(positioning_steps(posts_data))
+
+def positioning_steps(posts_data):
+    """Step generator behind analyze_positioning_with_llm (see run_steps)."""
+    condensed_posts, encoding = analysis_prompt_rows('positioning', posts_data)
+    
+    cache_key, cached = get_cached_result('positioning', condensed_posts, encoding)
+    if cached is not None:
+        return cached
+    
+    if not gemini.is_configured():
+        return {
+            "error": "GEMINI_API_KEY not configured. Please add it to your .env file."
+        }
     
     try:
         print("🤖 Analyzing positioning with Gemini...")
-        model = genai.GenerativeModel('gemini-2.5-flash-lite')
-        response = model.generate_content(prompt)
-        
-        # Extract JSON from response
-        response_text = response.text.strip()
-        
-        # Remove markdown code blocks if present
-        if response_text.startswith('```json'):
-            response_text = response_text[7:]
-        if response_text.startswith('```'):
-            response_text = response_text[3:]
-        if response_text.endswith('```'):
-            response_text = response_text[:-3]
+        response = yield from generate_analysis('positioning', build_positioning_prompt, condensed_posts, encoding)
         
-        result = json.loads(response_text.strip())
+        result, complete = decode_analysis_response('positioning', response.text)
         
         print("✅ Positioning analysis complete!")
-        return result
+        return store_cached_result(cache_key, 'positioning', result, complete)
         
     except Exception as e:
         print(f"❌ Error analyzing positioning: {e}")
@@ -489,6 +1184,182 @@ Be specific, actionable, and strategic. Focus on positioning that would genuinel
             }
         }
 
+# Analyses available to /analyze-all, keyed by the name used in its response
+ANALYSIS_FUNCTIONS = {
+    'insights': generate_narrative_insights,
+    'topics': analyze_topics,
+    'evaluation': evaluate_posts_with_llm,
+    'positioning': analyze_positioning_with_llm
+}
+
+# Step generators of the Gemini-backed analyses, for the ASGI driver (topics engines are chosen in asgi_app.py)
+ANALYSIS_STEPS = {
+    'insights': narrative_steps,
+    'topics': topics_llm_steps,
+    'evaluation': evaluation_steps,
+    'positioning': positioning_steps
+}
+
+@STAGE_SECONDS.time(stage='prompt_build', analysis='chunk_digest')
+def build_chunk_digest_prompt(condensed_posts, stats, encoding=PROMPT_ENCODING):
+    """Build the map prompt that condenses one chunk of the history into a digest."""
+    return f"""
+You are summarizing one period of a LinkedIn author's posting history ({stats['posts']} posts from {stats['from'] or 'unknown'} to {stats['to'] or 'unknown'}). Your digest will be combined with digests of the other periods, so keep it compact and factual.
+
+Here are the posts with their engagement data:
+
+{encode_posts(condensed_posts, encoding)}
+
+Respond ONLY with valid JSON in this exact format:
+{{
+  "summary": "2-3 sentences on what the author posted about in this period and how it landed",
+  "themes": ["theme1", "theme2", "theme3"],
+  "what_works": ["pattern that drew above-average engagement", ...],
+  "what_falls_flat": ["pattern that drew below-average engagement", ...],
+  "style": "One sentence on tone, format and length",
+  "audience_signals": ["who engages and how (comments vs likes)", ...]
+}}
+
+Keep every list to at most 5 short items.
+"""
+
+def summarize_chunk(frame, indices):
+    """Map step: digest one chunk of posts, reusing a cached digest when the chunk is unchanged."""
+    condensed_posts = frame.condense(POSITIONING_FIELDS, indices=indices, content_chars=MAP_REDUCE_CONTENT_CHARS)
+    stats = chunk_stats(frame, indices)
+    
+    cache_key, digest = get_cached_result('chunk_digest', condensed_posts)
+    if digest is None:
+        response = generate_content(build_chunk_digest_prompt(condensed_posts, stats), 'chunk_digest')
+        digest, complete = decode_analysis_response('chunk_digest', response.text)
+        store_cached_result(cache_key, 'chunk_digest', digest, complete)
+    digest.pop('cached', None)
+    digest['stats'] = stats
+    return digest
+
+# Analyses that support map-reduce mode, keyed by ANALYSIS_FUNCTIONS name
+MAP_REDUCE_ANALYSES = {
+    'insights': ('narrative', build_narrative_prompt),
+    'positioning': ('positioning', build_positioning_prompt)
+}
+
+ANALYSIS_MODES = ('default', 'map_reduce')
+
+# /analyze-all and "all" jobs can also answer every analysis from one combined call
+ALL_ANALYSES_MODES = ANALYSIS_MODES + ('combined',)
+
+def analyze_with_map_reduce(name, posts_data, chunk_size=None, max_workers=None):
+    """
+    Run an analysis over the full posting history instead of a token-budgeted sample.
+    
+    Chunks are digested concurrently, then the analysis prompt runs once over
+    the digests. The result has the analysis' usual shape plus a "map_reduce"
+    section with chunk counts and timings.
+    
+    Args:
+        name: Key of MAP_REDUCE_ANALYSES
+        posts_data: List of post objects or a PostFrame
+        chunk_size: Posts per map call (defaults to MAP_REDUCE_CHUNK_SIZE)
+        max_workers: Concurrent map calls (defaults to MAP_REDUCE_MAX_WORKERS)
+    """
+    analysis, build_prompt = MAP_REDUCE_ANALYSES[name]
+    chunk_size = chunk_size or MAP_REDUCE_CHUNK_SIZE
+    max_workers = max_workers or MAP_REDUCE_MAX_WORKERS
+    
+    if not gemini.is_configured():
+        return {
+            "error": "GEMINI_API_KEY not configured. Please add it to your .env file."
+        }
+    
+    frame = PostFrame.coerce(posts_data)
+    chunks = chunk_indices(frame, chunk_size)
+    print(f"🗺️  Map-reduce {analysis}: {len(frame)} posts in {len(chunks)} chunks, {max_workers} at a time...")
+    digests, failures, map_ms = run_map(chunks, lambda number, indices: summarize_chunk(frame, indices), max_workers)
+    for number, error in failures.items():
+        print(f"⚠️  Chunk {number + 1}/{len(chunks)} failed: {error}")
+    digests = [digest for digest in digests if digest is not None]
+    if not digests:
+        return {"error": f"Failed to analyze {analysis}: every chunk failed", **default_for(ANALYSIS_SCHEMAS[analysis])}
+    
+    cache_key, cached = get_cached_result(analysis, {'map_reduce': digests})
+    if cached is not None:
+        return cached
+    
+    try:
+        reduce_start = time.monotonic()
+        response = generate_content(build_prompt([], digests=digests), analysis)
+        result, complete = decode_analysis_response(analysis, response.text)
+        result['map_reduce'] = {
+            "posts": len(frame),
+            "chunks": len(chunks),
+            "chunk_size": chunk_size,
+            "failed_chunks": sorted(failures),
+            "map_ms": map_ms,
+            "reduce_ms": round((time.monotonic() - reduce_start) * 1000)
+        }
+        print(f"✅ Map-reduce {analysis} complete!")
+        return store_cached_result(cache_key, analysis, result, complete and not failures)
+    except Exception as e:
+        print(f"❌ Error reducing {analysis}: {e}")
+        return {"error": f"Failed to analyze {analysis}: {str(e)}", **default_for(ANALYSIS_SCHEMAS[analysis])}
+
+def parse_analysis_mode(data, modes=ANALYSIS_MODES):
+    """
+    Read "mode" and the map-reduce options from a request body.
+    
+    Returns:
+        Tuple of (mode, options, error message or None)
+    """
+    mode = data.get('mode') or 'default'
+    if mode not in modes:
+        return mode, {}, f"Unknown mode '{mode}'. Expected any of: {', '.join(modes)}."
+    options = {}
+    for field in ('chunk_size', 'max_workers'):
+        if data.get(field) is not None:
+            if not isinstance(data[field], int) or data[field] < 1:
+                return mode, {}, f"'{field}' must be a positive integer."
+            options[field] = data[field]
+    return mode, options, None
+
+def parse_topics_engine(data):
+    """
+    Read "engine" from a topics request body.
+    
+    Returns:
+        Tuple of (engine or None for the TOPICS_ENGINE default, error message or None)
+    """
+    engine = data.get('engine')
+    if engine is not None and engine not in TOPIC_ENGINES:
+        return engine, f"Unknown engine '{engine}'. Expected any of: {', '.join(TOPIC_ENGINES)}."
+    return engine, None
+
+def parse_analysis_selection(data):
+    """
+    Read "analyses" and "timeouts" from an /analyze-all request body.
+    
+    Returns:
+        Tuple of (analysis names, timeouts dict, error message or None)
+    """
+    analyses = data.get('analyses') or list(ANALYSIS_FUNCTIONS.keys())
+    if not isinstance(analyses, list) or not all(isinstance(name, str) for name in analyses):
+        return analyses, {}, "'analyses' must be an array of analysis names."
+    unknown = [name for name in analyses if name not in ANALYSIS_FUNCTIONS]
+    if unknown:
+        return analyses, {}, f"Unknown analyses: {', '.join(unknown)}. Expected any of: {', '.join(ANALYSIS_FUNCTIONS.keys())}."
+    timeouts = data.get('timeouts') or {}
+    if not isinstance(timeouts, dict):
+        return analyses, {}, "'timeouts' must be an object of seconds per analysis."
+    for name, seconds in timeouts.items():
+        if isinstance(seconds, bool) or not isinstance(seconds, (int, float)) or not 0 < seconds < float('inf'):
+            return analyses, {}, f"'timeouts.{name}' must be a positive number of seconds."
+    return analyses, timeouts, None
+
+def run_analysis(name, posts_data, mode='default', options=None):
+    """Run one ANALYSIS_FUNCTIONS entry, in map-reduce mode when requested and supported."""
+    if mode == 'map_reduce' and name in MAP_REDUCE_ANALYSES:
+        return analyze_with_map_reduce(name, posts_data, **(options or {}))
+    return ANALYSIS_FUNCTIONS[name](posts_data)
+
 @app.route('/generate-insights', methods=['POST'])
 def generate_insights_endpoint():
     """
@@ -507,7 +1378,8 @@ def generate_insights_endpoint():
                 ...
             },
             ...
-        ]
+        ],
+        "mode": "map_reduce"   # Optional: analyse the full history in chunks (see analyze_with_map_reduce)
     }
     """
     try:
@@ -525,8 +1397,14 @@ def generate_insights_endpoint():
                 "error": "Posts must be a non-empty array."
             }), 400
         
+        mode, options, mode_error = parse_analysis_mode(data)
+        if mode_error:
+            return jsonify({
+                "error": mode_error
+            }), 400
+        
         # Generate insights
-        insights = generate_narrative_insights(posts)
+        insights = run_analysis('insights', posts, mode, options)
         
         if 'error' in insights:
             return jsonify(insights), 500
@@ -557,7 +1435,8 @@ def analyze_topics_endpoint():
                 ...
             },
             ...
-        ]
+        ],
+        "engine": "local"   # Optional: "llm", "local" (offline clustering) or "auto" (see analyze_topics)
     }
     """
     try:
@@ -575,8 +1454,14 @@ def analyze_topics_endpoint():
                 "error": "Posts must be a non-empty array."
             }), 400
         
+        engine, engine_error = parse_topics_engine(data)
+        if engine_error:
+            return jsonify({
+                "error": engine_error
+            }), 400
+        
         # Analyze topics
-        result = analyze_topics_with_llm(posts)
+        result = analyze_topics(posts, engine)
         
         if 'error' in result:
             return jsonify(result), 500
@@ -661,7 +1546,8 @@ def analyze_positioning_endpoint():
                 ...
             },
             ...
-        ]
+        ],
+        "mode": "map_reduce"   # Optional: analyse the full history in chunks (see analyze_with_map_reduce)
     }
     """
     try:
@@ -679,8 +1565,14 @@ def analyze_positioning_endpoint():
                 "error": "Posts must be a non-empty array."
             }), 400
         
+        mode, options, mode_error = parse_analysis_mode(data)
+        if mode_error:
+            return jsonify({
+                "error": mode_error
+            }), 400
+        
         # Analyze positioning
-        result = analyze_positioning_with_llm(posts)
+        result = run_analysis('positioning', posts, mode, options)
         
         if 'error' in result:
             return jsonify(result), 500
@@ -695,18 +1587,461 @@ def analyze_positioning_endpoint():
             "error": f"Server error: {str(e)}"
         }), 500
 
+# Analyses that can stream their fields as Gemini generates them
+STREAM_PROMPT_BUILDERS = {
+    'narrative': build_narrative_prompt,
+    'positioning': build_positioning_prompt
+}
+
+def stream_analysis(analysis, posts_data):
+    """
+    Yield events for an analysis while Gemini is still generating it.
+    
+    Events:
+        {"event": "start", "analysis": "...", "cached": false}
+        {"event": "field", "path": ["insights", 0], "value": "..."}  # one per completed value
+        {"event": "done", "data": {...}}                             # full decoded result
+        {"event": "error", "error": "..."}
+    """
+    frame = PostFrame.coerce(posts_data)
+    stats = local_stats(analysis, frame)
+    condensed_posts = condense_posts(f"{analysis}_examples" if stats is not None else analysis, frame)
+    
+    cache_key, cached = get_cached_result(analysis, prompt_payload(condensed_posts, stats))
+    if cached is not None:
+        yield {"event": "start", "analysis": analysis, "cached": True}
+        for path, value in iter_leaves(cached):
+            if path != ('cached',):
+                yield {"event": "field", "path": list(path), "value": value}
+        yield {"event": "done", "data": cached}
+        return
+    
+    if not gemini.is_configured():
+        yield {"event": "error", "error": "GEMINI_API_KEY not configured. Please add it to your .env file."}
+        return
+    
+    yield {"event": "start", "analysis": analysis, "cached": False}
+    
+    build_prompt = STREAM_PROMPT_BUILDERS[analysis]
+    prompt = build_prompt(condensed_posts, stats=stats) if stats is not None else build_prompt(condensed_posts)
+    parser = IncrementalJSONParser()
+    chunks = []
+    
+    try:
+        print(f"🤖 Streaming {analysis} analysis from Gemini...")
+        for text in generate_content_stream(prompt, analysis):
+            chunks.append(text)
+            for path, value in parser.feed(text):
+                yield {"event": "field", "path": list(path), "value": value}
+        
+        result, complete = decode_analysis_response(analysis, ''.join(chunks))
+        
+        print(f"✅ Streamed {analysis} analysis complete!")
+        yield {"event": "done", "data": store_cached_result(cache_key, analysis, result, complete)}
+        
+    except Exception as e:
+        print(f"❌ Error streaming {analysis} analysis: {e}")
+        yield {"event": "error", "error": f"Failed to stream {analysis} analysis: {str(e)}"}
+
+def streaming_response(analysis):
+    """Validate the posts payload and stream an analysis back as NDJSON."""
+    data = request.get_json(silent=True)
+    
+    if not data or 'posts' not in data:
+        return jsonify({
+            "error": "Invalid request. Expected JSON with 'posts' array."
+        }), 400
+    
+    posts = data['posts']
+    
+    if not isinstance(posts, list) or len(posts) == 0:
+        return jsonify({
+            "error": "Posts must be a non-empty array."
+        }), 400
+    
+    # Teardown runs before the body is consumed, so latency is recorded when the stream ends instead
+    started = g.pop('metrics_started', None)
+    
+    def generate():
+        try:
+            for event in stream_analysis(analysis, posts):
+                yield json.dumps(event) + "\n"
+        finally:
+            if started is not None:
+                record_request_metrics(started, 200)
+    
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson', headers={
+        "Cache-Control": "no-cache",
+        "X-Accel-Buffering": "no"
+    })
+
+@app.route('/generate-insights/stream', methods=['POST'])
+def generate_insights_stream_endpoint():
+    """
+    Stream narrative insights as newline-delimited JSON events.
+    
+    Takes the same payload as /generate-insights. Each insight string is sent
+    as a "field" event as soon as Gemini finishes writing it.
+    """
+    return streaming_response('narrative')
+
+@app.route('/analyze-positioning/stream', methods=['POST'])
+def analyze_positioning_stream_endpoint():
+    """
+    Stream positioning analysis as newline-delimited JSON events.
+    
+    Takes the same payload as /analyze-positioning. Each branding field is sent
+    as a "field" event as soon as Gemini finishes writing it.
+    """
+    return streaming_response('positioning')
+
+# Combined mode: ANALYSIS_FUNCTIONS name -> section of the single combined response
+COMBINED_SECTIONS = {
+    'insights': 'narrative',
+    'topics': 'topics',
+    'evaluation': 'evaluation',
+    'positioning': 'positioning'
+}
+
+COMBINED_INSTRUCTIONS = {
+    'narrative': """"narrative": 5-7 short, conversational observations (1-2 lines each) that read like a friend noticing patterns: which topics spark engagement, whether images or length matter, what makes people comment vs like, when showing the journey resonates, and any surprising correlations. Add a one-sentence "key_finding" and one actionable "recommendation".""",
+    'topics': """"topics": for every post, its "id" and 1-3 topics from this list (or new ones if needed): hiring, ai, product, startup, tech, growth, leadership, fintech, engineering, team, culture, milestone, announcement, personal, strategy, sales, marketing, funding. Tag a post about "hiring engineers" as both hiring AND tech/engineering. Add a 2-3 sentence "summary" of what the author writes about and which topics perform better.""",
+    'evaluation': """"evaluation": grade the posts as a portfolio, as a rigorous senior editor who never invents facts. rubric_breakdown: depth_originality 0-25, hook_effectiveness 0-10, evidence_examples 0-20 (cap at 10 without explicit numbers or artifacts), actionability 0-15, conclusion_strength 0-10, personal_story 0-10, emotional_resonance 0-10; score_100 is their sum. "story": whether a concrete first-person anecdote is present, quotes of its lines and its lesson. 2-3 strengths, 3-5 actionable improvements, three suggested_edits that would raise the score, a one_line_summary and a 2-3 sentence overall_analysis.""",
+    'positioning': """"positioning": as a personal branding expert, describe current_branding (positioning_summary, key_themes, expertise_areas, communication_style, target_audience, strengths, weaknesses), recommend future_branding (recommended_positioning, strategic_themes, target_expertise, ideal_communication_style, target_audience, differentiation_strategy, content_recommendations, positioning_gaps) and an action_plan (immediate_actions, content_strategy, timeline). Be specific, actionable and strategic."""
+}
+
+@STAGE_SECONDS.time(stage='prompt_build', analysis='combined')
+def build_combined_prompt(condensed_posts, sections, encoding=PROMPT_ENCODING):
+    """Build one prompt that asks for several analysis sections over a single copy of the posts."""
+    tasks = '\n\n'.join(f"{number}. {COMBINED_INSTRUCTIONS[section]}" for number, section in enumerate(sections, 1))
+    return f"""
+You are analyzing {len(condensed_posts)} LinkedIn posts for their author. Produce several independent analyses of the same posts in one JSON response.
+
+Here are the posts with their engagement data:
+
+{encode_posts(condensed_posts, encoding)}
+
+Return a JSON object with exactly these top-level sections: {', '.join(sections)}.
+
+{tasks}
+
+Respond ONLY with valid JSON. Keep each section as thorough as if it were the only task.
+"""
+
+def run_combined_analyses(posts_data, analyses):
+    """
+    Run several analyses with a single Gemini call over one shared corpus.
+    
+    The posts are condensed once with every field the sections need, and one
+    schema covers all requested sections. Topic labels feed the label cache
+    and topic_stats are computed locally, as in analyze_topics_with_llm.
+    
+    Returns:
+        Tuple of (results, errors, timings_ms) shaped like run_analyses_concurrently
+    """
+    started = time.monotonic()
+    frame = PostFrame.coerce(posts_data)
+    sections = [COMBINED_SECTIONS[name] for name in analyses]
+    schema = combined_schema(sections)
+    condensed_posts = condense_posts('combined', frame)
+    
+    def finish(results, errors):
+        elapsed_ms = round((time.monotonic() - started) * 1000)
+        return results, errors, {'combined': elapsed_ms, 'total': elapsed_ms}
+    
+    cache_key, cached = get_cached_result('combined', {'sections': sections, 'posts': condensed_posts})
+    if cached is not None:
+        return finish({name: dict(cached[COMBINED_SECTIONS[name]], cached=True) for name in analyses}, {})
+    
+    if not gemini.is_configured():
+        return finish({}, {name: "GEMINI_API_KEY not configured. Please add it to your .env file." for name in analyses})
+    
+    try:
+        print(f"🤖 Running {', '.join(sections)} in one combined Gemini call...")
+        response = generate_content(build_combined_prompt(condensed_posts, sections), 'combined', schema)
+        report = {}
+        combined, complete = decode_analysis_response('combined', response.text, schema, report)
+    except Exception as e:
+        print(f"❌ Error running combined analysis: {e}")
+        return finish({}, {name: f"Combined analysis failed: {str(e)}" for name in analyses})
+    
+    if 'topics' in sections:
+        topics = combined['topics']
+        post_keys = topic_label_keys(frame, condensed_posts)
+        labels = accept_topic_labels(frame, post_keys, topics['posts'], report, complete, prefix='topics.posts')
+        topics['posts'] = [{"id": row['id'], "topics": labels.get(row['id'], [])} for row in condensed_posts]
+        topics['topic_stats'] = compute_topic_stats(frame, labels)
+    
+    print("✅ Combined analysis complete!")
+    store_cached_result(cache_key, 'combined', combined, complete)
+    return finish({name: dict(combined[COMBINED_SECTIONS[name]], cached=False) for name in analyses}, {})
+
+def run_analyses_concurrently(posts_data, analyses, timeouts=None, mode='default', options=None):
+    """
+    Run several analyses over the same posts in parallel on the shared pool.
+    
+    Each analysis gets its own deadline measured from submission, so one slow
+    Gemini call only drops its own section instead of failing the whole batch.
+    A timed-out call keeps running in the background and still fills the cache.
+    
+    Args:
+        posts_data: List of post objects or a PostFrame
+        analyses: Names from ANALYSIS_FUNCTIONS to run
+        timeouts: Optional dict of per-analysis timeouts in seconds
+        mode: 'map_reduce' runs the analyses that support it over the full history
+        options: Map-reduce options (chunk_size, max_workers)
+    
+    Returns:
+        Tuple of (results, errors, timings_ms) dictionaries keyed by analysis name
+    """
+    timeouts = timeouts or {}
+    started = time.monotonic()
+    durations = {}
+    
+    def timed(name):
+        def run():
+            call_start = time.monotonic()
+            try:
+                return run_analysis(name, posts_data, mode, options)
+            finally:
+                durations[name] = round((time.monotonic() - call_start) * 1000)
+        return run
+    
+    futures = {
+        name: analysis_executor.submit(timed(name))
+        for name in analyses
+    }
+    
+    results = {}
+    errors = {}
+    for name, future in futures.items():
+        deadline = started + float(timeouts.get(name, ANALYSIS_TIMEOUT_SECONDS))
+        try:
+            result = future.result(timeout=max(0.0, deadline - time.monotonic()))
+        except FutureTimeoutError:
+            errors[name] = f"Timed out after {timeouts.get(name, ANALYSIS_TIMEOUT_SECONDS)}s"
+            continue
+        except Exception as e:
+            errors[name] = f"Analysis failed: {str(e)}"
+            continue
+        
+        if 'error' in result:
+            errors[name] = result['error']
+        else:
+            results[name] = result
+    
+    timings_ms = {name: durations.get(name) for name in analyses}
+    timings_ms['total'] = round((time.monotonic() - started) * 1000)
+    return results, errors, timings_ms
+
+@app.route('/analyze-all', methods=['POST'])
+def analyze_all_endpoint():
+    """
+    Run narrative insights, topics, evaluation and positioning concurrently.
+    
+    Expected JSON payload:
+    {
+        "posts": [...],                       # Same post objects as the other endpoints
+        "analyses": ["insights", "topics"],   # Optional, defaults to all four
+        "timeouts": {"evaluation": 90},       # Optional per-analysis timeouts in seconds
+        "mode": "combined"                    # Optional: "combined" (one Gemini call for all)
+                                              # or "map_reduce" (full history for insights and positioning)
+    }
+    
+    Returns whatever finished in time under "data" and the rest under "errors".
+    """
+    try:
+        data = request.get_json()
+        
+        if not data or 'posts' not in data:
+            return jsonify({
+                "error": "Invalid request. Expected JSON with 'posts' array."
+            }), 400
+        
+        posts = data['posts']
+        
+        if not isinstance(posts, list) or len(posts) == 0:
+            return jsonify({
+                "error": "Posts must be a non-empty array."
+            }), 400
+        
+        analyses, timeouts, selection_error = parse_analysis_selection(data)
+        if selection_error:
+            return jsonify({
+                "error": selection_error
+            }), 400
+        
+        mode, options, mode_error = parse_analysis_mode(data, ALL_ANALYSES_MODES)
+        if mode_error:
+            return jsonify({
+                "error": mode_error
+            }), 400
+        
+        # Parse and normalise the posts once for all four prompt builders
+        frame = PostFrame(posts)
+        if mode == 'combined':
+            results, errors, timings_ms = run_combined_analyses(frame, analyses)
+        else:
+            results, errors, timings_ms = run_analyses_concurrently(frame, analyses, timeouts, mode, options)
+        
+        return jsonify({
+            "success": len(results) > 0,
+            "partial": len(errors) > 0,
+            "data": results,
+            "errors": errors,
+            "timings_ms": timings_ms
+        }), 200 if results else 500
+        
+    except Exception as e:
+        return jsonify({
+            "error": f"Server error: {str(e)}"
+        }), 500
+
+def run_all_analyses_job(payload):
+    """Job handler that runs every analysis requested in the payload concurrently."""
+    analyses = payload.get('analyses') or list(ANALYSIS_FUNCTIONS.keys())
+    mode, options, _ = parse_analysis_mode(payload, ALL_ANALYSES_MODES)
+    if mode == 'combined':
+        results, errors, timings_ms = run_combined_analyses(PostFrame(payload['posts']), analyses)
+    else:
+        results, errors, timings_ms = run_analyses_concurrently(
+            PostFrame(payload['posts']), analyses, payload.get('timeouts'), mode, options
+        )
+    if not results:
+        return {"error": "All analyses failed.", "errors": errors, "timings_ms": timings_ms}
+    return {"data": results, "errors": errors, "timings_ms": timings_ms}
+
+# Configure background jobs; set ANALYSIS_JOBS_DB to keep jobs across restarts
+def run_analysis_job(name, payload):
+    """Job handler for a single analysis; honours "mode" and the topics "engine" like the synchronous endpoints."""
+    if name == 'topics':
+        return analyze_topics(payload['posts'], payload.get('engine'))
+    mode, options, _ = parse_analysis_mode(payload)
+    return run_analysis(name, payload['posts'], mode, options)
+
+JOB_HANDLERS = {
+    name: (lambda payload, name=name: run_analysis_job(name, payload))
+    for name in ANALYSIS_FUNCTIONS
+}
+JOB_HANDLERS['all'] = run_all_analyses_job
+job_queue = JobQueue(
+    JOB_HANDLERS,
+    max_workers=int(os.getenv('ANALYSIS_JOB_WORKERS', '4')),
+    db_path=os.getenv('ANALYSIS_JOBS_DB') or None
+)
+
+@app.route('/jobs', methods=['POST'])
+def submit_job_endpoint():
+    """
+    Queue an analysis and return a job id immediately.
+    
+    Expected JSON payload:
+    {
+        "analysis": "insights" | "topics" | "evaluation" | "positioning" | "all",
+        "posts": [...],
+        "analyses": [...],   # Optional, only for "all"
+        "timeouts": {...},   # Optional, only for "all"
+        "mode": "map_reduce", # Optional, plus "chunk_size" / "max_workers"; "all" also takes "combined"
+        "engine": "local"    # Optional, only for "topics"
+    }
+    """
+    try:
+        data = request.get_json()
+        
+        if not data or 'posts' not in data:
+            return jsonify({
+                "error": "Invalid request. Expected JSON with 'posts' array."
+            }), 400
+        
+        posts = data['posts']
+        
+        if not isinstance(posts, list) or len(posts) == 0:
+            return jsonify({
+                "error": "Posts must be a non-empty array."
+            }), 400
+        
+        analysis = data.get('analysis', 'all')
+        if analysis not in JOB_HANDLERS:
+            return jsonify({
+                "error": f"Unknown analysis '{analysis}'. Expected any of: {', '.join(JOB_HANDLERS.keys())}."
+            }), 400
+        
+        _, _, mode_error = parse_analysis_mode(data, ALL_ANALYSES_MODES if analysis == 'all' else ANALYSIS_MODES)
+        if mode_error:
+            return jsonify({
+                "error": mode_error
+            }), 400
+        
+        _, engine_error = parse_topics_engine(data)
+        if engine_error:
+            return jsonify({
+                "error": engine_error
+            }), 400
+        
+        if analysis == 'all':
+            _, _, selection_error = parse_analysis_selection(data)
+            if selection_error:
+                return jsonify({
+                    "error": selection_error
+                }), 400
+        
+        payload = {
+            key: data[key]
+            for key in ('posts', 'analyses', 'timeouts', 'mode', 'chunk_size', 'max_workers', 'engine') if key in data
+        }
+        job_id = job_queue.submit(analysis, payload)
+        
+        return jsonify({
+            "success": True,
+            "job_id": job_id,
+            "status": "queued",
+            "status_url": f"/jobs/{job_id}"
+        }), 202
+        
+    except Exception as e:
+        return jsonify({
+            "error": f"Server error: {str(e)}"
+        }), 500
+
+@app.route('/jobs/<job_id>', methods=['GET'])
+def get_job_endpoint(job_id):
+    """Return the status of a queued analysis job, plus its result once finished."""
+    job = job_queue.get(job_id)
+    if job is None:
+        return jsonify({
+            "error": f"Job '{job_id}' not found."
+        }), 404
+    
+    return jsonify(job)
+
 if __name__ == '__main__':
     print("\n" + "="*60)
     print("🚀 LinkedIn Analysis API Server")
     print("="*60)
-    print(f"Gemini API Key: {'✅ Configured' if GEMINI_API_KEY else '❌ Not found'}")
+    print(f"Gemini API Key: {'✅ Configured' if gemini.api_key else '❌ Not found'} ({len(gemini.keys)} in pool)")
+    print(f"LLM backend:    {gemini.backend.name}")
+    print(f"Result cache:   {result_cache.path if result_cache is not None else 'disabled'}")
     print("\nEndpoints:")
     print("  • GET  /health            - Health check")
+    print("  • GET  /metrics           - Prometheus metrics (per-route latency, stage timings, tokens)")
     print("  • POST /generate-insights - Generate narrative insights")
-    print("  • POST /analyze-topics    - Analyze post topics with LLM")
+    print(f"  • POST /analyze-topics    - Analyze post topics (engine: {TOPICS_ENGINE})")
     print("  • POST /evaluate-posts    - Evaluate post quality with rubric")
     print("  • POST /analyze-positioning - Analyze current and future positioning")
+    print("  • POST /generate-insights/stream   - Stream narrative insights (NDJSON)")
+    print("  • POST /analyze-positioning/stream - Stream positioning analysis (NDJSON)")
+    print("  • POST /analyze-all       - Run all four analyses concurrently")
+    print("    (insights, positioning and analyze-all accept \"mode\": \"map_reduce\" for full histories)")
+    print("    (analyze-all accepts \"mode\": \"combined\" for one Gemini call covering all four)")
+    print("  • POST /jobs              - Queue an analysis, returns a job id")
+    print("  • GET  /jobs/<id>         - Job status and result")
     print("\n" + "="*60 + "\n")
     
+    if gemini.is_configured():
+        try:
+            print(f"🔥 Gemini client warmed up in {gemini.warm_up()}ms")
+        except Exception as e:
+            print(f"⚠️  Gemini warm-up failed: {e}")
+    
     app.run(host='127.0.0.1', port=5000, debug=True)
 
@@ -0,0 +1,357 @@
+"""
+Pluggable LLM backends behind gemini_client.GeminiRegistry.
+
+A backend builds the model objects the registry calls generate_content on.
+Retries, hedging, rate limiting, single-flight and the caches sit above it,
+so swapping the backend leaves every one of those paths in play. Models are
+built per API key (see key_pool.py); the Gemini backend gives each key its own
+SDK clients.
+
+Backends (LLM_BACKEND):
+    gemini  - google.generativeai (default)
+    mock    - Offline stand-in that needs no key. It answers with schema-valid
+              JSON after a sampled latency, and injects 5xx errors, 429s and
+              timeouts at configured rates, so concurrency, caching and retry
+              behaviour can be load-tested locally. generate_content_async
+              waits with asyncio.sleep, like a real awaited network call.
+
+Mock settings (environment):
+    MOCK_LLM_LATENCY          Latency distribution in ms: fixed:MS, uniform:LO:HI
+                              or lognormal:MEDIAN:SIGMA (default lognormal:800:0.4)
+    MOCK_LLM_ERROR_RATE       Share of calls failing with 503 (default 0)
+    MOCK_LLM_RATE_LIMIT_RATE  Share of calls failing with 429 (default 0)
+    MOCK_LLM_SEED             Seed for latency and failure sampling (default 0)
+    MOCK_LLM_RESPONSES        JSON file of canned responses per profile; other
+                              profiles get JSON synthesized from their schema
+"""
+
+import os
+import re
+import json
+import math
+import time
+import asyncio
+import random
+import hashlib
+import threading
+from types import SimpleNamespace
+from collections import Counter
+
+from analysis_schemas import ANALYSIS_SCHEMAS
+from topic_clustering import TOPIC_VOCABULARY
+
+CHARS_PER_TOKEN = 4
+
+# Streamed mock responses are split into chunks of about this many characters
+STREAM_CHUNK_CHARS = 200
+
+# Failed calls return after this share of their sampled latency, like a fast 429
+FAILURE_LATENCY_SHARE = 0.1
+
+# Only names the topics prompt offers, so topic numbers from the mock stay in vocabulary
+MOCK_TOPICS = list(TOPIC_VOCABULARY)
+
+_JSON_ID = re.compile(r'"id"\s*:\s*(\d+)')
+_TSV_ID = re.compile(r'^(\d+)\t', re.MULTILINE)
+
+
+class _LazyAsyncClient:
+    """
+    A key's GenerativeServiceAsyncClient, built when a coroutine first uses it.
+
+    The async client binds to the event loop it is created on and cannot be
+    created in a thread without one, so it waits for the first awaited call.
+    """
+
+    def __init__(self, api_key):
+        self._api_key = api_key
+        self._client = None
+
+    def __getattr__(self, name):
+        if self._client is None:
+            import google.ai.generativelanguage as glm
+            self._client = glm.GenerativeServiceAsyncClient(client_options={'api_key': self._api_key})
+        return getattr(self._client, name)
+
+
+class GeminiBackend:
+    """
+    google.generativeai models with SDK clients per API key.
+
+    genai.configure() sets one key for the whole process, so models built
+    for a key are pointed at that key's own clients instead. Concurrent calls
+    on different keys then never share or overwrite a configuration. The
+    process-wide configuration still holds the primary key, which creates
+    context caches.
+    """
+
+    name = 'gemini'
+    requires_api_key = True
+
+    def __init__(self):
+        self._clients = {}
+        self._lock = threading.Lock()
+
+    def configure(self, api_key):
+        import google.generativeai as genai
+        genai.configure(api_key=api_key)
+
+    def model(self, profile, settings, api_key=None):
+        import google.generativeai as genai
+        model = genai.GenerativeModel(settings['model'], generation_config=settings['generation_config'] or None)
+        return self._bind(model, api_key)
+
+    def cached_model(self, cached_content_name, profile, settings, api_key=None):
+        import google.generativeai as genai
+        model = genai.GenerativeModel.from_cached_content(
+            cached_content_name,
+            generation_config=settings['generation_config'] or None
+        )
+        return self._bind(model, api_key)
+
+    def _bind(self, model, api_key):
+        """Point a model at the key's clients; without a key it keeps the process-wide ones."""
+        if not api_key:
+            return model
+        with self._lock:
+            clients = self._clients.get(api_key)
+            if clients is None:
+                import google.ai.generativelanguage as glm
+                clients = self._clients[api_key] = (
+                    glm.GenerativeServiceClient(client_options={'api_key': api_key}),
+                    _LazyAsyncClient(api_key)
+                )
+        # GenerativeModel looks these up lazily from the global configuration when they are unset
+        model._client, model._async_client = clients
+        return model
+
+    def stats(self):
+        return {'backend': self.name}
+
+
+class MockAPIError(Exception):
+    """Injected failure carrying an HTTP status in .code, like google.api_core errors."""
+
+    def __init__(self, code, message):
+        super().__init__(f"{code} {message}")
+        self.code = code
+
+
+def parse_latency(spec):
+    """
+    Parse a latency distribution spec into a sampler returning milliseconds.
+
+    Raises:
+        ValueError: If the spec is malformed
+    """
+    kind, _, args = spec.partition(':')
+    try:
+        values = [float(value) for value in args.split(':')] if args else []
+    except ValueError:
+        raise ValueError(f"Invalid latency spec '{spec}'")
+    if kind == 'fixed' and len(values) == 1:
+        return lambda rng: values[0]
+    if kind == 'uniform' and len(values) == 2:
+        return lambda rng: rng.uniform(values[0], values[1])
+    if kind == 'lognormal' and len(values) == 2:
+        return lambda rng: rng.lognormvariate(math.log(values[0]), values[1])
+    raise ValueError(f"Invalid latency spec '{spec}'. Expected fixed:MS, uniform:LO:HI or lognormal:MEDIAN:SIGMA.")
+
+
+def prompt_post_ids(prompt):
+    """Post ids present in a prompt's JSON or TSV post block, in order."""
+    ids = _JSON_ID.findall(prompt) or _TSV_ID.findall(prompt)
+    return list(dict.fromkeys(int(post_id) for post_id in ids))
+
+
+def synthesize(schema, rng, post_ids=(), field=''):
+    """
+    Build a value matching a response schema.
+
+    Arrays of objects with an integer 'id' get one item per post id in the
+    prompt, so per-post answers (topic tags) line up with the posts sent.
+    """
+    kind = schema.get('type')
+    if kind == 'object':
+        return {key: synthesize(prop, rng, post_ids, key) for key, prop in schema.get('properties', {}).items()}
+    if kind == 'array':
+        items = schema.get('items', {})
+        if field == 'topics':
+            return rng.sample(MOCK_TOPICS, rng.randint(1, 2))
+        if post_ids and items.get('properties', {}).get('id', {}).get('type') == 'integer':
+            return [{**synthesize(items, rng, (), field), 'id': post_id} for post_id in post_ids]
+        return [synthesize(items, rng, post_ids, field) for _ in range(rng.randint(2, 4))]
+    if 'enum' in schema:
+        return rng.choice(schema['enum'])
+    if kind == 'integer':
+        return rng.randint(0, 100)
+    if kind == 'number':
+        return round(rng.uniform(0, 100), 1)
+    if kind == 'boolean':
+        return rng.random() < 0.5
+    return f"Mock {field.replace('_', ' ') or 'text'} {rng.randint(1, 999)}"
+
+
+def _usage(prompt, text):
+    prompt_tokens = len(prompt) // CHARS_PER_TOKEN
+    output_tokens = len(text) // CHARS_PER_TOKEN
+    return SimpleNamespace(
+        prompt_token_count=prompt_tokens,
+        candidates_token_count=output_tokens,
+        total_token_count=prompt_tokens + output_tokens
+    )
+
+
+class MockModel:
+    """GenerativeModel stand-in for one profile; see MockBackend."""
+
+    def __init__(self, backend, profile, settings):
+        self.backend = backend
+        self.profile = profile
+        self.model_name = settings['model']
+        self.generation_config = settings['generation_config'] or {}
+
+    def _failure(self, latency_ms, failure, request_options):
+        """(seconds to wait, error to raise) for an injected failure or timeout, else None."""
+        timeout = (request_options or {}).get('timeout')
+        if failure:
+            self.backend.count(f"failed_{failure}")
+            return latency_ms * FAILURE_LATENCY_SHARE / 1000, MockAPIError(
+                failure, 'Too Many Requests' if failure == 429 else 'Service Unavailable'
+            )
+        if timeout is not None and latency_ms / 1000 > timeout:
+            self.backend.count('timeouts')
+            return timeout, MockAPIError(504, 'Deadline Exceeded')
+        return None
+
+    def generate_content(self, prompt, stream=False, request_options=None, generation_config=None, **kwargs):
+        latency_ms, failure = self.backend.sample()
+        injected = self._failure(latency_ms, failure, request_options)
+        if injected:
+            time.sleep(injected[0])
+            raise injected[1]
+
+        text = self.backend.respond(self.profile, prompt, generation_config or self.generation_config)
+        self.backend.count('calls')
+        if stream:
+            return self._stream(prompt, text, latency_ms)
+        time.sleep(latency_ms / 1000)
+        return SimpleNamespace(text=text, parts=[text], usage_metadata=_usage(prompt, text))
+
+    async def generate_content_async(self, prompt, request_options=None, generation_config=None, **kwargs):
+        latency_ms, failure = self.backend.sample()
+        injected = self._failure(latency_ms, failure, request_options)
+        if injected:
+            await asyncio.sleep(injected[0])
+            raise injected[1]
+
+        text = self.backend.respond(self.profile, prompt, generation_config or self.generation_config)
+        self.backend.count('calls')
+        await asyncio.sleep(latency_ms / 1000)
+        return SimpleNamespace(text=text, parts=[text], usage_metadata=_usage(prompt, text))
+
+    def _stream(self, prompt, text, latency_ms):
+        pieces = [text[start:start + STREAM_CHUNK_CHARS] for start in range(0, len(text), STREAM_CHUNK_CHARS)] or ['']
+        for number, piece in enumerate(pieces):
+            time.sleep(latency_ms / len(pieces) / 1000)
+            last = number == len(pieces) - 1
+            yield SimpleNamespace(text=piece, parts=[piece] if piece else [], usage_metadata=_usage(prompt, text) if last else None)
+
+    def count_tokens(self, contents):
+        return SimpleNamespace(total_tokens=len(str(contents)) // CHARS_PER_TOKEN)
+
+
+class MockBackend:
+    """
+    Deterministic offline backend with latency and failure injection.
+
+    Latency and failures come from one seeded sequence. Response content is
+    seeded by the prompt, so the same prompt always gets the same answer.
+    """
+
+    name = 'mock'
+    requires_api_key = False
+
+    def __init__(self, latency='lognormal:800:0.4', error_rate=0.0, rate_limit_rate=0.0, seed=0,
+                 responses=None, schemas=None):
+        self.latency = latency
+        self._sample_latency = parse_latency(latency)
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.responses = responses or {}
+        self.schemas = schemas if schemas is not None else ANALYSIS_SCHEMAS
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self._counts = Counter()
+
+    def configure(self, api_key):
+        pass
+
+    def model(self, profile, settings, api_key=None):
+        return MockModel(self, profile, settings)
+
+    def cached_model(self, cached_content_name, profile, settings, api_key=None):
+        return MockModel(self, profile, settings)
+
+    def sample(self):
+        """Draw (latency_ms, failure status or None) for one call."""
+        with self._lock:
+            latency_ms = max(0.0, self._sample_latency(self._rng))
+            roll = self._rng.random()
+        if roll < self.rate_limit_rate:
+            return latency_ms, 429
+        if roll < self.rate_limit_rate + self.error_rate:
+            return latency_ms, 503
+        return latency_ms, None
+
+    def respond(self, profile, prompt, generation_config):
+        """Canned response for the profile, else JSON synthesized from the request's schema."""
+        if profile in self.responses:
+            canned = self.responses[profile]
+            return canned if isinstance(canned, str) else json.dumps(canned)
+        schema = (generation_config or {}).get('response_schema') or self.schemas.get(profile)
+        if schema is None:
+            return json.dumps({'text': f"Mock response for {profile}"})
+        seed = int(hashlib.sha256(f"{profile}|{prompt}".encode('utf-8')).hexdigest()[:16], 16)
+        return json.dumps(synthesize(schema, random.Random(seed), prompt_post_ids(prompt)), ensure_ascii=False)
+
+    def count(self, event):
+        with self._lock:
+            self._counts[event] += 1
+
+    def stats(self):
+        with self._lock:
+            return {
+                'backend': self.name,
+                'latency': self.latency,
+                'error_rate': self.error_rate,
+                'rate_limit_rate': self.rate_limit_rate,
+                **dict(self._counts)
+            }
+
+
+def backend_from_env():
+    """
+    Build the backend selected by LLM_BACKEND.
+
+    Raises:
+        ValueError: If LLM_BACKEND or a mock setting is invalid
+    """
+    name = os.getenv('LLM_BACKEND', 'gemini').lower()
+    if name == 'gemini':
+        return GeminiBackend()
+    if name != 'mock':
+        raise ValueError(f"Unknown LLM_BACKEND '{name}'. Expected gemini or mock.")
+
+    responses = None
+    responses_path = os.getenv('MOCK_LLM_RESPONSES')
+    if responses_path:
+        with open(responses_path, 'r', encoding='utf-8') as f:
+            responses = json.load(f)
+    return MockBackend(
+        latency=os.getenv('MOCK_LLM_LATENCY', 'lognormal:800:0.4'),
+        error_rate=float(os.getenv('MOCK_LLM_ERROR_RATE', '0')),
+        rate_limit_rate=float(os.getenv('MOCK_LLM_RATE_LIMIT_RATE', '0')),
+        seed=int(os.getenv('MOCK_LLM_SEED', '0')),
+        responses=responses
+    )
@@ -0,0 +1,232 @@
+"""
+Tolerant decoding of JSON returned by the LLM.
+
+Responses are parsed strictly first. If that fails, common defects are
+repaired: markdown fences, prose around the object, trailing commas, raw
+newlines inside strings and output truncated mid-document. The decoded value
+is then conformed to the analysis schema. Missing fields get defaults and
+scalar types are coerced, so a slightly malformed answer no longer costs a
+full re-generation.
+"""
+
+import json
+import math
+
+# Give up after this many attempts to cut a truncated tail back to a clean boundary
+MAX_TRUNCATION_RETRIES = 20
+
+
+def strip_code_fences(text):
+    """Remove a surrounding ```json ... ``` fence if present."""
+    text = (text or '').strip()
+    if text.startswith('```json'):
+        text = text[7:]
+    if text.startswith('```'):
+        text = text[3:]
+    if text.endswith('```'):
+        text = text[:-3]
+    return text.strip()
+
+
+def _strip_trailing_comma(chars):
+    while chars and chars[-1] in ' \t\r\n':
+        chars.pop()
+    if chars and chars[-1] == ',':
+        chars.pop()
+
+
+def repair_json(text):
+    """
+    Best-effort rewrite of almost-JSON into parseable JSON.
+
+    Drops text before the first bracket and after the root value closes,
+    removes trailing commas, escapes raw newlines in strings and closes
+    any strings, arrays and objects left open by truncation.
+    """
+    starts = [i for i in (text.find('{'), text.find('[')) if i != -1]
+    if not starts:
+        raise ValueError("No JSON object found in response")
+
+    out = []
+    stack = []
+    in_string = False
+    escape = False
+    for char in text[min(starts):]:
+        if in_string:
+            if escape:
+                escape = False
+            elif char == '\\':
+                escape = True
+            elif char == '"':
+                in_string = False
+            elif char == '\n':
+                char = '\\n'
+            out.append(char)
+            continue
+
+        if char == '"':
+            in_string = True
+            out.append(char)
+        elif char in '{[':
+            stack.append('}' if char == '{' else ']')
+            out.append(char)
+        elif char in '}]':
+            if not stack:
+                break
+            _strip_trailing_comma(out)
+            out.append(stack.pop())
+            if not stack:
+                break
+        else:
+            out.append(char)
+
+    if in_string:
+        if escape:
+            out.pop()
+        out.append('"')
+
+    repaired = ''.join(out).rstrip()
+    while stack:
+        repaired = repaired.rstrip()
+        if repaired.endswith(','):
+            repaired = repaired[:-1]
+        elif repaired.endswith(':'):
+            repaired += ' null'
+        repaired += stack.pop()
+    return repaired
+
+
+def _parse_with_repairs(text):
+    """Repair and parse, cutting a truncated tail back one element at a time if needed."""
+    candidate = text
+    for _ in range(MAX_TRUNCATION_RETRIES):
+        try:
+            return json.loads(repair_json(candidate))
+        except ValueError:
+            cut = candidate.rfind(',')
+            if cut == -1:
+                break
+            candidate = candidate[:cut]
+    raise ValueError("Response is not valid JSON and could not be repaired")
+
+
+def default_for(schema):
+    """Empty value of the right shape for a schema."""
+    kind = schema.get('type')
+    if kind == 'object':
+        return {key: default_for(prop) for key, prop in schema.get('properties', {}).items()}
+    if kind == 'array':
+        return []
+    if kind == 'string':
+        return ""
+    if kind in ('integer', 'number'):
+        return 0
+    if kind == 'boolean':
+        return False
+    return None
+
+
+def _path_label(path):
+    return '.'.join(str(part) for part in path) or '<root>'
+
+
+def conform(value, schema, path=(), report=None):
+    """
+    Coerce a decoded value to a schema, filling defaults for missing fields.
+
+    Problems are appended to report['missing'] and report['coerced'] as dotted paths.
+    """
+    if report is None:
+        report = {'missing': [], 'coerced': []}
+    kind = schema.get('type')
+
+    if value is None:
+        report['missing'].append(_path_label(path))
+        return default_for(schema)
+
+    if kind == 'object':
+        if not isinstance(value, dict):
+            report['coerced'].append(_path_label(path))
+            value = {}
+        result = dict(value)
+        for key, prop in schema.get('properties', {}).items():
+            if key not in value:
+                report['missing'].append(_path_label(path + (key,)))
+                result[key] = default_for(prop)
+            else:
+                result[key] = conform(value[key], prop, path + (key,), report)
+        return result
+
+    if kind == 'array':
+        if isinstance(value, (str, dict)):
+            report['coerced'].append(_path_label(path))
+            value = [value]
+        elif not isinstance(value, list):
+            report['coerced'].append(_path_label(path))
+            return []
+        items = schema.get('items')
+        if not items:
+            return value
+        return [conform(item, items, path + (index,), report) for index, item in enumerate(value)]
+
+    if kind == 'string':
+        if isinstance(value, str):
+            return value
+        report['coerced'].append(_path_label(path))
+        if isinstance(value, list):
+            return ', '.join(str(item) for item in value)
+        return json.dumps(value) if isinstance(value, dict) else str(value)
+
+    if kind in ('integer', 'number'):
+        if isinstance(value, (int, float)) and not isinstance(value, bool) and math.isfinite(value):
+            return int(round(value)) if kind == 'integer' else value
+        report['coerced'].append(_path_label(path))
+        try:
+            number = float(str(value).strip().rstrip('%'))
+        except ValueError:
+            return 0
+        # nan and inf cannot be rounded to an integer or serialised as JSON
+        if not math.isfinite(number):
+            return 0
+        return int(round(number)) if kind == 'integer' else number
+
+    if kind == 'boolean':
+        if isinstance(value, bool):
+            return value
+        report['coerced'].append(_path_label(path))
+        if isinstance(value, str):
+            return value.strip().lower() in ('true', 'yes', '1')
+        return bool(value)
+
+    return value
+
+
+def decode_llm_json(text, schema=None, normalize=None):
+    """
+    Decode an LLM response into JSON, repairing it and conforming it to a schema.
+
+    Args:
+        text: Raw response text
+        schema: Optional schema from analysis_schemas
+        normalize: Optional callable applied to the parsed value before conforming
+
+    Returns:
+        Tuple of (value, report) where report has 'repaired' (bool) and
+        'missing' / 'coerced' (lists of dotted field paths)
+
+    Raises:
+        ValueError: If no JSON document can be recovered at all
+    """
+    report = {'repaired': False, 'missing': [], 'coerced': []}
+    cleaned = strip_code_fences(text)
+    try:
+        value = json.loads(cleaned)
+    except ValueError:
+        value = _parse_with_repairs(cleaned)
+        report['repaired'] = True
+
+    if normalize is not None:
+        value = normalize(value)
+    if schema is not None:
+        value = conform(value, schema, (), report)
+    return value, report
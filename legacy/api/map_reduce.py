@@ -0,0 +1,72 @@
+"""
+Map-reduce helpers for analysing a full posting history.
+
+The history is split into chronological chunks. Each chunk is summarised by
+its own concurrent "map" call into a compact digest, and one "reduce" call
+then runs the analysis over the digests instead of the raw posts. Wall time
+is roughly one chunk call plus the reduce call, whatever the history length.
+
+Chunks are cut from the oldest post forward. Older chunks keep the same
+posts when new ones are scraped, so their digests keep hitting the result
+cache and only the newest chunk is re-summarised.
+"""
+
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+
+def chunk_indices(frame, chunk_size):
+    """
+    Split post positions into chronological chunks, oldest first.
+
+    Posts arrive newest first, so chronological order is the reverse of the
+    frame's order.
+
+    Returns:
+        List of numpy index arrays, each at most chunk_size long
+    """
+    if chunk_size < 1:
+        raise ValueError("chunk_size must be at least 1")
+    positions = np.arange(len(frame))[::-1]
+    return [positions[start:start + chunk_size] for start in range(0, len(positions), chunk_size)]
+
+
+def chunk_stats(frame, indices):
+    """Exact engagement statistics for one chunk, attached to its digest."""
+    engagement = frame.engagement[indices]
+    dates = [frame.dates[i] for i in indices if frame.dates[i]]
+    return {
+        'posts': int(len(indices)),
+        'from': dates[0] if dates else None,
+        'to': dates[-1] if dates else None,
+        'avg_engagement': round(float(engagement.mean()), 1) if len(indices) else 0,
+        'median_engagement': round(float(np.median(engagement)), 1) if len(indices) else 0,
+        'max_engagement': int(engagement.max()) if len(indices) else 0,
+        'image_share': round(float(frame.has_image[indices].mean()), 3) if len(indices) else 0
+    }
+
+
+def run_map(chunks, map_fn, max_workers):
+    """
+    Run map_fn(chunk_number, indices) for every chunk concurrently.
+
+    Failed chunks are reported rather than raised, so the reduce step can
+    still run over the chunks that succeeded.
+
+    Returns:
+        Tuple of (outputs, failures, timings_ms): outputs is a list with None for
+        failed chunks and failures maps chunk number to error message
+    """
+    started = time.monotonic()
+    outputs = [None] * len(chunks)
+    failures = {}
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(chunks) or 1))) as pool:
+        futures = [pool.submit(map_fn, number, indices) for number, indices in enumerate(chunks)]
+        for number, future in enumerate(futures):
+            try:
+                outputs[number] = future.result()
+            except Exception as e:
+                failures[number] = str(e)
+    return outputs, failures, round((time.monotonic() - started) * 1000)
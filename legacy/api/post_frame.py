@@ -0,0 +1,122 @@
+"""
+Columnar post condensation shared by all analysis prompts.
+
+A request's posts are parsed and normalised once into numpy columns
+(likes, comments, reposts, engagement, timestamps, reshare flags) plus
+plain lists for the text columns. Each prompt builder then asks for a
+condensed view with its own field set, post limit and content length
+instead of re-walking the raw post dictionaries.
+"""
+
+from datetime import datetime
+
+import numpy as np
+
+# Field sets used by each analysis prompt, in the order they appear in the prompt
+NARRATIVE_FIELDS = ('id', 'content', 'likes', 'comments', 'reposts', 'engagement', 'has_image', 'type', 'date')
+TOPIC_FIELDS = ('id', 'content', 'engagement', 'likes', 'comments')
+EVALUATION_FIELDS = ('id', 'content', 'engagement', 'likes', 'comments', 'reposts', 'has_image', 'type')
+POSITIONING_FIELDS = ('id', 'content', 'engagement', 'likes', 'comments', 'reposts', 'has_image', 'type', 'date')
+
+
+def _to_int(value):
+    """Coerce a count that may arrive as a number, numeric string or null."""
+    if value is None or value == '':
+        return 0
+    try:
+        return int(float(value))
+    except (TypeError, ValueError):
+        return 0
+
+
+def _to_timestamp(value):
+    """Parse an ISO-8601 date string into epoch seconds, or NaN when unknown."""
+    if not value or not isinstance(value, str):
+        return np.nan
+    try:
+        return datetime.fromisoformat(value.strip().replace('Z', '+00:00')).timestamp()
+    except ValueError:
+        return np.nan
+
+
+class PostFrame:
+    """Normalised, column-oriented view of a list of post objects."""
+
+    def __init__(self, posts_data):
+        count = len(posts_data)
+        self.content = []
+        self.types = []
+        self.dates = []
+        self.likes = np.zeros(count, dtype=np.int64)
+        self.comments = np.zeros(count, dtype=np.int64)
+        self.reposts = np.zeros(count, dtype=np.int64)
+        self.has_image = np.zeros(count, dtype=bool)
+        self.is_reshare = np.zeros(count, dtype=bool)
+        self.timestamps = np.full(count, np.nan, dtype=np.float64)
+
+        for idx, post in enumerate(posts_data):
+            self.content.append(post.get('postContent') or '')
+            self.types.append(post.get('type') or 'Text')
+            date = post.get('postTimestamp', post.get('postDate', '')) or ''
+            self.dates.append(date)
+            self.likes[idx] = _to_int(post.get('likeCount'))
+            self.comments[idx] = _to_int(post.get('commentCount'))
+            self.reposts[idx] = _to_int(post.get('repostCount'))
+            self.has_image[idx] = bool(post.get('imgUrl'))
+            # Scraped activity feeds mark reposts with an action like "Jane Doe reposted this"
+            self.is_reshare[idx] = (post.get('action') or '').endswith('reposted this')
+            self.timestamps[idx] = _to_timestamp(date)
+
+        self.engagement = self.likes + self.comments + self.reposts
+
+    @classmethod
+    def coerce(cls, posts):
+        """Return posts unchanged if already a PostFrame, otherwise build one."""
+        return posts if isinstance(posts, cls) else cls(posts)
+
+    def __len__(self):
+        return len(self.content)
+
+    def by_engagement(self, indices=None):
+        """Return indices ordered by engagement, highest first (stable for ties)."""
+        if indices is None:
+            indices = np.arange(len(self))
+        indices = np.asarray(indices, dtype=np.int64)
+        return indices[np.argsort(-self.engagement[indices], kind='stable')]
+
+    def condense(self, fields, limit=None, content_chars=None, indices=None):
+        """
+        Build the list of condensed post dictionaries a prompt embeds.
+
+        Args:
+            fields: Field names to include (see the *_FIELDS constants)
+            limit: Take the first N posts (the most recent) when indices is not given
+            content_chars: Max characters of content, either one int or one per selected post
+            indices: Explicit post positions to include
+
+        Returns:
+            List of dicts sorted by engagement, highest first
+        """
+        if indices is None:
+            indices = np.arange(len(self) if limit is None else min(limit, len(self)))
+        indices = np.asarray(indices, dtype=np.int64)
+
+        if content_chars is None or np.isscalar(content_chars):
+            char_limits = {int(i): content_chars for i in indices}
+        else:
+            char_limits = {int(i): int(c) for i, c in zip(indices, content_chars)}
+
+        order = self.by_engagement(indices).tolist()
+        columns = {
+            'id': lambda: order,
+            'content': lambda: [self.content[i][:char_limits[i]] for i in order],
+            'likes': lambda: self.likes[order].tolist(),
+            'comments': lambda: self.comments[order].tolist(),
+            'reposts': lambda: self.reposts[order].tolist(),
+            'engagement': lambda: self.engagement[order].tolist(),
+            'has_image': lambda: self.has_image[order].tolist(),
+            'type': lambda: [self.types[i] for i in order],
+            'date': lambda: [self.dates[i] for i in order]
+        }
+        selected = [columns[field]() for field in fields]
+        return [dict(zip(fields, values)) for values in zip(*selected)]
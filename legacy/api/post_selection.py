@@ -0,0 +1,139 @@
+"""
+Token-budget-aware post selection for analysis prompts.
+
+Instead of always sending the first N posts cut at a fixed length, posts are
+picked from several strata in turn (highest engagement, most recent, one of
+each post type, lowest engagement) and packed into a token budget. Content
+is truncated adaptively: the fewer posts fit, the more of each one is kept,
+and high-engagement picks keep more text than contrast picks.
+"""
+
+import math
+
+import numpy as np
+
+# Rough chars-per-token ratio for English LinkedIn text with Gemini's tokenizer
+CHARS_PER_TOKEN = 4
+
+# Default tokens per field (key, punctuation, short value) in an indented JSON row
+FIELD_OVERHEAD_TOKENS = 5
+
+# Order in which strata take turns; top and recent posts get two picks per round
+STRATA_ROUND = ('top', 'recent', 'type', 'top', 'recent', 'bottom')
+
+
+def estimate_tokens(text):
+    """Cheap local token estimate for a piece of text."""
+    if not text:
+        return 0
+    return max(1, math.ceil(len(text) / CHARS_PER_TOKEN))
+
+
+def _recency_order(frame):
+    """Positions ordered newest first, using timestamps when known and list order otherwise."""
+    positions = np.arange(len(frame))
+    timestamps = np.where(np.isnan(frame.timestamps), -np.inf, frame.timestamps)
+    if np.all(np.isinf(timestamps)):
+        return positions
+    return positions[np.lexsort((positions, -timestamps))]
+
+
+def _type_order(frame):
+    """Round-robin over post types, best-performing post of each type first."""
+    by_type = {}
+    for idx in frame.by_engagement().tolist():
+        by_type.setdefault(frame.types[idx], []).append(idx)
+    order = []
+    queues = list(by_type.values())
+    while queues:
+        order.extend(queue.pop(0) for queue in queues)
+        queues = [queue for queue in queues if queue]
+    return np.asarray(order, dtype=np.int64)
+
+
+def select_posts(frame, token_budget, fields, max_content_chars, min_content_chars=80, max_posts=None,
+                 field_overhead_tokens=FIELD_OVERHEAD_TOKENS):
+    """
+    Pick posts and per-post content lengths that fit a token budget.
+
+    Args:
+        frame: PostFrame for the request
+        token_budget: Approximate input tokens available for the post rows
+        fields: Fields each condensed row will include (for overhead estimates)
+        max_content_chars: Longest content excerpt any single post may keep
+        min_content_chars: Shortest excerpt worth sending
+        max_posts: Optional hard cap on the number of posts
+        field_overhead_tokens: Tokens each field costs in the prompt encoding
+
+    Returns:
+        Tuple of (indices, content_chars) arrays in selection order
+    """
+    count = len(frame)
+    if count == 0:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+
+    row_overhead = field_overhead_tokens * len(fields)
+    has_content = np.asarray([bool(text.strip()) for text in frame.content])
+    lengths = np.asarray([len(text) for text in frame.content], dtype=np.int64)
+
+    # Base excerpt length: share the budget evenly over the posts we could send
+    target_posts = min(count, max_posts or count)
+    share_chars = (token_budget / target_posts - row_overhead) * CHARS_PER_TOKEN
+    base_chars = int(np.clip(share_chars, min_content_chars, max_content_chars))
+
+    engagement_order = frame.by_engagement()
+    strata = {
+        'top': engagement_order,
+        'bottom': engagement_order[::-1],
+        'recent': _recency_order(frame),
+        'type': _type_order(frame)
+    }
+    # Contrast picks (lowest engagement, type coverage) only need the gist
+    stratum_chars = {
+        'top': min(max_content_chars, int(base_chars * 1.5)),
+        'recent': base_chars,
+        'type': max(min_content_chars, int(base_chars * 0.75)),
+        'bottom': max(min_content_chars, base_chars // 2)
+    }
+    cursors = {name: 0 for name in strata}
+
+    selected = []
+    content_chars = []
+    chosen = np.zeros(count, dtype=bool)
+    remaining = token_budget
+    exhausted = set()
+
+    while len(exhausted) < len(strata) and (max_posts is None or len(selected) < max_posts):
+        progressed = False
+        for name in STRATA_ROUND:
+            if name in exhausted or (max_posts is not None and len(selected) >= max_posts):
+                continue
+
+            order = strata[name]
+            while cursors[name] < len(order) and (chosen[order[cursors[name]]] or not has_content[order[cursors[name]]]):
+                cursors[name] += 1
+            if cursors[name] >= len(order):
+                exhausted.add(name)
+                continue
+
+            idx = int(order[cursors[name]])
+            chars = min(stratum_chars[name], int(lengths[idx]))
+            cost = row_overhead + estimate_tokens(frame.content[idx][:chars])
+            if cost > remaining:
+                # Shrink the excerpt to whatever still fits, if that is still worth sending
+                chars = min(chars, (remaining - row_overhead) * CHARS_PER_TOKEN)
+                if chars < min(min_content_chars, lengths[idx]):
+                    exhausted.update(strata.keys())
+                    break
+                cost = row_overhead + estimate_tokens(frame.content[idx][:chars])
+
+            chosen[idx] = True
+            selected.append(idx)
+            content_chars.append(chars)
+            remaining -= cost
+            progressed = True
+
+        if not progressed:
+            break
+
+    return np.asarray(selected, dtype=np.int64), np.asarray(content_chars, dtype=np.int64)
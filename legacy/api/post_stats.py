@@ -0,0 +1,163 @@
+"""
+Deterministic engagement statistics computed from a PostFrame.
+
+Arithmetic the prompts used to ask Gemini for is done here with vectorised
+numpy aggregation instead. The results are exact, and output tokens are
+only spent on the parts that need a language model.
+"""
+
+import numpy as np
+
+# Upper character bounds of the post length buckets; the last bucket is open-ended
+LENGTH_EDGES = (300, 800, 1500)
+LENGTH_LABELS = ('<300 chars', '300-799 chars', '800-1499 chars', '1500+ chars')
+
+WEEKDAYS = ('Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat', 'Sun')
+
+# Six-hour windows of the UTC posting time
+HOUR_LABELS = ('00-05 UTC', '06-11 UTC', '12-17 UTC', '18-23 UTC')
+
+# Hour effects need real posting times; date-only timestamps all land on midnight
+MIN_TIMED_SHARE = 0.5
+
+SECONDS_PER_DAY = 86400
+
+# 1970-01-01 was a Thursday; shifts epoch days so Monday is 0
+EPOCH_WEEKDAY = 3
+
+
+def _column_stats(engagement, membership):
+    """Count, mean, median and p90 of engagement for every membership column at once."""
+    counts = membership.sum(axis=0)
+    means = (engagement @ membership) / counts
+    # Non-members become NaN so the nan-aware reductions work per column at once
+    per_column = np.where(membership, engagement[:, None], np.nan)
+    return counts, means, np.nanmedian(per_column, axis=0), np.nanpercentile(per_column, 90, axis=0)
+
+
+def topic_stats(frame, labels):
+    """
+    Per-topic engagement statistics over labelled posts.
+
+    Builds a posts x topics membership matrix and aggregates every topic in
+    one pass: count, share of labelled posts, mean, median and p90 engagement.
+
+    Args:
+        frame: PostFrame the post ids index into
+        labels: {post id: [topics]}
+
+    Returns:
+        {topic: {count, share, avg_engagement, median_engagement, p90_engagement}},
+        most frequent topic first
+    """
+    post_ids = [post_id for post_id, topics in labels.items() if topics]
+    topics = sorted({topic for post_id in post_ids for topic in labels[post_id]})
+    if not post_ids or not topics:
+        return {}
+
+    column = {topic: index for index, topic in enumerate(topics)}
+    membership = np.zeros((len(post_ids), len(topics)), dtype=bool)
+    for row, post_id in enumerate(post_ids):
+        membership[row, [column[topic] for topic in labels[post_id]]] = True
+
+    engagement = frame.engagement[np.asarray(post_ids, dtype=np.int64)].astype(float)
+    counts, means, medians, p90s = _column_stats(engagement, membership)
+
+    order = sorted(range(len(topics)), key=lambda index: (-counts[index], topics[index]))
+    return {
+        topics[index]: {
+            'count': int(counts[index]),
+            'share': round(float(counts[index] / len(post_ids)), 3),
+            'avg_engagement': round(float(means[index]), 1),
+            'median_engagement': round(float(medians[index]), 1),
+            'p90_engagement': round(float(p90s[index]), 1)
+        }
+        for index in order
+    }
+
+
+def _comments_per_like(comments, likes):
+    return round(float(comments / likes), 3) if likes else None
+
+
+def _segment_stats(frame, codes, names, overall_mean):
+    """
+    Engagement per segment for posts coded 0..len(names)-1; posts coded -1 are left out.
+
+    uplift is the segment's mean engagement relative to the mean over all posts.
+    """
+    present = np.unique(codes[codes >= 0])
+    if not len(present):
+        return {}
+    membership = codes[:, None] == present[None, :]
+    engagement = frame.engagement.astype(float)
+    counts, means, medians, _ = _column_stats(engagement, membership)
+    likes = frame.likes @ membership
+    comments = frame.comments @ membership
+    return {
+        names[code]: {
+            'count': int(counts[index]),
+            'share': round(float(counts[index] / len(frame)), 3),
+            'avg_engagement': round(float(means[index]), 1),
+            'median_engagement': round(float(medians[index]), 1),
+            'uplift': round(float(means[index] / overall_mean - 1), 3) if overall_mean else None,
+            'comments_per_like': _comments_per_like(comments[index], likes[index])
+        }
+        for index, code in enumerate(present)
+    }
+
+
+def engagement_breakdown(frame):
+    """
+    Engagement by post format, image, length, posting time and origin over every post.
+
+    Answers the numeric questions the narrative prompt used to leave to the
+    model (do images help, does length matter, when to post, do reshares
+    land) exactly and over the full history rather than a sample.
+
+    Returns:
+        {'overall': {posts, avg_engagement, median_engagement, comments_per_like},
+         'by_type' | 'by_image' | 'by_length' | 'by_weekday' | 'by_hour' | 'by_origin':
+             {segment: {count, share, avg_engagement, median_engagement, uplift, comments_per_like}}}
+        by_hour is None when the posts carry dates without times
+    """
+    count = len(frame)
+    if count == 0:
+        return {'overall': {'posts': 0}}
+
+    engagement = frame.engagement.astype(float)
+    overall_mean = float(engagement.mean())
+    breakdown = {'overall': {
+        'posts': count,
+        'avg_engagement': round(overall_mean, 1),
+        'median_engagement': round(float(np.median(engagement)), 1),
+        'comments_per_like': _comments_per_like(frame.comments.sum(), frame.likes.sum())
+    }}
+
+    types = sorted(set(frame.types))
+    type_codes = np.asarray([types.index(post_type) for post_type in frame.types], dtype=np.int64)
+    breakdown['by_type'] = _segment_stats(frame, type_codes, types, overall_mean)
+    breakdown['by_image'] = _segment_stats(
+        frame, frame.has_image.astype(np.int64), ('without image', 'with image'), overall_mean
+    )
+
+    lengths = np.fromiter((len(text) for text in frame.content), dtype=np.int64, count=count)
+    breakdown['by_length'] = _segment_stats(frame, np.digitize(lengths, LENGTH_EDGES), LENGTH_LABELS, overall_mean)
+
+    dated = ~np.isnan(frame.timestamps)
+    timestamps = np.where(dated, frame.timestamps, 0)
+    days = np.floor_divide(timestamps, SECONDS_PER_DAY).astype(np.int64)
+    weekday_codes = np.where(dated, (days + EPOCH_WEEKDAY) % 7, -1)
+    breakdown['by_weekday'] = _segment_stats(frame, weekday_codes, WEEKDAYS, overall_mean)
+
+    seconds_of_day = (timestamps - days * SECONDS_PER_DAY).astype(np.int64)
+    timed = dated & (seconds_of_day != 0)
+    breakdown['by_hour'] = None
+    if timed.any() and timed.sum() >= MIN_TIMED_SHARE * dated.sum():
+        hour_codes = np.where(timed, seconds_of_day // 3600 // 6, -1)
+        breakdown['by_hour'] = _segment_stats(frame, hour_codes, HOUR_LABELS, overall_mean)
+
+    breakdown['by_origin'] = _segment_stats(
+        frame, frame.is_reshare.astype(np.int64), ('original', 'reshare'), overall_mean
+    )
+    return breakdown
@@ -0,0 +1,82 @@
+"""
+Pluggable serializers for the post rows embedded in analysis prompts.
+
+Encodings:
+    json      - Indented JSON, the original format (most tokens)
+    json-min  - Minified JSON with unicode kept as-is
+    tsv       - One header line plus one tab-separated row per post
+
+Pick one with the PROMPT_ENCODING environment variable and compare them with
+benchmarks/prompt_encoding_benchmark.py.
+
+CACHED_CONTEXT is not a serializer. It is passed as the encoding when the posts
+were already uploaded as cached context (see context_cache.py), and encode_posts
+then emits a short reference to them instead of the rows.
+"""
+
+import json
+
+DEFAULT_ENCODING = 'json-min'
+
+CACHED_CONTEXT = 'cached-context'
+
+# Approximate tokens spent per field on keys and punctuation, used when packing posts
+FIELD_OVERHEAD_TOKENS = {
+    'json': 5,
+    'json-min': 3,
+    'tsv': 1
+}
+
+
+def _encode_json(rows):
+    return json.dumps(rows, indent=2)
+
+
+def _encode_json_min(rows):
+    return json.dumps(rows, separators=(',', ':'), ensure_ascii=False)
+
+
+def _tsv_cell(value):
+    if isinstance(value, bool):
+        return 'true' if value else 'false'
+    if value is None:
+        return ''
+    return str(value).replace('\\', '\\\\').replace('\t', ' ').replace('\r', '').replace('\n', '\\n')
+
+
+def _encode_tsv(rows):
+    if not rows:
+        return "(no posts)"
+    fields = list(rows[0].keys())
+    lines = [
+        "Posts below are tab-separated values with one header line; \\n inside content marks a line break.",
+        '\t'.join(fields)
+    ]
+    for row in rows:
+        lines.append('\t'.join(_tsv_cell(row[field]) for field in fields))
+    return '\n'.join(lines)
+
+
+ENCODERS = {
+    'json': _encode_json,
+    'json-min': _encode_json_min,
+    'tsv': _encode_tsv
+}
+
+
+def encode_posts(rows, encoding=DEFAULT_ENCODING):
+    """
+    Serialize condensed post rows for a prompt.
+
+    Args:
+        rows: List of condensed post dicts sharing the same keys
+        encoding: One of ENCODERS
+
+    Raises:
+        ValueError: If the encoding is unknown
+    """
+    if encoding == CACHED_CONTEXT:
+        return f"(The {len(rows)} posts are in the cached context above.)"
+    if encoding not in ENCODERS:
+        raise ValueError(f"Unknown prompt encoding '{encoding}'. Expected any of: {', '.join(ENCODERS.keys())}.")
+    return ENCODERS[encoding](rows)
@@ -0,0 +1,405 @@
+"""
+Shared Gemini rate limiter and concurrency governor.
+
+Enforces requests per minute, tokens per minute and a maximum number of
+in-flight calls per API key. State lives in a small SQLite file, so the
+limits hold across threads in the Flask process and across processes such
+as the batch extractors running next to the API. Callers that would exceed a
+limit wait in line instead of failing. The number of waiters is reported as
+queue depth. Waiters refresh a heartbeat each time they poll, so rows left by
+a dead process stop counting after WAITER_STALE_SECONDS rather than lingering
+until the STALE_AFTER_SECONDS lease cleanup.
+
+Both budgets are token buckets that refill continuously: RPM/60 requests and
+TPM/60 tokens per second, capped at one minute's worth. A call is charged its
+estimated tokens up front. Once the response's usage_metadata is known, the
+charge is corrected to the real count. Keys on a different quota tier can be
+given their own RPM/TPM with set_limits(); budgets() reports what every key
+has left, which key_pool.KeyPool uses to pick the key for a call.
+
+acquire_async() and release_async() serve the ASGI mode (asgi_app.py). They
+wait with asyncio.sleep and run the SQLite work in a worker thread, so a
+queued call does not hold a thread or block the event loop.
+"""
+
+import os
+import time
+import asyncio
+import uuid
+import hashlib
+import sqlite3
+import threading
+
+DEFAULT_LIMITER_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), '.gemini_rate_limit.sqlite3')
+
+# Leases and waiter rows older than this are assumed to belong to a dead process
+STALE_AFTER_SECONDS = 600
+
+# Waiters refresh their row on every poll (at least every MAX_REFILL_WAIT_SECONDS),
+# so a waiter silent for this long belongs to a dead process and stops counting as queued
+WAITER_STALE_SECONDS = 15
+
+# Poll interval while every in-flight slot is taken
+MAX_POLL_SECONDS = 0.05
+
+# Longest single sleep while waiting for a bucket, so refunded tokens are noticed
+MAX_REFILL_WAIT_SECONDS = 2.0
+
+
+# Same rough heuristic as post_selection.CHARS_PER_TOKEN, kept local so the batch tools avoid numpy
+CHARS_PER_TOKEN = 4
+
+# Assumed response size when the generation config sets no max_output_tokens
+DEFAULT_OUTPUT_TOKENS = 1024
+
+
+class RateLimitTimeout(TimeoutError):
+    """Raised when capacity does not free up within the caller's timeout."""
+
+
+def key_id(api_key):
+    """Stable, non-secret identifier for an API key."""
+    return hashlib.sha256((api_key or 'default').encode('utf-8')).hexdigest()[:16]
+
+
+def estimate_call_tokens(prompt, max_output_tokens=None):
+    """Upfront charge for a call: estimated prompt tokens plus the expected response."""
+    return len(str(prompt)) // CHARS_PER_TOKEN + (max_output_tokens or DEFAULT_OUTPUT_TOKENS)
+
+
+def usage_tokens(usage_metadata):
+    """Total tokens from a response's usage_metadata, or None when it is missing."""
+    return getattr(usage_metadata, 'total_token_count', None) or None
+
+
+def limiter_from_env():
+    """
+    Build the limiter from GEMINI_RPM, GEMINI_TPM and GEMINI_MAX_IN_FLIGHT.
+
+    Returns None when GEMINI_RATE_LIMIT_ENABLED is false.
+    """
+    if os.getenv('GEMINI_RATE_LIMIT_ENABLED', 'true').lower() in ('0', 'false', 'no'):
+        return None
+    return RateLimiter(
+        rpm=int(os.getenv('GEMINI_RPM', '300')),
+        tpm=int(os.getenv('GEMINI_TPM', '1000000')),
+        max_in_flight=int(os.getenv('GEMINI_MAX_IN_FLIGHT', '8')),
+        path=os.getenv('GEMINI_RATE_LIMIT_PATH', DEFAULT_LIMITER_PATH)
+    )
+
+
+class Lease:
+    """One admitted call; release it with RateLimiter.release()."""
+
+    def __init__(self, lease_id, key, tokens, waited):
+        self.id = lease_id
+        self.key = key
+        self.tokens = tokens
+        self.waited = waited
+
+
+class RateLimiter:
+    """SQLite-backed token buckets for RPM and TPM plus an in-flight cap, per key."""
+
+    def __init__(self, rpm=60, tpm=1_000_000, max_in_flight=8, path=DEFAULT_LIMITER_PATH):
+        self.rpm = rpm
+        self.tpm = tpm
+        self.max_in_flight = max_in_flight
+        self.path = path
+        self._limits = {}
+        self._lock = threading.Lock()
+        self._waiting = 0
+        self._admitted = 0
+        self._queued = 0
+        self._wait_seconds = 0.0
+        self._init_db()
+
+    def set_limits(self, api_key, rpm=None, tpm=None):
+        """Override RPM and/or TPM for one key; the limiter-wide values apply otherwise."""
+        self._limits[key_id(api_key)] = (rpm or self.rpm, tpm or self.tpm)
+
+    def limits(self, api_key=None):
+        """{rpm, tpm, max_in_flight} for a key."""
+        rpm, tpm = self._key_limits(key_id(api_key))
+        return {'rpm': rpm, 'tpm': tpm, 'max_in_flight': self.max_in_flight}
+
+    def _key_limits(self, key):
+        return self._limits.get(key, (self.rpm, self.tpm))
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        return conn
+
+    def _init_db(self):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        conn = self._connect()
+        try:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS rate_limit_buckets (
+                    key TEXT PRIMARY KEY,
+                    requests REAL NOT NULL,
+                    tokens REAL NOT NULL,
+                    updated_at REAL NOT NULL
+                )
+            """)
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS rate_limit_leases (
+                    lease_id TEXT PRIMARY KEY,
+                    key TEXT NOT NULL,
+                    kind TEXT NOT NULL,
+                    created_at REAL NOT NULL,
+                    heartbeat_at REAL
+                )
+            """)
+            columns = {row[1] for row in conn.execute("PRAGMA table_info(rate_limit_leases)")}
+            if 'heartbeat_at' not in columns:
+                conn.execute("ALTER TABLE rate_limit_leases ADD COLUMN heartbeat_at REAL")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_rate_limit_leases_key ON rate_limit_leases (key, kind)")
+        finally:
+            conn.close()
+
+    def _refill(self, conn, key, now):
+        """Return current (requests, tokens) for a key after continuous refill."""
+        rpm, tpm = self._key_limits(key)
+        row = conn.execute(
+            "SELECT requests, tokens, updated_at FROM rate_limit_buckets WHERE key = ?", (key,)
+        ).fetchone()
+        if row is None:
+            return float(rpm), float(tpm)
+        requests, tokens, updated_at = row
+        elapsed = max(0.0, now - updated_at)
+        requests = min(float(rpm), requests + elapsed * rpm / 60)
+        tokens = min(float(tpm), tokens + elapsed * tpm / 60)
+        return requests, tokens
+
+    def _save(self, conn, key, requests, tokens, now):
+        conn.execute(
+            "INSERT OR REPLACE INTO rate_limit_buckets (key, requests, tokens, updated_at) VALUES (?, ?, ?, ?)",
+            (key, requests, tokens, now)
+        )
+
+    def _try_admit(self, key, tokens, lease_id):
+        """
+        Admit the call if every budget allows it.
+
+        Returns:
+            0 when admitted, otherwise the seconds until it might be
+        """
+        now = time.time()
+        rpm, tpm = self._key_limits(key)
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            conn.execute(
+                "DELETE FROM rate_limit_leases WHERE created_at < ? OR (kind = 'waiter' AND heartbeat_at < ?)",
+                (now - STALE_AFTER_SECONDS, now - WAITER_STALE_SECONDS)
+            )
+            in_flight = conn.execute(
+                "SELECT COUNT(*) FROM rate_limit_leases WHERE key = ? AND kind = 'lease'", (key,)
+            ).fetchone()[0]
+            requests, available = self._refill(conn, key, now)
+            # A single call larger than the whole TPM budget is admitted once the bucket is full
+            needed = min(tokens, tpm)
+
+            if in_flight < self.max_in_flight and requests >= 1 and available >= needed:
+                self._save(conn, key, requests - 1, available - tokens, now)
+                conn.execute("DELETE FROM rate_limit_leases WHERE lease_id = ?", (lease_id,))
+                conn.execute(
+                    "INSERT INTO rate_limit_leases (lease_id, key, kind, created_at) VALUES (?, ?, 'lease', ?)",
+                    (lease_id, key, now)
+                )
+                conn.execute("COMMIT")
+                return 0
+
+            conn.execute(
+                """
+                INSERT INTO rate_limit_leases (lease_id, key, kind, created_at, heartbeat_at) VALUES (?, ?, 'waiter', ?, ?)
+                ON CONFLICT (lease_id) DO UPDATE SET heartbeat_at = excluded.heartbeat_at
+                """,
+                (lease_id, key, now, now)
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+
+        # Poll for freed slots; otherwise sleep until the buckets should have refilled
+        delay = MAX_POLL_SECONDS if in_flight >= self.max_in_flight else 0.01
+        if requests < 1:
+            delay = max(delay, (1 - requests) * 60 / rpm)
+        if available < needed:
+            delay = max(delay, (needed - available) * 60 / tpm)
+        return min(delay, MAX_REFILL_WAIT_SECONDS)
+
+    def acquire(self, api_key=None, tokens=0, timeout=None):
+        """
+        Wait until a call for this key fits every limit, then admit it.
+
+        Args:
+            api_key: Key the budgets belong to
+            tokens: Estimated prompt plus response tokens
+            timeout: Seconds to wait before giving up (None waits indefinitely)
+
+        Returns:
+            Lease to pass to release()
+
+        Raises:
+            RateLimitTimeout: If the call is not admitted within the timeout
+        """
+        key = key_id(api_key)
+        lease_id = uuid.uuid4().hex
+        start = time.monotonic()
+        queued = False
+        try:
+            while True:
+                delay = self._try_admit(key, tokens, lease_id)
+                if delay == 0:
+                    return self._admitted_lease(lease_id, key, tokens, start)
+                queued = self._note_queued(queued)
+                if timeout is not None and time.monotonic() - start + delay > timeout:
+                    self._forget(lease_id)
+                    raise RateLimitTimeout(f"Gemini rate limit: no capacity within {timeout:.1f}s")
+                time.sleep(delay)
+        finally:
+            self._note_dequeued(queued)
+
+    async def acquire_async(self, api_key=None, tokens=0, timeout=None):
+        """Coroutine version of acquire(); waiting happens on the event loop, not in a thread."""
+        key = key_id(api_key)
+        lease_id = uuid.uuid4().hex
+        start = time.monotonic()
+        queued = False
+        admit = None
+        try:
+            while True:
+                # Shielded so a cancel cannot leave the admit running unseen; see _forget_after()
+                admit = asyncio.ensure_future(asyncio.to_thread(self._try_admit, key, tokens, lease_id))
+                delay = await asyncio.shield(admit)
+                if delay == 0:
+                    return self._admitted_lease(lease_id, key, tokens, start)
+                queued = self._note_queued(queued)
+                if timeout is not None and time.monotonic() - start + delay > timeout:
+                    await asyncio.to_thread(self._forget, lease_id)
+                    raise RateLimitTimeout(f"Gemini rate limit: no capacity within {timeout:.1f}s")
+                await asyncio.sleep(delay)
+        except asyncio.CancelledError:
+            # Drop the waiter row (or a lease admitted as we were cancelled) so it is not counted as queued
+            await asyncio.shield(self._forget_after(admit, lease_id))
+            raise
+        finally:
+            self._note_dequeued(queued)
+
+    async def _forget_after(self, admit, lease_id):
+        """Forget a lease once an in-flight admit has committed, so the admit cannot re-add it."""
+        if admit is not None:
+            try:
+                await admit
+            except Exception:
+                pass
+        await asyncio.to_thread(self._forget, lease_id)
+
+    def _admitted_lease(self, lease_id, key, tokens, start):
+        waited = time.monotonic() - start
+        with self._lock:
+            self._admitted += 1
+            self._wait_seconds += waited
+        return Lease(lease_id, key, tokens, waited)
+
+    def _note_queued(self, queued):
+        """Count a waiter the first time it has to wait; returns True from then on."""
+        if not queued:
+            with self._lock:
+                self._waiting += 1
+                self._queued += 1
+        return True
+
+    def _note_dequeued(self, queued):
+        if queued:
+            with self._lock:
+                self._waiting -= 1
+
+    def release(self, lease, actual_tokens=None):
+        """Free the in-flight slot and correct the token charge if the real count is known."""
+        now = time.time()
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            conn.execute("DELETE FROM rate_limit_leases WHERE lease_id = ?", (lease.id,))
+            if actual_tokens is not None and actual_tokens != lease.tokens:
+                requests, tokens = self._refill(conn, lease.key, now)
+                tpm = self._key_limits(lease.key)[1]
+                self._save(conn, lease.key, requests, min(float(tpm), tokens + lease.tokens - actual_tokens), now)
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+
+    async def release_async(self, lease, actual_tokens=None):
+        await asyncio.to_thread(self.release, lease, actual_tokens)
+
+    def _forget(self, lease_id):
+        conn = self._connect()
+        try:
+            conn.execute("DELETE FROM rate_limit_leases WHERE lease_id = ?", (lease_id,))
+        finally:
+            conn.close()
+
+    def budgets(self, api_keys):
+        """
+        What each key has left, across every process sharing the file.
+
+        Returns:
+            {api_key: (requests available, tokens available, leases in flight)}
+        """
+        now = time.time()
+        conn = self._connect()
+        try:
+            budgets = {}
+            for api_key in api_keys:
+                key = key_id(api_key)
+                in_flight = conn.execute(
+                    "SELECT COUNT(*) FROM rate_limit_leases WHERE key = ? AND kind = 'lease' AND created_at >= ?",
+                    (key, now - STALE_AFTER_SECONDS)
+                ).fetchone()[0]
+                budgets[api_key] = (*self._refill(conn, key, now), in_flight)
+        finally:
+            conn.close()
+        return budgets
+
+    def stats(self, api_key=None):
+        """Queue depth and remaining budget for a key, across every process sharing the file."""
+        key = key_id(api_key)
+        conn = self._connect()
+        try:
+            now = time.time()
+            counts = dict(conn.execute(
+                """
+                SELECT kind, COUNT(*) FROM rate_limit_leases
+                WHERE key = ? AND created_at >= ? AND (kind = 'lease' OR heartbeat_at >= ?)
+                GROUP BY kind
+                """,
+                (key, now - STALE_AFTER_SECONDS, now - WAITER_STALE_SECONDS)
+            ).fetchall())
+            requests, tokens = self._refill(conn, key, now)
+        finally:
+            conn.close()
+        with self._lock:
+            local = {
+                'waiting_here': self._waiting,
+                'admitted': self._admitted,
+                'queued': self._queued,
+                'wait_seconds_total': round(self._wait_seconds, 3)
+            }
+        return {
+            'limits': self.limits(api_key),
+            'in_flight': counts.get('lease', 0),
+            'queue_depth': counts.get('waiter', 0),
+            'requests_available': round(requests, 2),
+            'tokens_available': round(tokens),
+            **local
+        }
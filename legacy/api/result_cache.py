@@ -0,0 +1,262 @@
+"""
+Persistent result cache for the LLM analysis endpoints.
+
+Results are stored in a local SQLite file keyed by a content hash of the
+condensed post payload plus the analysis name, prompt version and model.
+Entries expire after a TTL and the table is kept under a maximum size by
+evicting the least recently used rows.
+
+PostLabelCache keeps per-post labels (topic tags) in the same file, keyed by
+a hash of each post's content. A profile that gains a few posts between
+scrapes then only needs those new posts labelled. The post text and label
+version are kept alongside, so the labels double as training data for the
+local topic classifier (see topic_classifier.py).
+"""
+
+import os
+import json
+import time
+import hashlib
+import sqlite3
+import threading
+
+DEFAULT_CACHE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), '.analysis_cache.sqlite3')
+
+
+def make_cache_key(analysis, prompt_version, model_name, payload):
+    """
+    Build a stable cache key for an analysis request.
+
+    Args:
+        analysis: Analysis name (e.g. "narrative", "topics")
+        prompt_version: Version string of the prompt template
+        model_name: Gemini model the prompt is sent to
+        payload: JSON-serialisable condensed post payload
+
+    Returns:
+        Hex SHA-256 digest
+    """
+    body = json.dumps(payload, sort_keys=True, separators=(',', ':'), ensure_ascii=False)
+    digest = hashlib.sha256()
+    digest.update(f"{analysis}|{prompt_version}|{model_name}|".encode('utf-8'))
+    digest.update(body.encode('utf-8'))
+    return digest.hexdigest()
+
+
+def make_post_key(label_version, content):
+    """Hex SHA-256 of a post's content under a label version (prompt version and model)."""
+    digest = hashlib.sha256()
+    digest.update(f"{label_version}|".encode('utf-8'))
+    digest.update((content or '').encode('utf-8'))
+    return digest.hexdigest()
+
+
+class ResultCache:
+    """SQLite-backed key/value cache with TTL and size-bounded LRU eviction."""
+
+    def __init__(self, path=DEFAULT_CACHE_PATH, ttl_seconds=7 * 24 * 3600, max_entries=2000):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._init_db()
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=30)
+
+    def _init_db(self):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        with self._lock, self._connect() as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS analysis_results (
+                    cache_key TEXT PRIMARY KEY,
+                    analysis TEXT NOT NULL,
+                    value TEXT NOT NULL,
+                    created_at REAL NOT NULL,
+                    expires_at REAL NOT NULL,
+                    last_accessed REAL NOT NULL
+                )
+            """)
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS idx_analysis_results_lru ON analysis_results (last_accessed)"
+            )
+
+    def get(self, cache_key):
+        """Return the cached value for a key, or None on a miss or expired entry."""
+        now = time.time()
+        with self._lock, self._connect() as conn:
+            row = conn.execute(
+                "SELECT value, expires_at FROM analysis_results WHERE cache_key = ?",
+                (cache_key,)
+            ).fetchone()
+            if row is None:
+                return None
+            value, expires_at = row
+            if expires_at <= now:
+                conn.execute("DELETE FROM analysis_results WHERE cache_key = ?", (cache_key,))
+                return None
+            conn.execute(
+                "UPDATE analysis_results SET last_accessed = ? WHERE cache_key = ?",
+                (now, cache_key)
+            )
+        return json.loads(value)
+
+    def set(self, cache_key, analysis, value):
+        """Store a value, then drop expired rows and evict LRU rows over the size limit."""
+        now = time.time()
+        with self._lock, self._connect() as conn:
+            conn.execute(
+                """
+                INSERT OR REPLACE INTO analysis_results
+                    (cache_key, analysis, value, created_at, expires_at, last_accessed)
+                VALUES (?, ?, ?, ?, ?, ?)
+                """,
+                (cache_key, analysis, json.dumps(value), now, now + self.ttl_seconds, now)
+            )
+            conn.execute("DELETE FROM analysis_results WHERE expires_at <= ?", (now,))
+            conn.execute(
+                """
+                DELETE FROM analysis_results WHERE cache_key IN (
+                    SELECT cache_key FROM analysis_results
+                    ORDER BY last_accessed DESC
+                    LIMIT -1 OFFSET ?
+                )
+                """,
+                (self.max_entries,)
+            )
+
+    def stats(self):
+        """Return entry counts per analysis."""
+        with self._lock, self._connect() as conn:
+            rows = conn.execute(
+                "SELECT analysis, COUNT(*) FROM analysis_results GROUP BY analysis"
+            ).fetchall()
+        return {analysis: count for analysis, count in rows}
+
+    def clear(self):
+        with self._lock, self._connect() as conn:
+            conn.execute("DELETE FROM analysis_results")
+
+
+class PostLabelCache:
+    """SQLite-backed per-post label store with TTL and size-bounded LRU eviction."""
+
+    def __init__(self, path=DEFAULT_CACHE_PATH, ttl_seconds=30 * 24 * 3600, max_entries=100000):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._init_db()
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=30)
+
+    def _init_db(self):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        with self._lock, self._connect() as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS post_labels (
+                    post_key TEXT PRIMARY KEY,
+                    labels TEXT NOT NULL,
+                    expires_at REAL NOT NULL,
+                    last_accessed REAL NOT NULL,
+                    content TEXT,
+                    label_version TEXT
+                )
+            """)
+            # Files created before content was stored get the columns added; their rows stay without text
+            columns = {row[1] for row in conn.execute("PRAGMA table_info(post_labels)")}
+            for column in ('content', 'label_version'):
+                if column not in columns:
+                    conn.execute(f"ALTER TABLE post_labels ADD COLUMN {column} TEXT")
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS idx_post_labels_lru ON post_labels (last_accessed)"
+            )
+
+    def get_many(self, post_keys):
+        """Return {post_key: labels} for the keys that have unexpired labels."""
+        if not post_keys:
+            return {}
+        now = time.time()
+        found = {}
+        keys = list(set(post_keys))
+        with self._lock, self._connect() as conn:
+            # Stay under SQLite's bound-parameter limit
+            for start in range(0, len(keys), 500):
+                chunk = keys[start:start + 500]
+                placeholders = ','.join('?' * len(chunk))
+                rows = conn.execute(
+                    f"SELECT post_key, labels FROM post_labels WHERE post_key IN ({placeholders}) AND expires_at > ?",
+                    (*chunk, now)
+                ).fetchall()
+                found.update((key, json.loads(labels)) for key, labels in rows)
+                if rows:
+                    conn.execute(
+                        f"UPDATE post_labels SET last_accessed = ? WHERE post_key IN ({','.join('?' * len(rows))})",
+                        (now, *(key for key, _ in rows))
+                    )
+        return found
+
+    def set_many(self, labels_by_key, contents=None, label_version=None):
+        """
+        Store labels for several posts, then drop expired rows and evict LRU rows over the size limit.
+
+        Args:
+            labels_by_key: {post_key: labels}
+            contents: Optional {post_key: post text}, kept as classifier training data
+            label_version: Version the labels were produced under
+        """
+        if not labels_by_key:
+            return
+        contents = contents or {}
+        now = time.time()
+        with self._lock, self._connect() as conn:
+            conn.executemany(
+                """
+                INSERT OR REPLACE INTO post_labels
+                    (post_key, labels, expires_at, last_accessed, content, label_version)
+                VALUES (?, ?, ?, ?, ?, ?)
+                """,
+                [
+                    (key, json.dumps(labels), now + self.ttl_seconds, now, contents.get(key), label_version)
+                    for key, labels in labels_by_key.items()
+                ]
+            )
+            conn.execute("DELETE FROM post_labels WHERE expires_at <= ?", (now,))
+            conn.execute(
+                """
+                DELETE FROM post_labels WHERE post_key IN (
+                    SELECT post_key FROM post_labels
+                    ORDER BY last_accessed DESC
+                    LIMIT -1 OFFSET ?
+                )
+                """,
+                (self.max_entries,)
+            )
+
+    def labelled_posts(self, label_version=None):
+        """
+        Return [(content, labels)] for unexpired rows that kept their post text.
+
+        Args:
+            label_version: Only rows labelled under this version; all versions when None
+        """
+        query = "SELECT content, labels FROM post_labels WHERE content IS NOT NULL AND expires_at > ?"
+        params = [time.time()]
+        if label_version is not None:
+            query += " AND label_version = ?"
+            params.append(label_version)
+        with self._lock, self._connect() as conn:
+            rows = conn.execute(query + " ORDER BY post_key", params).fetchall()
+        return [(content, json.loads(labels)) for content, labels in rows]
+
+    def stats(self):
+        with self._lock, self._connect() as conn:
+            entries, with_content = conn.execute(
+                "SELECT COUNT(*), COUNT(content) FROM post_labels"
+            ).fetchone()
+        return {'entries': entries, 'with_content': with_content}
+
+    def clear(self):
+        with self._lock, self._connect() as conn:
+            conn.execute("DELETE FROM post_labels")
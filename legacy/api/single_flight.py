@@ -0,0 +1,137 @@
+"""
+Single-flight coalescing of identical concurrent calls.
+
+When several threads ask for the same key at once, only the first (the
+leader) runs the work. The rest wait for it and receive the same result or
+exception. Nothing is kept after the call finishes; that is the result
+cache's job. This only removes duplicate work that is in flight at the same
+moment, such as several teammates opening one shared report page.
+
+do_async() does the same for coroutines on the ASGI event loop (asgi_app.py).
+A cancelled async leader (its client went away) does not cancel its
+followers: one of them takes over as leader and runs the call again.
+"""
+
+import asyncio
+import hashlib
+import threading
+from collections import Counter
+
+
+def payload_key(*parts):
+    """SHA-256 over the parts, separated so ('ab', 'c') and ('a', 'bc') differ."""
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(str(part).encode('utf-8'))
+        digest.update(b'\x00')
+    return digest.hexdigest()
+
+
+class _LeaderCancelled(Exception):
+    """Handed to async followers when their leader is cancelled, so they retry."""
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.followers = 0
+
+
+class SingleFlight:
+    """Runs at most one in-flight call per key and shares its outcome."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+        self._async_calls = {}
+        self._counts = Counter()
+
+    def do(self, key, fn):
+        """
+        Run fn() unless an identical call is already running, then share its outcome.
+
+        Returns:
+            Tuple of (result, shared) where shared is True for followers
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+            else:
+                call.followers += 1
+                self._counts['saved_calls'] += 1
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+
+        try:
+            call.result = fn()
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+                self._counts['executed_calls'] += 1
+                if call.followers:
+                    self._counts['coalesced_groups'] += 1
+            call.done.set()
+        return call.result, False
+
+    async def do_async(self, key, fn):
+        """
+        Coroutine version of do(): await fn() unless an identical call is already running on the loop.
+
+        Followers are shielded, so a cancelled follower does not cancel the leader's call.
+        If the leader is cancelled, its followers call do_async() again and the
+        first of them becomes the new leader.
+
+        Returns:
+            Tuple of (result, shared) where shared is True for followers
+        """
+        with self._lock:
+            call = self._async_calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._async_calls[key] = _Call()
+                call.done = asyncio.get_running_loop().create_future()
+            else:
+                call.followers += 1
+                self._counts['saved_calls'] += 1
+
+        if not leader:
+            try:
+                return await asyncio.shield(call.done), True
+            except _LeaderCancelled:
+                return await self.do_async(key, fn)
+
+        try:
+            result = await fn()
+        except asyncio.CancelledError:
+            call.done.set_exception(_LeaderCancelled())
+            call.done.exception()
+            raise
+        except Exception as e:
+            call.done.set_exception(e)
+            # Mark the exception retrieved so a call without followers logs nothing extra
+            call.done.exception()
+            raise
+        else:
+            call.done.set_result(result)
+        finally:
+            with self._lock:
+                del self._async_calls[key]
+                self._counts['executed_calls'] += 1
+                if call.followers:
+                    self._counts['coalesced_groups'] += 1
+        return result, False
+
+    def stats(self):
+        with self._lock:
+            return {**dict(self._counts), 'in_flight_keys': len(self._calls) + len(self._async_calls)}
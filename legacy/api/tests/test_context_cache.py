@@ -0,0 +1,43 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from context_cache import ContextCache
+
+
+class ApiError(Exception):
+    """Stand-in for a google.api_core error, which carries the HTTP status as .code."""
+
+    def __init__(self, code, message):
+        super().__init__(f"{code} {message}")
+        self.code = code
+
+
+CORPUS = 'post ' * 200
+
+
+def cached_entry(cache):
+    entry = cache.get_or_create('model', CORPUS)
+    assert entry is not None
+    return entry
+
+
+def test_unrelated_400_keeps_the_cached_context():
+    cache = ContextCache('local', min_tokens=1)
+    entry = cached_entry(cache)
+
+    error = ApiError(400, "Request contains an invalid argument: response_schema is not supported")
+    assert not cache.is_cache_miss(error)
+
+    assert cache.get_or_create('model', CORPUS) is entry
+    assert 'invalidated' not in cache.stats()
+
+
+def test_expired_cached_content_is_a_miss():
+    cache = ContextCache('local', min_tokens=1)
+
+    assert cache.is_cache_miss(ApiError(400, "Cache content 1234 is expired."))
+    assert cache.is_cache_miss(ApiError(403, "CachedContent not found (or permission denied)"))
+    assert cache.is_cache_miss(ApiError(404, "Not found"))
+    assert not cache.is_cache_miss(ApiError(500, "Internal error"))
@@ -0,0 +1,47 @@
+import os
+import sys
+import asyncio
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from single_flight import SingleFlight
+
+
+def test_follower_gets_result_when_leader_is_cancelled():
+    flight = SingleFlight()
+    runs = []
+
+    async def work():
+        runs.append(1)
+        await asyncio.sleep(0.05)
+        return 'result'
+
+    async def main():
+        leader = asyncio.create_task(flight.do_async('key', work))
+        await asyncio.sleep(0.01)
+        follower = asyncio.create_task(flight.do_async('key', work))
+        await asyncio.sleep(0.01)
+        leader.cancel()
+        result, _ = await follower
+        assert leader.cancelled()
+        return result
+
+    assert asyncio.run(main()) == 'result'
+    assert len(runs) == 2
+    assert flight.stats()['in_flight_keys'] == 0
+
+
+def test_followers_share_one_call():
+    flight = SingleFlight()
+    runs = []
+
+    async def work():
+        runs.append(1)
+        await asyncio.sleep(0.02)
+        return 'result'
+
+    async def main():
+        return await asyncio.gather(*(flight.do_async('key', work) for _ in range(3)))
+
+    assert asyncio.run(main()) == [('result', False), ('result', True), ('result', True)]
+    assert len(runs) == 1
@@ -0,0 +1,265 @@
+"""
+Local multi-label topic classifier distilled from cached Gemini labels.
+
+Once Gemini has tagged enough posts, most new posts are easy calls. This
+module trains one logistic regression per topic (one-vs-rest) on the
+hashed unigram/bigram features from topic_clustering.py. The training data
+is the post -> topics labels accumulated in PostLabelCache. A trained model
+is a (N_FEATURES x topics) weight matrix. Scoring a post means hashing its
+terms and summing a few dozen weight rows, which takes microseconds and
+needs no network.
+
+Each post gets a probability per topic. A post counts as confident when
+every topic is clearly in or clearly out (probability at least
+`confidence` or at most 1 - `confidence`) and at least one topic is in.
+The API uses the predicted topics for confident posts and sends only the
+rest to Gemini. Precision and recall against held-out Gemini labels are
+stored with the model, so the confidence threshold can be judged before
+it is deployed.
+
+Train with train_topic_classifier.py.
+"""
+
+import os
+import json
+import zlib
+
+import numpy as np
+
+from topic_clustering import N_FEATURES, hashed_columns
+
+DEFAULT_MODEL_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), '.topic_classifier.npz')
+
+# Probability a topic needs to be in (or 1 - it to be out) for a post to skip Gemini
+DEFAULT_CONFIDENCE = 0.85
+
+# Topics with fewer positive training posts are left out of the model
+MIN_TOPIC_POSTS = 5
+
+TRAIN_EPOCHS = 40
+TRAIN_BATCH_SIZE = 256
+LEARNING_RATE = 0.1
+L2_PENALTY = 1e-5
+
+# Share of posts held out for evaluation, chosen by a hash of the post text so splits are stable
+DEFAULT_HOLDOUT = 0.2
+
+
+def holdout_split(texts, holdout=DEFAULT_HOLDOUT):
+    """Boolean mask of held-out posts; the same text always lands on the same side."""
+    buckets = np.fromiter(
+        (zlib.crc32((text or '').encode('utf-8')) % 1000 for text in texts), dtype=np.int64, count=len(texts)
+    )
+    return buckets < holdout * 1000
+
+
+def _features(text, idf):
+    """(columns, values) of a post's sublinear TF-IDF row, L2-normalised."""
+    columns, counts = np.unique(np.asarray(hashed_columns(text), dtype=np.int64), return_counts=True)
+    values = np.log1p(counts.astype(np.float32)) * idf[columns]
+    norm = np.linalg.norm(values)
+    return columns, (values / norm if norm > 0 else values)
+
+
+def _dense(rows, idf):
+    """Stack (columns, values) rows into a dense batch."""
+    matrix = np.zeros((len(rows), len(idf)), dtype=np.float32)
+    for row, (columns, values) in enumerate(rows):
+        matrix[row, columns] = values
+    return matrix
+
+
+def _sigmoid(logits):
+    return 1 / (1 + np.exp(-np.clip(logits, -30, 30)))
+
+
+def _precision_recall(true_positive, predicted, actual):
+    return {
+        'precision': round(float(true_positive / predicted), 3) if predicted else None,
+        'recall': round(float(true_positive / actual), 3) if actual else None
+    }
+
+
+class TopicClassifier:
+    """One-vs-rest logistic regression over hashed n-grams."""
+
+    def __init__(self, topics, weights, bias, idf, confidence=DEFAULT_CONFIDENCE, report=None):
+        self.topics = list(topics)
+        self.weights = np.asarray(weights, dtype=np.float32)
+        self.bias = np.asarray(bias, dtype=np.float32)
+        self.idf = np.asarray(idf, dtype=np.float32)
+        self.confidence = confidence
+        self.report = report or {}
+
+    @classmethod
+    def fit(cls, texts, labels, confidence=DEFAULT_CONFIDENCE, epochs=TRAIN_EPOCHS,
+            learning_rate=LEARNING_RATE, l2=L2_PENALTY, min_topic_posts=MIN_TOPIC_POSTS, seed=0):
+        """
+        Train on posts and their Gemini topic lists with mini-batch Adam.
+
+        Raises:
+            ValueError: If no topic has min_topic_posts positive posts
+        """
+        counts = {}
+        for topics in labels:
+            for topic in set(topics):
+                counts[topic] = counts.get(topic, 0) + 1
+        topics = sorted(topic for topic, count in counts.items() if count >= min_topic_posts)
+        if not topics:
+            raise ValueError(f"No topic has at least {min_topic_posts} labelled posts to train on")
+
+        column = {topic: index for index, topic in enumerate(topics)}
+        targets = np.zeros((len(texts), len(topics)), dtype=np.float32)
+        for row, post_topics in enumerate(labels):
+            targets[row, [column[topic] for topic in set(post_topics) if topic in column]] = 1
+
+        document_frequency = np.zeros(N_FEATURES, dtype=np.float32)
+        for text in texts:
+            document_frequency[np.unique(np.asarray(hashed_columns(text), dtype=np.int64))] += 1
+        idf = (np.log((1 + len(texts)) / (1 + document_frequency)) + 1).astype(np.float32)
+        rows = [_features(text, idf) for text in texts]
+
+        # Start each topic at its base rate so rare topics are not pushed up by early batches
+        base_rate = np.clip(targets.mean(axis=0), 1e-3, 1 - 1e-3)
+        weights = np.zeros((N_FEATURES, len(topics)), dtype=np.float32)
+        bias = np.log(base_rate / (1 - base_rate)).astype(np.float32)
+        moments = [np.zeros_like(weights), np.zeros_like(weights), np.zeros_like(bias), np.zeros_like(bias)]
+        beta1, beta2, epsilon = 0.9, 0.999, 1e-8
+
+        rng = np.random.default_rng(seed)
+        step = 0
+        for _ in range(epochs):
+            order = rng.permutation(len(texts))
+            for start in range(0, len(order), TRAIN_BATCH_SIZE):
+                batch = order[start:start + TRAIN_BATCH_SIZE]
+                features = _dense([rows[index] for index in batch], idf)
+                error = _sigmoid(features @ weights + bias) - targets[batch]
+                gradients = (features.T @ error / len(batch) + l2 * weights, error.mean(axis=0))
+
+                step += 1
+                for index, (parameter, gradient) in enumerate(zip((weights, bias), gradients)):
+                    first, second = moments[2 * index], moments[2 * index + 1]
+                    first *= beta1
+                    first += (1 - beta1) * gradient
+                    second *= beta2
+                    second += (1 - beta2) * gradient ** 2
+                    parameter -= (
+                        learning_rate * (first / (1 - beta1 ** step)) / (np.sqrt(second / (1 - beta2 ** step)) + epsilon)
+                    ).astype(np.float32)
+
+        report = {'train_posts': len(texts), 'topic_posts': {topic: counts[topic] for topic in topics}}
+        return cls(topics, weights, bias, idf, confidence, report)
+
+    def probabilities(self, texts):
+        """(posts x topics) probability matrix."""
+        logits = np.tile(self.bias, (len(texts), 1))
+        for row, text in enumerate(texts):
+            columns, values = _features(text, self.idf)
+            logits[row] += values @ self.weights[columns]
+        return _sigmoid(logits)
+
+    def _decide(self, probabilities):
+        predicted = probabilities >= 0.5
+        certain = np.all(np.maximum(probabilities, 1 - probabilities) >= self.confidence, axis=1)
+        return predicted, certain & predicted.any(axis=1)
+
+    def predict(self, texts):
+        """
+        Topics per text.
+
+        Returns:
+            List of (topics, confident) tuples, one per text
+        """
+        predicted, confident = self._decide(self.probabilities(texts))
+        return [
+            ([self.topics[index] for index in np.flatnonzero(row)], bool(certain))
+            for row, certain in zip(predicted, confident)
+        ]
+
+    def evaluate(self, texts, labels):
+        """
+        Precision and recall against reference labels, over all posts and over the confident ones.
+
+        Topics the model does not know still count as missed for recall.
+
+        Returns:
+            {posts, coverage, all: {precision, recall}, confident: {precision, recall},
+             by_topic: {topic: {precision, recall, support}}}
+        """
+        predicted, confident = self._decide(self.probabilities(texts))
+        actual = np.zeros_like(predicted)
+        column = {topic: index for index, topic in enumerate(self.topics)}
+        unknown = np.zeros(len(texts), dtype=np.int64)
+        for row, post_topics in enumerate(labels):
+            for topic in set(post_topics):
+                if topic in column:
+                    actual[row, column[topic]] = True
+                else:
+                    unknown[row] += 1
+
+        hits = predicted & actual
+
+        def micro(mask):
+            return _precision_recall(
+                hits[mask].sum(), predicted[mask].sum(), actual[mask].sum() + unknown[mask].sum()
+            )
+
+        everything = np.ones(len(texts), dtype=bool)
+        return {
+            'posts': len(texts),
+            'coverage': round(float(confident.mean()), 3) if len(texts) else 0.0,
+            'all': micro(everything),
+            'confident': micro(confident),
+            'by_topic': {
+                topic: {
+                    **_precision_recall(hits[:, index].sum(), predicted[:, index].sum(), actual[:, index].sum()),
+                    'support': int(actual[:, index].sum())
+                }
+                for index, topic in enumerate(self.topics)
+            }
+        }
+
+    def stats(self):
+        return {
+            'topics': len(self.topics),
+            'confidence': self.confidence,
+            'train_posts': self.report.get('train_posts'),
+            'holdout': {key: self.report['holdout'][key] for key in ('posts', 'coverage', 'confident')}
+            if 'holdout' in self.report else None
+        }
+
+    def save(self, path):
+        with open(path, 'wb') as f:
+            np.savez_compressed(
+                f,
+                topics=np.asarray(self.topics),
+                weights=self.weights,
+                bias=self.bias,
+                idf=self.idf,
+                confidence=np.float32(self.confidence),
+                report=np.asarray(json.dumps(self.report))
+            )
+
+    @classmethod
+    def load(cls, path, confidence=None):
+        """
+        Load a saved model.
+
+        Args:
+            confidence: Override the threshold the model was saved with
+
+        Raises:
+            ValueError: If the file was built for a different feature size
+        """
+        with np.load(path) as data:
+            weights = data['weights']
+            if weights.shape[0] != N_FEATURES:
+                raise ValueError(f"Model has {weights.shape[0]} features, expected {N_FEATURES}")
+            return cls(
+                [str(topic) for topic in data['topics']],
+                weights,
+                data['bias'],
+                data['idf'],
+                round(float(data['confidence']), 4) if confidence is None else confidence,
+                json.loads(str(data['report']))
+            )
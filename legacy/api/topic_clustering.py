@@ -0,0 +1,258 @@
+"""
+Offline topic tagging with hashed n-gram TF-IDF and spherical k-means.
+
+Post texts are tokenised into word unigrams and bigrams. These are hashed
+into a fixed number of columns, so there is no vocabulary to fit or store,
+and weighted with TF-IDF. Each post keeps only its non-zero columns
+(SparseRows) rather than a dense N_FEATURES vector. Spherical k-means groups
+similar posts, taking its dot products over the sparse rows; only the k
+centroids are dense. Each cluster is mapped onto the topic vocabulary by
+cosine similarity between its centroid and the topic's seed terms. A post
+gets its cluster's topics plus any topic its own text matches strongly.
+Everything is numpy, needs no network and runs in milliseconds for a
+profile's history.
+"""
+
+import re
+import zlib
+
+import numpy as np
+
+# Topics the LLM prompt offers, with seed terms describing each one
+TOPIC_VOCABULARY = {
+    'hiring': "hiring hire hires we're hiring recruiting recruiter job jobs opening openings role roles candidate candidates interview interviews talent apply",
+    'ai': "ai artificial intelligence machine learning ml llm llms genai generative ai gpt chatgpt openai gemini agents agentic ai models",
+    'product': "product products feature features product manager pm roadmap users user experience ux launch shipped shipping",
+    'startup': "startup startups founder founders co-founder entrepreneur entrepreneurs entrepreneurship bootstrapped building venture unicorn",
+    'tech': "tech technology software saas cloud platform platforms digital developer developers code coding app apps",
+    'growth': "growth grow growing scale scaling revenue arr traction customers metrics retention",
+    'leadership': "leadership leader leaders leading ceo managers management decision decisions vision mentor mentorship",
+    'fintech': "fintech payments payment banking bank banks upi lending credit finance financial wallet neobank",
+    'engineering': "engineering engineer engineers architecture infrastructure backend frontend systems devops data engineering",
+    'team': "team teams teammates colleagues together collaboration hired team members",
+    'culture': "culture values workplace office remote work-life balance wellbeing burnout work culture",
+    'milestone': "milestone milestones anniversary achieved crossed celebrate celebrating proud grateful years completed",
+    'announcement': "announce announcing announcement excited to share introducing thrilled to announce news launching",
+    'personal': "journey story life lesson lessons learned family personal myself childhood reflection",
+    'strategy': "strategy strategic market markets competition competitive positioning business model moat",
+    'sales': "sales sell selling deal deals pipeline b2b enterprise clients client outreach closing",
+    'marketing': "marketing brand branding content audience campaign campaigns social media seo storytelling",
+    'funding': "funding raised raise raising investors investor vc vcs seed series round valuation capital fundraising"
+}
+
+# Hashed feature columns; collisions are rare enough at this size for short posts
+N_FEATURES = 2 ** 13
+
+MAX_CLUSTERS = 12
+KMEANS_ITERATIONS = 25
+
+# Cosine similarity a cluster centroid needs to a topic's seed terms, absolute and relative to its best topic
+MIN_CLUSTER_SIMILARITY = 0.02
+RELATIVE_CLUSTER_SIMILARITY = 0.6
+CLUSTER_TOPICS = 2
+
+# A single post adds a topic outside its cluster's only on a strong direct match
+MIN_POST_SIMILARITY = 0.06
+MAX_POST_TOPICS = 3
+
+_TOKEN = re.compile(r"[a-z0-9][a-z0-9+#'-]*")
+
+STOP_WORDS = frozenset("""
+a about after all also am an and any are as at be because been but by can could did do does doing don't for from
+get got had has have he her here him his how i i'm if in into is it it's its just let me more most my no not now of
+on one only or other our out over she so some than that the their them then there these they this those through to
+too up us very was we were what when where which while who why will with would you your you're
+""".split())
+
+
+def _stem(token):
+    """Fold simple plurals so "fintechs" and "founders" match their seed terms."""
+    return token[:-1] if len(token) > 3 and token.endswith('s') and not token.endswith('ss') else token
+
+
+def tokenize(text):
+    """Lowercased, plural-folded word tokens without stop words and one-letter words."""
+    return [
+        _stem(token) for token in _TOKEN.findall((text or '').lower())
+        if len(token) > 1 and token not in STOP_WORDS
+    ]
+
+
+def _terms(text):
+    tokens = tokenize(text)
+    return tokens + [f"{first} {second}" for first, second in zip(tokens, tokens[1:])]
+
+
+def hashed_columns(text):
+    """Feature column of every unigram and bigram in a text, repeats included."""
+    return [zlib.crc32(term.encode('utf-8')) % N_FEATURES for term in _terms(text)]
+
+
+class SparseRows:
+    """
+    Rows over N_FEATURES columns, stored CSR-style: row i holds columns[offsets[i]:offsets[i + 1]].
+
+    Columns are unique and sorted within a row.
+    """
+
+    def __init__(self, offsets, columns, values):
+        self.offsets = offsets
+        self.columns = columns
+        self.values = values
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def row_ids(self):
+        """Row of every stored value."""
+        return np.repeat(np.arange(len(self)), np.diff(self.offsets))
+
+    def nonempty(self):
+        return np.diff(self.offsets) > 0
+
+    def with_values(self, values):
+        return SparseRows(self.offsets, self.columns, values.astype(np.float32))
+
+    def take(self, mask):
+        """Rows where mask is True."""
+        keep = mask[self.row_ids()]
+        offsets = np.concatenate(([0], np.cumsum(np.diff(self.offsets)[mask])))
+        return SparseRows(offsets, self.columns[keep], self.values[keep])
+
+    def dense_row(self, row):
+        vector = np.zeros(N_FEATURES, dtype=np.float32)
+        start, end = self.offsets[row], self.offsets[row + 1]
+        vector[self.columns[start:end]] = self.values[start:end]
+        return vector
+
+    def dot(self, dense):
+        """(rows x k) product with a dense (k x N_FEATURES) matrix, touching only the stored values."""
+        row_ids = self.row_ids()
+        return np.stack([
+            np.bincount(row_ids, weights=self.values * vector[self.columns], minlength=len(self))
+            for vector in dense
+        ], axis=1).astype(np.float32)
+
+    def normalized(self):
+        """Rows scaled to unit length; empty rows stay empty."""
+        norms = np.sqrt(np.bincount(self.row_ids(), weights=self.values ** 2, minlength=len(self)))
+        return self.with_values(self.values / norms[self.row_ids()])
+
+
+def hashed_counts(texts):
+    """Term counts of unigrams and bigrams per text, hashed into N_FEATURES columns."""
+    offsets, columns, counts = [0], [], []
+    for text in texts:
+        text_columns, text_counts = np.unique(np.asarray(hashed_columns(text), dtype=np.int64), return_counts=True)
+        columns.append(text_columns)
+        counts.append(text_counts)
+        offsets.append(offsets[-1] + len(text_columns))
+    return SparseRows(
+        np.asarray(offsets, dtype=np.int64),
+        np.concatenate(columns) if columns else np.zeros(0, dtype=np.int64),
+        np.concatenate(counts).astype(np.float32) if counts else np.zeros(0, dtype=np.float32)
+    )
+
+
+def _normalize_rows(matrix):
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    return np.divide(matrix, norms, out=np.zeros_like(matrix), where=norms > 0)
+
+
+def tfidf(counts):
+    """
+    Sublinear TF-IDF rows, L2-normalised.
+
+    Returns:
+        Tuple of (SparseRows, idf) so other texts can be weighted the same way
+    """
+    document_frequency = np.bincount(counts.columns, minlength=N_FEATURES)
+    idf = (np.log((1 + len(counts)) / (1 + document_frequency)) + 1).astype(np.float32)
+    return counts.with_values(np.log1p(counts.values) * idf[counts.columns]).normalized(), idf
+
+
+def spherical_kmeans(vectors, k, seed=0, iterations=KMEANS_ITERATIONS):
+    """
+    Cluster unit-length sparse rows by cosine similarity.
+
+    Seeded k-means++ initialisation keeps results stable across runs.
+
+    Returns:
+        Tuple of (labels, centroids) with dense unit-length centroids
+    """
+    rng = np.random.default_rng(seed)
+    centroids = [vectors.dense_row(rng.integers(len(vectors)))]
+    for _ in range(1, k):
+        distance = np.clip(1 - np.max(vectors.dot(np.asarray(centroids)), axis=1), 0, None)
+        total = distance.sum()
+        pick = rng.choice(len(vectors), p=distance / total) if total > 0 else rng.integers(len(vectors))
+        centroids.append(vectors.dense_row(pick))
+    centroids = np.asarray(centroids)
+
+    row_ids = vectors.row_ids()
+    labels = None
+    for _ in range(iterations):
+        new_labels = np.argmax(vectors.dot(centroids), axis=1)
+        if labels is not None and np.array_equal(new_labels, labels):
+            break
+        labels = new_labels
+        sums = np.bincount(
+            labels[row_ids] * N_FEATURES + vectors.columns, weights=vectors.values, minlength=k * N_FEATURES
+        ).reshape(k, N_FEATURES).astype(np.float32)
+        # Empty clusters keep their previous centroid
+        occupied = np.bincount(labels, minlength=k) > 0
+        centroids = np.where(occupied[:, None], _normalize_rows(sums), centroids)
+    return labels, centroids
+
+
+def cluster_count(posts):
+    return int(max(1, min(MAX_CLUSTERS, posts, round(np.sqrt(posts / 2)))))
+
+
+def tag_posts(texts, seed=0):
+    """
+    Assign up to MAX_POST_TOPICS vocabulary topics to each text.
+
+    Returns:
+        List of topic lists, one per text; empty texts get no topics
+    """
+    if not texts:
+        return []
+    topics = list(TOPIC_VOCABULARY)
+    vectors, idf = tfidf(hashed_counts(texts))
+    seeds = hashed_counts(list(TOPIC_VOCABULARY.values()))
+    seeds = seeds.with_values(idf[seeds.columns])
+    # There are only a handful of topics, so their vectors stay dense
+    topic_vectors = _normalize_rows(np.stack([seeds.dense_row(row) for row in range(len(seeds))]))
+
+    has_text = vectors.nonempty()
+    if not has_text.any():
+        return [[] for _ in texts]
+    vectors = vectors.take(has_text)
+    labels, centroids = spherical_kmeans(vectors, cluster_count(int(has_text.sum())), seed)
+
+    cluster_similarity = centroids @ topic_vectors.T
+    cluster_topics = []
+    for similarities in cluster_similarity:
+        floor = max(MIN_CLUSTER_SIMILARITY, RELATIVE_CLUSTER_SIMILARITY * similarities.max())
+        ranked = np.argsort(-similarities)[:CLUSTER_TOPICS]
+        cluster_topics.append([topics[index] for index in ranked if similarities[index] >= floor])
+
+    post_similarity = vectors.dot(topic_vectors)
+    tagged = iter(range(int(has_text.sum())))
+    result = []
+    for present in has_text:
+        if not present:
+            result.append([])
+            continue
+        row = next(tagged)
+        assigned = list(cluster_topics[labels[row]])
+        for index in np.argsort(-post_similarity[row]):
+            if len(assigned) >= MAX_POST_TOPICS or post_similarity[row, index] < MIN_POST_SIMILARITY:
+                break
+            if topics[index] not in assigned:
+                assigned.append(topics[index])
+        if not assigned and post_similarity[row].max() > 0:
+            assigned.append(topics[int(np.argmax(post_similarity[row]))])
+        result.append(assigned)
+    return result
@@ -0,0 +1,99 @@
+"""
+Train the local topic classifier from cached Gemini topic labels
+
+Reads every post the label cache kept text for, holds out a stable share of
+them, trains topic_classifier.TopicClassifier on the rest and reports
+precision and recall on the held-out posts. The numbers are given over all
+posts and over the posts the model is confident about, which are the only
+posts the API labels locally. The report is saved inside the model file, and
+/health shows it once the API loads the model.
+
+Usage:
+    python train_topic_classifier.py
+    python train_topic_classifier.py --confidence 0.9 --label-version "v1+gemini-2.5-flash"
+    python train_topic_classifier.py --cache /data/.analysis_cache.sqlite3 --output /data/topics.npz --report report.json
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+
+from result_cache import PostLabelCache, DEFAULT_CACHE_PATH
+from topic_classifier import TopicClassifier, holdout_split, DEFAULT_MODEL_PATH, DEFAULT_CONFIDENCE, DEFAULT_HOLDOUT, MIN_TOPIC_POSTS
+
+
+def format_rate(value):
+    return f"{value:.1%}" if value is not None else '-'
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Train the local topic classifier from cached Gemini labels.")
+    parser.add_argument('--cache', default=os.getenv('ANALYSIS_CACHE_PATH', DEFAULT_CACHE_PATH), help="Analysis cache SQLite file")
+    parser.add_argument('--output', default=os.getenv('TOPIC_CLASSIFIER_PATH', DEFAULT_MODEL_PATH), help="Where to write the model")
+    parser.add_argument('--label-version', help="Only train on labels from this version (TOPIC_LABEL_VERSION+model)")
+    parser.add_argument('--holdout', type=float, default=DEFAULT_HOLDOUT, help="Share of posts held out for evaluation")
+    parser.add_argument('--confidence', type=float, default=DEFAULT_CONFIDENCE, help="Probability needed to label a post locally")
+    parser.add_argument('--min-topic-posts', type=int, default=MIN_TOPIC_POSTS, help="Drop topics with fewer labelled posts")
+    parser.add_argument('--report', help="Also write the evaluation report to this JSON file")
+    args = parser.parse_args()
+
+    rows = PostLabelCache(path=args.cache).labelled_posts(args.label_version)
+    if not rows:
+        print(f"❌ No labelled posts with stored text in {args.cache}")
+        sys.exit(1)
+
+    texts = [content for content, _ in rows]
+    labels = [topics for _, topics in rows]
+    held_out = holdout_split(texts, args.holdout)
+    train = [index for index, held in enumerate(held_out) if not held]
+    test = [index for index, held in enumerate(held_out) if held]
+
+    print(f"\n🧠 Training on {len(train)} posts, holding out {len(test)}...")
+    started = time.perf_counter()
+    try:
+        classifier = TopicClassifier.fit(
+            [texts[index] for index in train],
+            [labels[index] for index in train],
+            confidence=args.confidence,
+            min_topic_posts=args.min_topic_posts
+        )
+    except ValueError as e:
+        print(f"❌ {e}")
+        sys.exit(1)
+    print(f"   Trained {len(classifier.topics)} topics in {time.perf_counter() - started:.1f}s")
+
+    if test:
+        started = time.perf_counter()
+        report = classifier.evaluate([texts[index] for index in test], [labels[index] for index in test])
+        per_post_us = (time.perf_counter() - started) / len(test) * 1e6
+        classifier.report['holdout'] = report
+
+        print("\n" + "=" * 60)
+        print(f"{'held-out posts':<28} {'precision':>10} {'recall':>10}")
+        print("=" * 60)
+        print(f"{'all':<28} {format_rate(report['all']['precision']):>10} {format_rate(report['all']['recall']):>10}")
+        print(f"{'confident (' + format_rate(report['coverage']) + ' of posts)':<28} "
+              f"{format_rate(report['confident']['precision']):>10} {format_rate(report['confident']['recall']):>10}")
+        print("-" * 60)
+        for topic, stats in report['by_topic'].items():
+            print(f"{topic + ' (' + str(stats['support']) + ')':<28} "
+                  f"{format_rate(stats['precision']):>10} {format_rate(stats['recall']):>10}")
+        print("=" * 60)
+        print(f"   Inference: {per_post_us:.0f} µs per post\n")
+    else:
+        print("⚠️  No posts held out; the model is saved without an evaluation")
+
+    classifier.report['label_version'] = args.label_version
+    classifier.save(args.output)
+    print(f"💾 Model written to {args.output}")
+
+    if args.report:
+        with open(args.report, 'w', encoding='utf-8') as f:
+            json.dump(classifier.report, f, indent=2)
+        print(f"💾 Report written to {args.report}")
+
+
+if __name__ == '__main__':
+    main()